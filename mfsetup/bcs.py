@@ -5,11 +5,9 @@ import numpy as np
 import pandas as pd
 import flopy
 fm = flopy.modflow
-from shapely.geometry import Polygon
 import rasterio
-from rasterstats import zonal_stats
 from mfsetup.discretization import get_layer, cellids_to_kij
-from mfsetup.grid import rasterize
+from mfsetup.grid import rasterize, get_raster_statistics_for_cells
 from mfsetup.units import convert_length_units
 
 
@@ -23,7 +21,8 @@ def setup_ghb_data(model):
         shapefile_data = source_data['shapefile']
         key = [k for k in shapefile_data.keys() if 'filename' in k.lower()][0]
         shapefile_name = shapefile_data.pop(key)
-        ghbcells = rasterize(shapefile_name, m.modelgrid, **shapefile_data)
+        ghbcells = rasterize(shapefile_name, m.modelgrid, **shapefile_data,
+                             cache_dir=m.rasterize_cache)
     else:
         raise NotImplementedError('Only shapefile input supported for GHBs')
 
@@ -34,8 +33,6 @@ def setup_ghb_data(model):
 
     # sample DEM for minimum elevation in each cell with a GHB
     # todo: GHB: allow time-varying bheads via csv input
-    vertices = np.array(m.modelgrid.vertices)[ghbcells.flat > 0, :, :]
-    polygons = [Polygon(vrts) for vrts in vertices]
     if 'dem' in source_data:
         key = [k for k in source_data['dem'].keys() if 'filename' in k.lower()][0]
         dem_filename = source_data['dem'].pop(key)
@@ -44,10 +41,9 @@ def setup_ghb_data(model):
         all_touched = False
         if meta['transform'][0] > m.modelgrid.delr[0]:
             all_touched = True
-        results = zonal_stats(polygons, dem_filename, stats='min',
-                              all_touched=all_touched)
-        min_elevs = np.ones((m.nrow * m.ncol), dtype=float) * np.nan
-        min_elevs[ghbcells.flat > 0] = np.array([r['min'] for r in results])
+        min_elevs = get_raster_statistics_for_cells(m.modelgrid, dem_filename, stat='min',
+                                                    mask=ghbcells > 0,
+                                                    all_touched=all_touched).ravel()
         units_key = [k for k in source_data['dem'] if 'units' in k]
         if len(units_key) > 0:
             min_elevs *= convert_length_units(source_data['dem'][units_key[0]],
@@ -113,9 +109,50 @@ def get_bc_package_cells(package, exclude_horizontal=True):
             except:
                 k, i, j = np.where(package.parent.lakarr > 0)
     else:
-        df = mftransientlist_to_dataframe(package.stress_period_data,
-                                          squeeze=True)
-        k, i, j = df['k'].values, df['i'].values, df['j'].values
+        k, i, j = get_stress_period_data_cells(package.stress_period_data)
+    return k, i, j
+
+
+def get_stress_period_data_cells(stress_period_data):
+    """Get the unique cell locations in the stress period data
+    of a list-based boundary condition package, directly from the
+    recarrays for each stress period (without making a DataFrame
+    of the data; see :func:`mftransientlist_to_dataframe`).
+
+    Parameters
+    ----------
+    stress_period_data : flopy.mf6.data.mfdatalist.MFTransientList
+        or flopy.utils.MfList instance
+
+    Returns
+    -------
+    k, i, j : 1D numpy arrays of unique cell locations,
+        sorted by layer, row and column
+    """
+    if isinstance(stress_period_data, flopy.mf6.data.mfdatalist.MFTransientList):
+        records = stress_period_data.array
+    else:
+        records = stress_period_data.data.values()
+    k, i, j = [], [], []
+    for recs in records:
+        # skip stress periods that are empty or set to 0
+        # (e.g. no pumping during a predevelopment period)
+        if not hasattr(recs, 'dtype') or len(recs) == 0:
+            continue
+        if 'cellid' in recs.dtype.names:
+            kper, iper, jper = cellids_to_kij(recs['cellid'])
+        else:
+            kper, iper, jper = recs['k'], recs['i'], recs['j']
+        k.append(kper)
+        i.append(iper)
+        j.append(jper)
+    if len(k) == 0:
+        return tuple(np.array([], dtype=int) for _ in range(3))
+    k, i, j = [np.concatenate(a).astype(int) for a in (k, i, j)]
+    # drop duplicate locations using linear (node) numbers
+    shape = (k.max() + 1, i.max() + 1, j.max() + 1)
+    nodes = np.unique(np.ravel_multi_index((k, i, j), shape))
+    k, i, j = np.unravel_index(nodes, shape)
     return k, i, j
 
 
@@ -6,6 +6,7 @@ import numpy as np
 from scipy import ndimage
 from scipy.signal import convolve2d
 from flopy.mf6.data.mfdatalist import MFList
+from .profiling import timed
 
 
 def adjust_layers(dis, minimum_thickness=1):
@@ -41,13 +42,16 @@ def adjust_layers(dis, minimum_thickness=1):
     return new_layer_elevs[1:]
 
 
-def deactivate_idomain_above(idomain, packagedata):
+def deactivate_idomain_above(idomain, packagedata, inplace=False):
     """Sets ibound to 0 for all cells above active SFR cells.
 
     Parameters
     ----------
     packagedata : MFList, recarray or DataFrame
         SFR package reach data
+    inplace : bool
+        If True, modify idomain in place, otherwise
+        modify and return a copy (default).
 
     Notes
     -----
@@ -57,17 +61,18 @@ def deactivate_idomain_above(idomain, packagedata):
     """
     if isinstance(packagedata, MFList):
         packagedata = packagedata.array
-    idomain = idomain.copy()
+    if not inplace:
+        idomain = idomain.copy()
     if isinstance(packagedata, np.recarray):
         packagedata.columns = packagedata.dtype.names
     if 'cellid' in packagedata.columns:
         k, i, j = cellids_to_kij(packagedata['cellid'])
     else:
         k, i, j = packagedata['k'], packagedata['i'], packagedata['j']
-    deact_lays = [list(range(ki)) for ki in k]
-    for ks, ci, cj in zip(deact_lays, i, j):
-        for ck in ks:
-            idomain[ck, ci, cj] = 0
+    k, i, j = [np.array(a, dtype=int) for a in (k, i, j)]
+    # (layer x reach) array of cells above each reach
+    layer, reach = np.nonzero(np.arange(idomain.shape[0])[:, np.newaxis] < k)
+    idomain[layer, i[reach], j[reach]] = 0
     return idomain
 
 
@@ -75,38 +80,28 @@ def find_remove_isolated_cells(array, minimum_cluster_size=10):
     """Identify clusters of isolated cells in a binary array.
     Remove clusters less than a specified minimum cluster size.
     """
-    if len(array.shape) == 2:
-        arraylist = [array]
-    else:
-        arraylist = array
-
     # exclude diagonal connections
     structure = np.zeros((3, 3))
     structure[1, :] = 1
     structure[:, 1] = 1
-
-    retained_arraylist = []
-    for arr in arraylist:
-
-        # for each cell in the binary array arr (i.e. representing active cells)
-        # take the sum of the cell and 4 immediate neighbors (excluding diagonal connections)
-        # values > 2 in the output array indicate cells with at least two connections
-        convolved = convolve2d(arr, structure, mode='same')
-        # taking union with (arr == 1) prevents inactive cells from being activated
-        atleast_2_connections = (arr == 1) & (convolved > 2)
-
-        # then apply connected component analysis
-        # to identify small clusters of isolated cells to exclude
-        labeled, ncomponents = ndimage.measurements.label(atleast_2_connections,
-                                                          structure=structure)
-        retain_areas = [c for c in range(1, ncomponents+1)
-                        if (labeled == c).sum() >= minimum_cluster_size]
-        retain = np.in1d(labeled.ravel(), retain_areas)
-        retained = np.reshape(retain, arr.shape).astype(array.dtype)
-        retained_arraylist.append(retained)
+    # process all layers at once, without connections between layers
     if len(array.shape) == 3:
-        return np.array(retained_arraylist, dtype=array.dtype)
-    return retained_arraylist[0]
+        structure = np.stack([np.zeros((3, 3)), structure, np.zeros((3, 3))])
+
+    # for each cell in the binary array (i.e. representing active cells)
+    # take the sum of the cell and 4 immediate neighbors (excluding diagonal connections)
+    # values > 2 in the output array indicate cells with at least two connections
+    convolved = ndimage.convolve(array.astype(float), structure, mode='constant', cval=0.)
+    # taking union with (array == 1) prevents inactive cells from being activated
+    atleast_2_connections = (array == 1) & (convolved > 2)
+
+    # then apply connected component analysis
+    # to identify small clusters of isolated cells to exclude
+    labeled, ncomponents = ndimage.label(atleast_2_connections, structure=structure)
+    component_sizes = np.bincount(labeled.ravel())
+    retain = component_sizes >= minimum_cluster_size
+    retain[0] = False  # background
+    return retain[labeled].astype(array.dtype)
 
 
 def cellids_to_kij(cellids, drop_inactive=True):
@@ -135,13 +130,16 @@ def cellids_to_kij(cellids, drop_inactive=True):
     return k, i, j
 
 
-def create_vertical_pass_through_cells(idomain):
+def create_vertical_pass_through_cells(idomain, inplace=False):
     """Replaces inactive cells with vertical pass-through cells at locations that have an active cell
     above and below by setting these cells to -1.
 
     Parameters
     ----------
     idomain : np.ndarray with 2 or 3 dimensions. 2D arrays are returned as-is.
+    inplace : bool
+        If True, modify idomain in place, otherwise
+        modify and return a copy (default).
 
     Returns
     -------
@@ -151,19 +149,18 @@ def create_vertical_pass_through_cells(idomain):
     """
     if len(idomain.shape) == 2:
         return idomain
-    revised = idomain.copy()
-    for i in range(1, idomain.shape[0]-1):
-        has_active_above = np.any(idomain[:i] > 0, axis=0)
-        has_active_below = np.any(idomain[i+1:] > 0, axis=0)
-        bounded = has_active_above & has_active_below
-        pass_through = (idomain[i] <= 0) & bounded
-        assert not np.any(revised[i][pass_through] > 0)
-        revised[i][pass_through] = -1
-
-        # scrub any pass through cells that aren't bounded by active cells
-        revised[i][(idomain[i] <= 0) & ~bounded] = 0
-    for i in (0, -1):
-        revised[i][revised[i] < 0] = 0
+    active = idomain > 0
+    # cumulative any along the layer axis, from the top and from the bottom
+    has_active_above = np.zeros_like(active)
+    has_active_above[1:] = np.logical_or.accumulate(active, axis=0)[:-1]
+    has_active_below = np.zeros_like(active)
+    has_active_below[:-1] = np.logical_or.accumulate(active[::-1], axis=0)[::-1][1:]
+    bounded = has_active_above & has_active_below
+    revised = idomain if inplace else idomain.copy()
+    # (any pass through cells that aren't bounded by active cells
+    # are scrubbed, including those in the top and bottom layers)
+    revised[~active] = 0
+    revised[~active & bounded] = -1
     return revised
 
 
@@ -443,6 +440,56 @@ def make_idomain(top, botm, nodata=-9999,
     return idomain
 
 
+def build_idomain(top, botm, idomain=None, inactive=None,
+                  sfr_packagedata=None, nodata=-9999,
+                  minimum_layer_thickness=1, drop_thin_cells=True,
+                  tol=1e-4, minimum_cluster_size=20):
+    """Make the idomain array for MODFLOW 6 in one pass, from the layer
+    elevations, an existing idomain array, cells to exclude
+    (for example, lakes or LGR inset areas) and SFR reaches.
+    Equivalent to calling :func:`make_idomain`, then
+    :func:`deactivate_idomain_above`, :func:`find_remove_isolated_cells`
+    and :func:`create_vertical_pass_through_cells`, but
+    with the intermediate arrays modified in place.
+
+    Parameters
+    ----------
+    top : nrow x ncol array of model top elevations
+    botm : nlay x nrow x ncol array of model botm elevations
+    idomain : nlay x nrow x ncol array
+        Existing idomain array; only cells with idomain == 1 are retained.
+        (optional)
+    inactive : nlay x nrow x ncol boolean array
+        Cells to exclude from the model solution. (optional)
+    sfr_packagedata : MFList, recarray or DataFrame
+        SFR package reach data; cells above SFR reaches are excluded.
+        (optional)
+    nodata, minimum_layer_thickness, drop_thin_cells, tol :
+        See :func:`make_idomain`.
+    minimum_cluster_size : int
+        See :func:`find_remove_isolated_cells`.
+
+    Returns
+    -------
+    idomain : np.ndarray (int)
+
+    """
+    active = make_idomain(top, botm, nodata=nodata,
+                          minimum_layer_thickness=minimum_layer_thickness,
+                          drop_thin_cells=drop_thin_cells, tol=tol).astype(bool)
+    if idomain is not None:
+        active &= (idomain == 1)
+    if inactive is not None:
+        active &= ~inactive
+    result = active.astype(int)
+    if sfr_packagedata is not None:
+        deactivate_idomain_above(result, sfr_packagedata, inplace=True)
+    result = find_remove_isolated_cells(result, minimum_cluster_size=minimum_cluster_size)
+    create_vertical_pass_through_cells(result, inplace=True)
+    return result
+
+
+@timed(category='array')
 def get_layer_thicknesses(top, botm, idomain=None):
     """For each i, j location in the grid, get thicknesses
     between pairs of subsequent valid elevation values. Make
@@ -488,21 +535,18 @@ def get_layer_thicknesses(top, botm, idomain=None):
         idomain = idomain == 1
         top[~idomain[0]] = np.nan
         botm[~idomain] = np.nan
-    all_layers = np.stack([top] + [b for b in botm])
-    thicknesses = np.zeros_like(botm) * np.nan
-    nrow, ncol = top.shape
-    for i in range(nrow):
-        for j in range(ncol):
-            cells = all_layers[:, i, j]
-            valid_b = list(-np.diff(cells[~np.isnan(cells)]))
-            b_ij = np.zeros_like(cells[1:]) * np.nan
-            has_top = False
-            for k, elev in enumerate(cells):
-                if not has_top and not np.isnan(elev):
-                    has_top = True
-                elif has_top and not np.isnan(elev):
-                    b_ij[k-1] = valid_b.pop(0)
-            thicknesses[:, i, j] = b_ij
+    all_layers = np.stack([top] + [b for b in botm]).astype(float)
+    valid = ~np.isnan(all_layers)
+    # index of the last valid elevation at or above each position
+    # (forward-fill along the layer axis); -1 where there is none yet
+    k = np.arange(all_layers.shape[0]).reshape(-1, 1, 1)
+    last_valid = np.maximum.accumulate(np.where(valid, k, -1), axis=0)
+    above = last_valid[:-1]
+    elev_above = np.take_along_axis(all_layers, np.maximum(above, 0), axis=0)
+    # assign a thickness to each valid cell bottom with a valid elevation above it
+    has_top = valid[1:] & (above >= 0)
+    thicknesses = np.full(botm.shape, np.nan)
+    thicknesses[has_top] = elev_above[has_top] - all_layers[1:][has_top]
     thicknesses[thicknesses == 0] = 0  # get rid of -0.
     print("finished in {:.2f}s\n".format(time.time() - t0))
     return thicknesses
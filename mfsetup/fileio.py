@@ -1,7 +1,11 @@
 import inspect
 import sys
 import os
+import hashlib
 import json
+import pickle
+import shutil
+import threading
 import yaml
 import time
 from collections import defaultdict
@@ -14,6 +18,7 @@ from flopy.mf6.mfbase import PackageContainer, MFFileMgmt, ExtFileAction, \
 from flopy.mf6.data import mfstructure
 from flopy.mf6.modflow import mfnam, mfims, mftdis, mfgwfgnc, mfgwfmvr
 from .grid import MFsetupGrid
+from .profiling import timed
 from .utils import get_input_arguments, update
 
 
@@ -70,6 +75,282 @@ def dump_json(jsonfile, data):
     print('wrote {}'.format(jsonfile))
 
 
+def atomic_write(filename, writer, mode='wb'):
+    """Write a file by calling writer with an open temporary file
+    (in the same folder), and then moving the temporary file to filename,
+    so that an interrupted write doesn't leave an incomplete file, and
+    concurrent writes of the same file (e.g. of cached results) don't
+    interfere with each other.
+
+    Parameters
+    ----------
+    filename : str
+        Output file.
+    writer : callable
+        Function that writes the file contents to an open file object
+        (e.g. ``lambda dest: np.save(dest, array)``).
+    mode : str
+        Mode for opening the temporary file ('wb' or 'w').
+    """
+    folder = os.path.dirname(os.path.abspath(filename))
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+    tmpfile = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+    try:
+        with open(tmpfile, mode) as dest:
+            writer(dest)
+        os.replace(tmpfile, filename)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+
+def load_cache_file(filename, loader):
+    """Load a file of cached results with loader (a function
+    that takes the file path). Returns None if the file doesn't exist,
+    or can't be read (e.g. if it is incomplete or corrupted), so that
+    the results can be recomputed instead."""
+    if not os.path.exists(filename):
+        return
+    try:
+        return loader(filename)
+    except (OSError, EOFError, KeyError, ValueError, pickle.UnpicklingError):
+        return
+
+
+def prune_cache_files(files, max_files):
+    """Remove all but the max_files most recently modified files
+    in a list of cached results.
+
+    Returns
+    -------
+    removed : list
+        Files that were removed.
+    """
+    if len(files) <= max_files:
+        return []
+    mtimes = []
+    for f in files:
+        try:
+            mtimes.append(os.path.getmtime(f))
+        except OSError:  # already removed (e.g. by another process)
+            mtimes.append(-1)
+    removed = []
+    for i in np.argsort(mtimes)[:len(files) - max_files]:
+        try:
+            os.remove(files[i])
+            removed.append(files[i])
+        except OSError:
+            pass
+    return removed
+
+
+def get_config_fingerprint(cfg):
+    """Get a hash identifying a (nested) configuration dictionary,
+    and the source files that it refers to, for detecting changes
+    to model input between builds.
+
+    Strings that are paths to existing files are identified by
+    their (absolute) paths, modification times and sizes
+    (shapefiles also by their attribute table and projection files).
+    Numpy arrays are identified by their contents;
+    other objects (e.g. model instances) are skipped.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration dictionary or subtree.
+
+    Returns
+    -------
+    fingerprint : str
+        Hexadecimal digest.
+    """
+    h = hashlib.sha1()
+
+    def update_hash(item):
+        if isinstance(item, dict):
+            for k in sorted(item.keys(), key=str):
+                h.update('{!r}:'.format(k).encode())
+                update_hash(item[k])
+        elif isinstance(item, (list, tuple)):
+            h.update(b'[')
+            for v in item:
+                update_hash(v)
+            h.update(b']')
+        elif isinstance(item, np.ndarray):
+            h.update(str(item.dtype).encode())
+            h.update(np.ascontiguousarray(item).tobytes())
+        elif isinstance(item, str):
+            h.update('{!r}'.format(item).encode())
+            if os.path.isfile(item):
+                files = [item]
+                if item.lower().endswith('.shp'):
+                    files += [os.path.splitext(item)[0] + ext for ext in ('.dbf', '.prj')]
+                for f in files:
+                    if os.path.isfile(f):
+                        stat = os.stat(f)
+                        h.update('{}{}{}'.format(os.path.abspath(f), stat.st_mtime,
+                                                 stat.st_size).encode())
+        elif item is None or isinstance(item, (bool, int, float, np.number)):
+            h.update('{!r}'.format(item).encode())
+        h.update(b',')
+
+    update_hash(cfg)
+    return h.hexdigest()
+
+
+def get_features_cache_folder(cache_dir, filename, features_crs, model_crs):
+    """Get the folder for caching (filtered, reprojected) features from a
+    shapefile, named by a hash of the shapefile path, the shapefile CRS and
+    the model CRS, followed by a hash of the modification times of the
+    shapefile component files (so that the folders for previous versions
+    of the shapefile can be identified).
+    """
+    shapefile = os.path.splitext(os.path.abspath(filename))[0]
+    h = hashlib.sha1('{}{}{}'.format(shapefile, str(features_crs).lower(),
+                                     str(model_crs).lower()).encode())
+    version = hashlib.sha1()
+    for ext in '.shp', '.dbf', '.prj':
+        f = shapefile + ext
+        if os.path.exists(f):
+            version.update('{}{}'.format(ext, os.path.getmtime(f)).encode())
+    return os.path.join(cache_dir, 'features_{}_{}'.format(h.hexdigest(),
+                                                           version.hexdigest()))
+
+
+def load_cached_features(cache_dir, filename, features_crs, model_crs,
+                         filter=None):
+    """Load features cached with :func:`cache_features`, if a cache
+    exists for the same shapefile and CRSs, with a filter extent that
+    contains filter.
+
+    Features are selected from the cache with the smallest extent that
+    contains filter, using the bounding boxes of the features
+    (in the shapefile CRS; same as a bounding box filter on the shapefile).
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache folder
+    filename : str
+        Shapefile path
+    features_crs : str
+        Shapefile coordinate reference system
+    model_crs : str
+        Model coordinate reference system (of the cached geometries)
+    filter : tuple, optional
+        (xmin, ymin, xmax, ymax) bounding box filter, in the shapefile CRS.
+        By default, all features are returned.
+
+    Returns
+    -------
+    df : DataFrame
+        Features in the model CRS (None if there is no suitable cache).
+    """
+    folder = get_features_cache_folder(cache_dir, filename, features_crs, model_crs)
+    if not os.path.isdir(folder):
+        return
+    # the filter extent of each cached set of features
+    # is in a .json file next to the pickle
+    index = {}
+    for f in os.listdir(folder):
+        if f.endswith('.json'):
+            entry = load_cache_file(os.path.join(folder, f), load_json)
+            if entry is not None:
+                index[f[:-5] + '.pkl'] = entry['filter']
+
+    def contains(bounds):
+        if bounds is None:
+            return True
+        if filter is None:
+            return False
+        return bounds[0] <= filter[0] and bounds[1] <= filter[1] and \
+               bounds[2] >= filter[2] and bounds[3] >= filter[3]
+
+    def area(bounds):
+        if bounds is None:
+            return np.inf
+        return (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+
+    candidates = sorted((area(bounds), cache_file) for cache_file, bounds in index.items()
+                        if contains(bounds))
+    for _, cache_file in candidates:
+        cache_file = os.path.join(folder, cache_file)
+        df = load_cache_file(cache_file, pd.read_pickle)
+        if df is None:
+            continue
+        # mark the file as recently used
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+        if filter is not None:
+            x0, y0, x1, y1 = filter
+            intersects = (df['_xmin'].values <= x1) & (df['_xmax'].values >= x0) & \
+                         (df['_ymin'].values <= y1) & (df['_ymax'].values >= y0)
+            df = df.loc[intersects]
+        df = df.drop(['_xmin', '_ymin', '_xmax', '_ymax'], axis=1).reset_index(drop=True)
+        print('loaded cached features from {}'.format(cache_file))
+        return df
+
+
+def cache_features(cache_dir, df, filename, features_crs, model_crs,
+                   features_bounds, filter=None, max_cached_files=20):
+    """Cache features from a shapefile (after filtering and reprojection)
+    for reuse by :func:`load_cached_features`.
+
+    Each set of features is written to a pickle, with the filter extent
+    in a .json file of the same name. Only the max_cached_files most
+    recently used sets of features for each shapefile are kept, and
+    features cached for previous versions of the shapefile are removed.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache folder
+    df : DataFrame
+        Features in the model CRS.
+    filename, features_crs, model_crs :
+        See :func:`load_cached_features`.
+    features_bounds : 2D array (n features, (xmin, ymin, xmax, ymax))
+        Bounding boxes of the features in the shapefile CRS
+        (used to select features for smaller filter extents).
+    filter :
+        See :func:`load_cached_features`.
+    max_cached_files : int
+        Maximum number of sets of features to keep for the shapefile.
+    """
+    folder = get_features_cache_folder(cache_dir, filename, features_crs, model_crs)
+    # remove the features cached for previous versions of the shapefile
+    prefix = os.path.basename(folder).rsplit('_', 1)[0] + '_'
+    if os.path.isdir(cache_dir):
+        for f in os.listdir(cache_dir):
+            if f.startswith(prefix) and f != os.path.basename(folder):
+                shutil.rmtree(os.path.join(cache_dir, f), ignore_errors=True)
+
+    bounds = None if filter is None else [float(b) for b in filter]
+    h = hashlib.sha1(str(bounds).encode())
+    cache_file = os.path.join(folder, '{}.pkl'.format(h.hexdigest()))
+    df = df.copy()
+    features_bounds = np.reshape(features_bounds, (len(df), 4))
+    for i, col in enumerate(['_xmin', '_ymin', '_xmax', '_ymax']):
+        df[col] = features_bounds[:, i]
+    # write the pickle first, so that the features are available
+    # when the entry appears in the index
+    atomic_write(cache_file, df.to_pickle)
+    atomic_write(cache_file[:-4] + '.json',
+                 lambda dest: json.dump({'filter': bounds}, dest), mode='w')
+
+    cache_files = [os.path.join(folder, f) for f in os.listdir(folder)
+                   if f.endswith('.pkl')]
+    for removed in prune_cache_files(cache_files, max_cached_files):
+        try:
+            os.remove(removed[:-4] + '.json')
+        except OSError:
+            pass
+
+
 def load_sr(filename):
     """Create a SpatialReference instance from model config json file."""
     cfg = load(filename)
@@ -111,8 +392,11 @@ def dump_yml(yml_file, data):
     print('wrote {}'.format(yml_file))
 
 
+@timed(category='io', memory=False)
 def load_array(filename, shape=None, nodata=-9999):
-    """Load an array, ensuring the correct shape."""
+    """Load an array, ensuring the correct shape.
+    Files ending in .npy are read as binary numpy arrays;
+    other files are read as whitespace-delimited text."""
     t0 = time.time()
     if not isinstance(filename, list):
         filename = [filename]
@@ -128,9 +412,12 @@ def load_array(filename, shape=None, nodata=-9999):
         if shape2d is not None:
             txt += ', shape={}'.format(shape2d)
         print(txt, end=', ')
-        # arr = np.loadtxt
-        # pd.read_csv is >3x faster than np.load_txt
-        arr = pd.read_csv(f, delim_whitespace=True, header=None).values
+        if f.endswith('.npy'):
+            arr = np.load(f)
+        else:
+            # arr = np.loadtxt
+            # pd.read_csv is >3x faster than np.load_txt
+            arr = pd.read_csv(f, delim_whitespace=True, header=None).values
         if shape2d is not None:
             if arr.shape != shape2d:
                 if arr.size == np.prod(shape2d):
@@ -148,12 +435,18 @@ def load_array(filename, shape=None, nodata=-9999):
 
 def save_array(filename, arr, nodata=-9999,
                **kwargs):
-    """Save and array and print that it was written."""
+    """Save and array and print that it was written.
+    Files ending in .npy are written in binary numpy format
+    (with nan values and without any text formatting);
+    other files are written as text with np.savetxt."""
     if isinstance(filename, dict) and 'filename' in filename.keys():
         filename = filename.copy().pop('filename')
     t0 = time.time()
-    arr[np.isnan(arr)] = nodata
-    np.savetxt(filename, arr, **kwargs)
+    if filename.endswith('.npy'):
+        np.save(filename, arr)
+    else:
+        arr[np.isnan(arr)] = nodata
+        np.savetxt(filename, arr, **kwargs)
     print('wrote {}'.format(filename), end=', ')
     print("took {:.2f}s".format(time.time() - t0))
 
@@ -443,12 +736,19 @@ def setup_external_filepaths(model, package, variable_name,
     model.get_package(package)
     # intermediate data
     filename_format = os.path.split(filename_format)[-1]
+    intermediate_format = filename_format
+    # MODFLOW-6 intermediate files can be binary,
+    # because the external files read by MODFLOW are written separately
+    # (MODFLOW-NWT intermediate files are input to flopy, so are always text)
+    if model.version == 'mf6' and \
+            model.cfg['intermediate_data'].get('format', 'text') == 'npy':
+        intermediate_format = os.path.splitext(filename_format)[0] + '.npy'
     if not relative_external_paths:
         intermediate_files = [os.path.normpath(os.path.join(model.tmpdir,
-                              filename_format).format(i)) for i in range(nfiles)]
+                              intermediate_format).format(i)) for i in range(nfiles)]
     else:
         intermediate_files = [os.path.join(model.tmpdir,
-                              filename_format).format(i) for i in range(nfiles)]
+                              intermediate_format).format(i) for i in range(nfiles)]
 
     if variable_name in transient2D_variables:
         model.cfg['intermediate_data'][variable_name] = {i: f for i, f in
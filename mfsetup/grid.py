@@ -2,15 +2,21 @@
 Grid stuff that flopy.discretization.StructuredGrid doesn't do and other grid-related functions
 """
 import os
+import hashlib
+import threading
 import time
 import collections
+import collections.abc
 import numpy as np
 import pandas as pd
+import rasterio
 from rasterio import Affine
-from shapely.geometry import Polygon, MultiPolygon
+from rasterio.windows import Window
+from shapely.geometry import Point, Polygon, MultiPolygon
 from flopy.discretization import StructuredGrid
 from gisutils import df2shp, get_proj_str, project, shp2df
 import mfsetup.fileio as fileio
+from .profiling import timed
 from .units import convert_length_units, get_length_units
 from .utils import get_input_arguments
 
@@ -156,10 +162,16 @@ class MFsetupGrid(StructuredGrid):
         self._vertices = self._cell_vert_list(ii, jj)
 
 
+@timed(category='grid', memory=False)
 def get_ij(grid, x, y, local=False, chunksize=100):
     """Return the row and column of a point or sequence of points
     in real-world coordinates.
 
+    Points are converted to local (unrotated) grid coordinates with a single
+    affine transform, and then located within the row and column edges
+    using binary search (np.searchsorted). Points outside of the
+    grid are assigned to the row and column of the nearest cell center.
+
     Parameters
     ----------
     grid : flopy.discretization.StructuredGrid instance
@@ -169,47 +181,76 @@ def get_ij(grid, x, y, local=False, chunksize=100):
         Flag for returning real-world or model (local) coordinates.
         (default False)
     chunksize : int
-        Because this function compares each x, y location to a vector
+        Because finding the nearest cell center for points outside
+        of the grid compares each x, y location to a vector
         of model grid cell locations, memory usage can quickly get
         out of hand, as it increases as the square of the number of locations.
         This can be avoided by breaking the x, y location vectors into
-        chunks. Experimentation with approx. 5M points suggests
-        that a chunksize of 100 provides close to optimal
-        performance in terms of execution time. (default 100)
+        chunks. (default 100)
 
     Returns
     -------
     i : row or sequence of rows (zero-based)
     j : column or sequence of columns (zero-based)
     """
-
-    if not local:
-        xc, yc = grid.xcellcenters, grid.ycellcenters
-    else:
-        xc, yc = grid.xyzcellcenters()
-    if np.isscalar(x):
-        j = (np.abs(xc[0] - x)).argmin()
-        i = (np.abs(yc[:, 0] - y)).argmin()
-    else:
+    scalar = np.isscalar(x)
+    if not scalar:
         print('getting i, j locations...')
-        x = np.array(x)
-        y = np.array(y)
         t0 = time.time()
-        chunks = list(range(0, len(x), chunksize)) + [None]
-        i = []
-        j = []
+    x = np.atleast_1d(np.array(x, dtype=float))
+    y = np.atleast_1d(np.array(y, dtype=float))
+    if not local:
+        x, y = get_local_coordinates(grid, x, y)
+
+    # locate the points within the cell edges
+    # x edges are increasing; y edges are decreasing from the top of the grid
+    xedges, yedges = grid.xyedges
+    nrow, ncol = len(yedges) - 1, len(xedges) - 1
+    j = np.searchsorted(xedges, x, side='right') - 1
+    i = nrow - np.searchsorted(yedges[::-1], y, side='right')
+    outside = (i < 0) | (i >= nrow) | (j < 0) | (j >= ncol)
+
+    # assign points outside the grid to the nearest cell center
+    if np.any(outside):
+        xc, yc = grid.xycenters
+        xo, yo = x[outside], y[outside]
+        chunks = list(range(0, len(xo), chunksize)) + [None]
+        io = []
+        jo = []
         for c in range(len(chunks))[:-1]:
             chunk_slice = slice(chunks[c], chunks[c+1])
-            xcp = np.array([xc[0]] * (len(x[chunk_slice])))
-            ycp = np.array([yc[:, 0]] * (len(x[chunk_slice])))
-            j += (np.abs(xcp.transpose() - x[chunk_slice])).argmin(axis=0).tolist()
-            i += (np.abs(ycp.transpose() - y[chunk_slice])).argmin(axis=0).tolist()
-        i = np.array(i)
-        j = np.array(j)
-        print("finished in {:.2f}s\n".format(time.time() - t0))
+            jo += (np.abs(xc[:, np.newaxis] - xo[chunk_slice])).argmin(axis=0).tolist()
+            io += (np.abs(yc[:, np.newaxis] - yo[chunk_slice])).argmin(axis=0).tolist()
+        i[outside] = io
+        j[outside] = jo
+    if scalar:
+        return i[0], j[0]
+    print("finished in {:.2f}s\n".format(time.time() - t0))
     return i, j
 
 
+def get_local_coordinates(grid, x, y):
+    """Convert real-world coordinates to local (unrotated)
+    model coordinates, relative to the lower left corner of the grid.
+
+    Parameters
+    ----------
+    grid : flopy.discretization.StructuredGrid instance
+    x : sequence of x coordinates
+    y : sequence of y coordinates
+
+    Returns
+    -------
+    x, y : local x and y coordinates
+    """
+    transform = Affine.translation(grid.xoffset, grid.yoffset) * \
+                Affine.rotation(grid.angrot)
+    a, b, c, d, e, f = (~transform)[:6]
+    x = np.array(x, dtype=float)
+    y = np.array(y, dtype=float)
+    return a * x + b * y + c, d * x + e * y + f
+
+
 def get_grid_bounding_box(modelgrid):
     """Get bounding box of potentially rotated modelgrid
     as a shapely Polygon object.
@@ -252,6 +293,47 @@ def get_grid_bounding_box(modelgrid):
                     (x0r, y0r)])
 
 
+def get_points_within(x, y, polygon):
+    """Find the points within a polygon, without creating
+    a shapely Point for each point.
+
+    Points are first culled with a bounding box test; if the polygon
+    is a rectangle aligned with the coordinate axes (e.g. the bounding box
+    of an unrotated model grid), that is the result. Otherwise, the remaining
+    points are tested with shapely.contains_xy (shapely >= 2.0),
+    or a prepared geometry.
+
+    Parameters
+    ----------
+    x, y : 1D arrays of point coordinates
+    polygon : shapely Polygon or MultiPolygon
+
+    Returns
+    -------
+    within : 1D boolean array
+        True for points within the polygon (same as Point.within(polygon),
+        which excludes points on the polygon boundary).
+    """
+    x = np.atleast_1d(np.asarray(x, dtype=float))
+    y = np.atleast_1d(np.asarray(y, dtype=float))
+    x0, y0, x1, y1 = polygon.bounds
+    within = (x > x0) & (x < x1) & (y > y0) & (y < y1)
+    is_rectangle = isinstance(polygon, Polygon) and len(polygon.interiors) == 0 and \
+                   np.isclose(polygon.area, (x1 - x0) * (y1 - y0), rtol=1e-9)
+    if is_rectangle or not np.any(within):
+        return within
+    candidates = np.flatnonzero(within)
+    try:
+        from shapely import contains_xy
+        within[candidates] = contains_xy(polygon, x[candidates], y[candidates])
+    except ImportError:
+        from shapely.prepared import prep
+        prepared = prep(polygon)
+        within[candidates] = [prepared.contains(Point(xx, yy))
+                              for xx, yy in zip(x[candidates], y[candidates])]
+    return within
+
+
 def get_point_on_national_hydrogeologic_grid(x, y):
     """Given an x, y location representing the upper left
     corner of a model grid, return the upper left corner
@@ -280,14 +362,28 @@ def write_bbox_shapefile(modelgrid, outshp):
            outshp, epsg=modelgrid.epsg)
 
 
+# in-memory cache of rasterized features
+# (most recently used last)
+_rasterized = collections.OrderedDict()
+_max_cached_rasters = 20
+_rasterize_lock = threading.RLock()
+
+
 def rasterize(feature, grid, id_column=None,
               include_ids=None,
               epsg=None,
-              proj4=None, dtype=np.float32):
+              proj4=None, dtype=np.float32,
+              buffer=None, cache=True, cache_dir=None):
     """Rasterize a feature onto the model grid, using
     the rasterio.features.rasterize method. Features are intersected
     if they contain the cell center.
 
+    Results are cached in memory (and optionally on disk), based on
+    the feature input (file names and modification times, or the
+    geometries and attributes), the other arguments and the grid,
+    so that rasterizing the same features again doesn't require
+    reading, reprojecting or rasterizing them.
+
     Parameters
     ----------
     feature : str (shapefile path), list of shapely objects,
@@ -304,6 +400,15 @@ def rasterize(feature, grid, id_column=None,
         Proj4 string for feature CRS (optional)
     dtype : dtype
         Datatype for the output array
+    buffer : float, optional
+        Distance (in model units) to buffer the features by
+        prior to rasterizing them (negative values shrink the features).
+    cache : bool
+        Option to cache the result, or reuse a cached result.
+        By default, True.
+    cache_dir : str, optional
+        Folder for caching results on disk, for reuse between
+        setup runs. By default, results are only cached in memory.
 
     Returns
     -------
@@ -317,6 +422,15 @@ def rasterize(feature, grid, id_column=None,
         print('This method requires rasterio.')
         return
 
+    key = None
+    if cache:
+        key = get_rasterize_cache_key(feature, grid, id_column=id_column,
+                                      include_ids=include_ids, epsg=epsg,
+                                      proj4=proj4, buffer=buffer)
+        result = _load_cached_raster(key, grid, cache_dir)
+        if result is not None:
+            return result.astype(dtype)
+
     #trans = Affine(sr.delr[0], 0., sr.xul,
     #               0., -sr.delc[0], sr.yul) * Affine.rotation(sr.rotation)
     trans = grid.transform
@@ -356,6 +470,9 @@ def rasterize(feature, grid, id_column=None,
     if id_column is not None and include_ids is not None:
         df = df.loc[df[id_column].isin(include_ids)].copy()
 
+    if buffer is not None:
+        df['geometry'] = [g.buffer(buffer) for g in df.geometry]
+
     # create list of GeoJSON features, with unique value for each feature
     if id_column is None:
         numbers = range(1, len(df)+1)
@@ -373,9 +490,543 @@ def rasterize(feature, grid, id_column=None,
                                 out_shape=(grid.nrow, grid.ncol),
                                 transform=trans)
     assert result.sum(axis=(0, 1)) != 0, "Nothing was intersected!"
+    if key is not None:
+        _save_cached_raster(key, result, cache_dir)
     return result.astype(dtype)
 
 
+def get_rasterize_cache_key(feature, grid, **kwargs):
+    """Get a hash identifying the result of :func:`rasterize`,
+    based on the feature input, keyword arguments to rasterize
+    and the grid (transform, shape and CRS).
+
+    Shapefiles are identified by their (absolute) file paths and
+    modification times; DataFrames and shapely objects by their
+    geometries (and attributes). Returns None if a key can't be
+    made (e.g. for a shapefile that doesn't exist, an empty sequence,
+    or an iterator, which can't be read without consuming it).
+    """
+    h = hashlib.sha1()
+    if isinstance(feature, str):
+        feature = [feature]
+    is_sequence = isinstance(feature, (collections.abc.Sequence, np.ndarray, pd.Series))
+    if is_sequence and len(feature) == 0:
+        return
+    try:
+        if isinstance(feature, pd.DataFrame):
+            for g in feature.geometry:
+                h.update(b'' if g is None else g.wkb)
+            h.update(pd.util.hash_pandas_object(feature.drop('geometry', axis=1),
+                                                index=True).values.tobytes())
+            h.update(str(list(feature.columns)).encode())
+        elif is_sequence and isinstance(next(iter(feature)), str):
+            for f in feature:
+                if not os.path.exists(f):
+                    return
+                # include the attribute table and projection file
+                for ext in '.shp', '.dbf', '.prj':
+                    f = os.path.splitext(os.path.abspath(f))[0] + ext
+                    if os.path.exists(f):
+                        h.update('{}{}'.format(f, os.path.getmtime(f)).encode())
+        elif is_sequence:
+            for g in feature:
+                h.update(g.wkb)
+        elif isinstance(feature, collections.abc.Iterable):
+            return
+        else:
+            h.update(feature.wkb)
+    except (AttributeError, OSError, TypeError):
+        return
+    for k, v in sorted(kwargs.items()):
+        if v is not None and not isinstance(v, str) and \
+                isinstance(v, collections.abc.Iterable):
+            v = list(v)
+        h.update('{}={!r}'.format(k, v).encode())
+    h.update('{}{}{}{}'.format(grid.nrow, grid.ncol, tuple(grid.transform)[:6],
+                               grid.proj_str).encode())
+    return h.hexdigest()
+
+
+def _get_raster_cache_file(key, cache_dir):
+    return os.path.join(cache_dir, 'rasterized_{}.npy'.format(key))
+
+
+def _load_cached_raster(key, grid, cache_dir=None):
+    if key is None:
+        return
+    with _rasterize_lock:
+        if key in _rasterized:
+            _rasterized.move_to_end(key)
+            return _rasterized[key]
+    if cache_dir is None:
+        return
+    cache_file = _get_raster_cache_file(key, cache_dir)
+    result = fileio.load_cache_file(cache_file, np.load)
+    if result is None or result.shape != (grid.nrow, grid.ncol):
+        return
+    print('loaded rasterized features from {}'.format(cache_file))
+    _save_cached_raster(key, result)
+    return result
+
+
+def _save_cached_raster(key, result, cache_dir=None):
+    with _rasterize_lock:
+        _rasterized[key] = result
+        _rasterized.move_to_end(key)
+        while len(_rasterized) > _max_cached_rasters:
+            _rasterized.popitem(last=False)
+    if cache_dir is None:
+        return
+    cache_file = _get_raster_cache_file(key, cache_dir)
+    fileio.atomic_write(cache_file, lambda dest: np.save(dest, result))
+
+
+def get_raster_statistics_for_cells(grid, raster, stat='mean', mask=None,
+                                    all_touched=False, band=1,
+                                    max_pixels_per_block=10000000):
+    """Compute zonal statistics for the raster pixels within
+    each cell of a structured model grid.
+
+    Pixels are assigned to cells by transforming the pixel centers
+    to local (unrotated) grid coordinates and looking up the rows
+    and columns from the cell edges; statistics are then computed
+    for all cells at once with numpy (bincount, ufunc.reduceat).
+    Only the window of the raster covering the model grid
+    is read, in blocks of rows. Statistics are accumulated block by block
+    (std from running sums of the pixel values and their squares).
+    For 'median' and percentiles, the pixel values in each cell are kept
+    until the cell is complete (lies entirely above the rows that
+    remain to be read), so memory usage is proportional to the pixels
+    in one block plus a band of cells; for rasters that aren't north-up
+    (rotated pixels), the values for all cells are kept until the end.
+
+    Parameters
+    ----------
+    grid : MFsetupGrid instance
+    raster : str
+        Path to raster file
+    stat : str or list of strings
+        Statistic(s) to compute. One or more of 'mean', 'min', 'max',
+        'sum', 'count', 'std', 'median' or 'percentile_<q>'
+        (for example, 'percentile_90'), by default, 'mean'.
+    mask : 2D boolean array, optional
+        Cells to compute statistics for (True). By default, all cells.
+    all_touched : bool
+        If False (default), only pixels with centers within a cell
+        are included; if True, all pixels that overlap a cell are included
+        (for example, for rasters with pixels that are larger than the cells).
+    band : int
+        Raster band to read, by default, 1.
+    max_pixels_per_block : int
+        Maximum number of pixels to read at once.
+
+    Returns
+    -------
+    results : 2D numpy array (nrow, ncol) or dict of 2D arrays
+        Values of the statistic in each cell (nan, or 0 for count, for cells
+        that are masked or don't contain any valid pixels); if stat
+        is a list, a dictionary keyed by statistic.
+    """
+    stats = [stat] if isinstance(stat, str) else list(stat)
+    for s in stats:
+        if s not in {'mean', 'min', 'max', 'sum', 'count', 'std', 'median'} and \
+                not s.startswith('percentile_'):
+            raise ValueError("Unrecognized statistic: {}".format(s))
+    nrow, ncol = grid.nrow, grid.ncol
+    ncells = nrow * ncol
+    cell_mask = None
+    if mask is not None:
+        cell_mask = np.ravel(mask).astype(bool)
+        if cell_mask.size != ncells:
+            raise ValueError('mask of shape {} incompatible with grid of shape {}'
+                             .format(np.shape(mask), (nrow, ncol)))
+    # statistics that need all of the pixel values in each cell
+    quantiles = {s: 50. if s == 'median' else float(s.split('_')[1])
+                 for s in stats if s == 'median' or s.startswith('percentile_')}
+    percentiles = {s: np.full(ncells, np.nan) for s in quantiles}
+
+    count = np.zeros(ncells)
+    total = np.zeros(ncells)
+    minimum = np.full(ncells, np.nan)
+    maximum = np.full(ncells, np.nan)
+    # sums of the pixel values and their squares (for std)
+    # are shifted by the first pixel value in each cell,
+    # to avoid loss of precision
+    shift = np.full(ncells, np.nan)
+    shifted_total = np.zeros(ncells)
+    shifted_squares = np.zeros(ncells)
+    # pixel values in cells that may not be complete yet (for percentiles)
+    pending_ids = np.array([], dtype=int)
+    pending_values = np.array([], dtype=float)
+    with rasterio.open(raster) as src:
+        window = _get_raster_window(src, grid)
+        a, b, c, d, e, f = src.transform[:6]
+        north_up = b == 0 and d == 0 and e < 0
+        if window is not None and len(quantiles) > 0 and north_up:
+            # lowest y coordinate of each cell
+            xedges, yedges = grid.xyedges
+            _, y = grid.get_coords(*np.meshgrid(xedges, yedges))
+            cell_ymin = np.min([y[:-1, :-1], y[:-1, 1:], y[1:, :-1], y[1:, 1:]],
+                               axis=0).ravel()
+        if window is not None:
+            rows_per_block = int(np.max([1, max_pixels_per_block // window.width]))
+            for row_off in range(int(window.row_off),
+                                 int(window.row_off + window.height),
+                                 rows_per_block):
+                height = int(np.min([rows_per_block,
+                                     window.row_off + window.height - row_off]))
+                block = Window(window.col_off, row_off, window.width, height)
+                data = src.read(band, window=block, masked=True)
+                values = np.ma.filled(data.astype(float), np.nan)
+                rows, cols = np.nonzero(~np.isnan(values))
+                values = values[rows, cols]
+                ids, pixel_idx = _get_pixel_cell_ids(grid, src.transform,
+                                                     rows + row_off,
+                                                     cols + int(window.col_off),
+                                                     all_touched=all_touched)
+                values = values[pixel_idx]
+                if cell_mask is not None:
+                    in_mask = cell_mask[ids]
+                    ids, values = ids[in_mask], values[in_mask]
+                if len(quantiles) > 0:
+                    pending_ids = np.append(pending_ids, ids)
+                    pending_values = np.append(pending_values, values)
+                    # compute the percentiles for cells that are above the top
+                    # of the rows that remain to be read (the remaining pixels,
+                    # including their extents, are all below this line)
+                    if north_up:
+                        y_remaining = f + e * (row_off + height)
+                        complete = cell_ymin[pending_ids] > y_remaining
+                        if np.any(complete):
+                            _get_cell_percentiles(pending_ids[complete],
+                                                  pending_values[complete],
+                                                  quantiles, percentiles)
+                            pending_ids = pending_ids[~complete]
+                            pending_values = pending_values[~complete]
+                if len(ids) == 0:
+                    continue
+                count += np.bincount(ids, minlength=ncells)
+                total += np.bincount(ids, weights=values, minlength=ncells)
+                # min and max of the pixels in each cell
+                order = np.argsort(ids, kind='stable')
+                ids, values = ids[order], values[order]
+                starts = np.flatnonzero(np.diff(ids, prepend=-1))
+                cells = ids[starts]
+                minimum[cells] = np.fmin(minimum[cells],
+                                         np.minimum.reduceat(values, starts))
+                maximum[cells] = np.fmax(maximum[cells],
+                                         np.maximum.reduceat(values, starts))
+                new_cells = np.isnan(shift[cells])
+                shift[cells[new_cells]] = values[starts[new_cells]]
+                shifted = values - shift[ids]
+                shifted_total += np.bincount(ids, weights=shifted, minlength=ncells)
+                shifted_squares += np.bincount(ids, weights=shifted**2, minlength=ncells)
+    if len(pending_ids) > 0:
+        _get_cell_percentiles(pending_ids, pending_values, quantiles, percentiles)
+
+    has_values = count > 0
+    mean = np.full(ncells, np.nan)
+    mean[has_values] = total[has_values] / count[has_values]
+
+    results = {}
+    for s in stats:
+        if s == 'mean':
+            result = mean
+        elif s == 'min':
+            result = minimum
+        elif s == 'max':
+            result = maximum
+        elif s == 'sum':
+            result = np.where(has_values, total, np.nan)
+        elif s == 'count':
+            result = count.astype(int)
+        elif s == 'std':
+            n = count[has_values]
+            variance = (shifted_squares[has_values] -
+                        shifted_total[has_values]**2 / n) / n
+            result = np.full(ncells, np.nan)
+            result[has_values] = np.sqrt(np.maximum(variance, 0))
+        else:
+            result = percentiles[s]
+        if cell_mask is not None and s != 'count':
+            result[~cell_mask] = np.nan
+        results[s] = np.reshape(result, (nrow, ncol))
+    if isinstance(stat, str):
+        return results[stat]
+    return results
+
+
+def _get_cell_percentiles(ids, values, quantiles, results):
+    """Compute percentiles of the pixel values in each cell,
+    given all of the pixel values for the cells in ids.
+    Percentiles are interpolated linearly between the closest ranks
+    (same as numpy.percentile).
+
+    Parameters
+    ----------
+    ids : 1D array of ints
+        Cell number for each pixel value.
+    values : 1D array
+        Pixel values.
+    quantiles : dict
+        Percentiles (0-100) to compute, keyed by statistic name.
+    results : dict
+        1D arrays (of length ncells) of percentiles for each statistic,
+        keyed by statistic name, which are updated in place.
+    """
+    # sort the pixel values by cell, and then by value
+    order = np.lexsort((values, ids))
+    ids, values = ids[order], values[order]
+    starts = np.flatnonzero(np.diff(ids, prepend=-1))
+    cells = ids[starts]
+    n = np.diff(np.append(starts, len(ids)))
+    for s, q in quantiles.items():
+        position = q / 100 * (n - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, n - 1)
+        v0 = values[starts + lower]
+        v1 = values[starts + upper]
+        results[s][cells] = v0 + (v1 - v0) * (position - lower)
+
+
+def _get_raster_window(src, grid):
+    """Get the window of an open raster dataset covering
+    the bounding box of a model grid (None if there is no overlap)."""
+    x0, y0, x1, y1 = grid.bbox.bounds
+    # row, column locations of the bounding box corners
+    inverse = ~src.transform
+    a, b, c, d, e, f = inverse[:6]
+    x = np.array([x0, x0, x1, x1])
+    y = np.array([y0, y1, y0, y1])
+    cols = a * x + b * y + c
+    rows = d * x + e * y + f
+    col0 = int(np.max([np.floor(cols.min()) - 1, 0]))
+    col1 = int(np.min([np.ceil(cols.max()) + 1, src.width]))
+    row0 = int(np.max([np.floor(rows.min()) - 1, 0]))
+    row1 = int(np.min([np.ceil(rows.max()) + 1, src.height]))
+    if col1 <= col0 or row1 <= row0:
+        return
+    return Window(col0, row0, col1 - col0, row1 - row0)
+
+
+def _get_pixel_cell_ids(grid, transform, rows, cols, all_touched=False):
+    """Get the (flattened) model cell numbers for a set of raster pixels.
+
+    Returns
+    -------
+    ids : 1D array of ints
+        Cell number (i * ncol + j) for each pixel/cell combination.
+    pixel_idx : 1D array of ints
+        Position of each pixel/cell combination in rows, cols
+        (pixels outside of the grid are dropped; pixels can be repeated
+        if all_touched=True and a pixel overlaps more than one cell).
+    """
+    xedges, yedges = grid.xyedges
+    # row edges in increasing order (from the bottom of the grid)
+    yedges = yedges[::-1]
+    nrow, ncol = grid.nrow, grid.ncol
+    a, b, c, d, e, f = transform[:6]
+
+    def local_coords(row_offset, col_offset):
+        x = a * (cols + col_offset) + b * (rows + row_offset) + c
+        y = d * (cols + col_offset) + e * (rows + row_offset) + f
+        return get_local_coordinates(grid, x, y)
+
+    if not all_touched:
+        # pixel centers
+        x, y = local_coords(0.5, 0.5)
+        j = np.searchsorted(xedges, x, side='right') - 1
+        r = np.searchsorted(yedges, y, side='right') - 1
+        inside = (j >= 0) & (j < ncol) & (r >= 0) & (r < nrow)
+        pixel_idx = np.flatnonzero(inside)
+        i = nrow - 1 - r[inside]
+        return i * ncol + j[inside], pixel_idx
+
+    # range of cells overlapped by the extent of each pixel
+    corners = [local_coords(ro, co) for ro, co in ((0, 0), (0, 1), (1, 0), (1, 1))]
+    x = np.array([xy[0] for xy in corners])
+    y = np.array([xy[1] for xy in corners])
+    j0 = np.maximum(np.searchsorted(xedges, x.min(axis=0), side='right') - 1, 0)
+    j1 = np.minimum(np.searchsorted(xedges, x.max(axis=0), side='left') - 1, ncol - 1)
+    r0 = np.maximum(np.searchsorted(yedges, y.min(axis=0), side='right') - 1, 0)
+    r1 = np.minimum(np.searchsorted(yedges, y.max(axis=0), side='left') - 1, nrow - 1)
+    nj = np.maximum(j1 - j0 + 1, 0)
+    nr = np.maximum(r1 - r0 + 1, 0)
+    ncells = nj * nr
+    pixel_idx = np.repeat(np.arange(len(ncells)), ncells)
+    # position of each cell within the range for its pixel
+    position = np.arange(ncells.sum()) - np.repeat(np.cumsum(ncells) - ncells, ncells)
+    nj = nj[pixel_idx]
+    j = j0[pixel_idx] + position % nj
+    r = r0[pixel_idx] + position // nj
+
+    # if the pixels are rotated relative to the grid, drop cells within
+    # the range that don't actually overlap the pixel
+    # (separating axis test, using the pixel edge directions as axes)
+    px, py = x[:, pixel_idx], y[:, pixel_idx]
+    cx = np.array([xedges[j], xedges[j + 1], xedges[j], xedges[j + 1]])
+    cy = np.array([yedges[r], yedges[r], yedges[r + 1], yedges[r + 1]])
+    overlaps = np.ones(len(pixel_idx), dtype=bool)
+    for corner in 1, 2:
+        ux, uy = px[corner] - px[0], py[corner] - py[0]
+        if np.allclose(ux * uy, 0):
+            continue
+        pixel_proj = px * ux + py * uy
+        cell_proj = cx * ux + cy * uy
+        overlaps &= (pixel_proj.max(axis=0) > cell_proj.min(axis=0)) & \
+                    (cell_proj.max(axis=0) > pixel_proj.min(axis=0))
+    i = nrow - 1 - r[overlaps]
+    return i * ncol + j[overlaps], pixel_idx[overlaps]
+
+
+class RasterSampler:
+    """Sample rasters at the cell centers of a model grid.
+
+    Each raster is opened once, and only the window covering the
+    model grid bounding box is read. The windows are kept (in the
+    native data type of the raster, with a mask for nodata pixels) in
+    a least-recently-used cache that is bounded by its total size
+    in memory, and the pixel locations
+    of the cell centers are cached by raster, so that repeated sampling
+    of the same raster (e.g. a DEM used for the model top,
+    lake bathymetry and other packages) doesn't require re-reading it.
+
+    Parameters
+    ----------
+    grid : MFsetupGrid instance
+    max_cached_mb : float
+        Maximum total size of the raster windows kept in memory,
+        in megabytes. The most recently used window is always kept,
+        even if it is larger.
+    """
+    def __init__(self, grid, max_cached_mb=1000):
+        self.grid = grid
+        self.max_cached_mb = max_cached_mb
+        self._windows = collections.OrderedDict()
+        self._cached_bytes = 0
+        self._pixel_indices = {}
+        # rasters can be sampled from multiple threads
+        # (e.g. when setting up layers concurrently)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _get_key(raster, band=1):
+        # include the modification time, so that the cache
+        # isn't used if the file is rewritten
+        raster = os.path.abspath(raster)
+        return raster, os.path.getmtime(raster), band
+
+    def get_window(self, raster, band=1):
+        """Get the pixel values within the model grid bounding box.
+
+        Returns
+        -------
+        data : 2D masked array
+            Pixel values, in the data type of the raster,
+            with nodata values masked
+            (None if the raster doesn't overlap the grid).
+        window : rasterio.windows.Window instance
+            Location of data within the raster.
+        transform : affine.Affine instance
+            Transform for the whole raster.
+        """
+        key = self._get_key(raster, band)
+        with self._lock:
+            if key in self._windows:
+                self._windows.move_to_end(key)
+                return self._windows[key]
+            print('reading data from {}...'.format(raster))
+            t0 = time.time()
+            with rasterio.open(raster) as src:
+                window = _get_raster_window(src, self.grid)
+                data = None
+                if window is not None:
+                    data = src.read(band, window=window, masked=True)
+                transform = src.transform
+            self._windows[key] = data, window, transform
+            self._cached_bytes += self._get_nbytes(data)
+            while self._cached_bytes > self.max_cached_mb * 1024**2 and \
+                    len(self._windows) > 1:
+                removed, _, _ = self._windows.popitem(last=False)[1]
+                self._cached_bytes -= self._get_nbytes(removed)
+            print("finished in {:.2f}s".format(time.time() - t0))
+        return data, window, transform
+
+    @staticmethod
+    def _get_nbytes(data):
+        if data is None:
+            return 0
+        return data.data.nbytes + np.ma.getmask(data).nbytes
+
+    def get_pixel_indices(self, raster, band=1):
+        """Get the locations of the model cell centers
+        within the window returned by :meth:`get_window`.
+
+        Returns
+        -------
+        rows, cols : 1D arrays of ints
+            Window row, column location of each cell center.
+        within : 1D boolean array
+            True for cell centers that are within the window.
+        """
+        data, window, transform = self.get_window(raster, band)
+        key = self._get_key(raster, band)
+        with self._lock:
+            if key not in self._pixel_indices:
+                x = np.ravel(self.grid.xcellcenters)
+                y = np.ravel(self.grid.ycellcenters)
+                within = np.zeros(x.size, dtype=bool)
+                rows = np.zeros(x.size, dtype=int)
+                cols = np.zeros(x.size, dtype=int)
+                if window is not None:
+                    # same as rasterio.DatasetReader.index
+                    a, b, c, d, e, f = (~transform)[:6]
+                    cols = np.floor(a * x + b * y + c).astype(int) - int(window.col_off)
+                    rows = np.floor(d * x + e * y + f).astype(int) - int(window.row_off)
+                    within = (rows >= 0) & (rows < data.shape[0]) & \
+                             (cols >= 0) & (cols < data.shape[1])
+                    rows[~within] = 0
+                    cols[~within] = 0
+                self._pixel_indices[key] = rows, cols, within
+        return self._pixel_indices[key]
+
+    def get_values_at_cell_centers(self, raster, band=1,
+                                   out_of_bounds_errors='coerce'):
+        """Sample raster values at the model cell centers
+        (same as gisutils.get_values_at_points with method='nearest').
+
+        Parameters
+        ----------
+        raster : str
+            Raster filename.
+        band : int
+            Raster band to sample.
+        out_of_bounds_errors : {'raise', 'coerce'}
+            If 'raise', raise an exception if any cell centers
+            are outside of the raster; if 'coerce', return nans
+            for cell centers outside of the raster.
+
+        Returns
+        -------
+        values : float array of same shape as grid.xcellcenters
+            Nans are returned for nodata pixels.
+        """
+        data, window, transform = self.get_window(raster, band)
+        rows, cols, within = self.get_pixel_indices(raster, band)
+        values = np.full(len(within), np.nan)
+        if data is not None:
+            rows, cols = rows[within], cols[within]
+            sampled = data.data[rows, cols].astype(float)
+            mask = np.ma.getmask(data)
+            if mask is not np.ma.nomask:
+                sampled[mask[rows, cols]] = np.nan
+            values[within] = sampled
+        if out_of_bounds_errors == 'raise' and not np.all(within):
+            raise ValueError("{} points outside of {} extent."
+                             .format(np.sum(~within), raster))
+        return np.reshape(values, np.shape(self.grid.xcellcenters))
+
+
 def setup_structured_grid(xoff=None, yoff=None, xul=None, yul=None,
                           nrow=None, ncol=None,
                           dxy=None, delr=None, delc=None,
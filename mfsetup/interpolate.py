@@ -1,10 +1,18 @@
+import os
 import time
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
 import scipy.interpolate as spint
+from scipy import sparse
+from scipy.spatial import cKDTree
 import scipy.spatial.qhull as qhull
 from scipy.signal import convolve2d
 import itertools
 import flopy
+import mfsetup.fileio as fileio
+from .profiling import stage, timed
 
 
 def get_source_dest_model_xys(source_model, dest_model,
@@ -40,6 +48,7 @@ def get_source_dest_model_xys(source_model, dest_model,
     return source_model_xy, dest_model_xy
 
 
+@timed(category='regrid')
 def interp_weights(xyz, uvw, d=2):
     """Speed up interpolation vs scipy.interpolate.griddata (method='linear'),
     by only computing the weights once:
@@ -64,12 +73,36 @@ def interp_weights(xyz, uvw, d=2):
     print('Calculating interpolation weights...')
     t0 = time.time()
     tri = qhull.Delaunay(xyz)
+    vertices, weights = get_barycentric_weights(tri, uvw, d=d)
+    print("finished in {:.2f}s\n".format(time.time() - t0))
+    return vertices, weights
+
+
+def get_barycentric_weights(tri, uvw, d=2):
+    """Get the vertices and barycentric weights of the simplices
+    in a Delaunay triangulation that contain a set of points.
+
+    Parameters
+    ----------
+    tri : scipy.spatial.Delaunay instance
+    uvw : ndarray of shape n points x ndims
+    d : int
+        Number of dimensions
+
+    Returns
+    -------
+    vertices : ndarray of shape n points x d + 1
+        Index positions of the simplex vertices in the points
+        used to make the triangulation.
+    weights : ndarray of shape n points x d + 1
+        Barycentric weights for each vertex. Points outside of
+        the triangulation have one or more negative weights.
+    """
     simplex = tri.find_simplex(uvw)
     vertices = np.take(tri.simplices, simplex, axis=0)
     temp = np.take(tri.transform, simplex, axis=0)
     delta = uvw - temp[:, d]
     bary = np.einsum('njk,nk->nj', temp[:, :d, :], delta)
-    print("finished in {:.2f}s\n".format(time.time() - t0))
     return vertices, np.hstack((bary, 1 - bary.sum(axis=1, keepdims=True)))
 
 
@@ -100,6 +133,490 @@ def interpolate(values, vtx, wts, fill_value='mean'):
     return result
 
 
+def get_nearest_index(source_xy, dest_xy):
+    """Get the index of the nearest source point to each destination point,
+    so that source values can be resampled to the destination points
+    (same as scipy.interpolate.griddata with method='nearest')
+    with a single gather: values[..., index].
+
+    Parameters
+    ----------
+    source_xy : ndarray of shape n source points x ndims
+        x, y, (z) locations of source data.
+    dest_xy : ndarray of shape n destination points x ndims
+        x, y, (z) locations of where source data will be resampled
+
+    Returns
+    -------
+    index : 1D array of ints of length n destination points
+        Index positions in flattened (1D) source array
+    """
+    tree = cKDTree(source_xy)
+    _, index = tree.query(dest_xy)
+    return index
+
+
+def get_interpolation_operator(vtx, wts, nsource):
+    """Make a sparse matrix that applies interpolation weights
+    to a set of source values.
+
+    Parameters
+    ----------
+    vtx : indices returned by interp_weights
+    wts : weights returned by interp_weights
+    nsource : int
+        Number of source points (same as xyz in interp_weights)
+
+    Returns
+    -------
+    operator : scipy.sparse.csr_matrix of shape n destination points x nsource
+        Interpolated values are computed as operator @ values.
+        Rows for destination points outside of the convex hull of the
+        source points (with one or more negative weights) are empty.
+    outside : 1D boolean array of length n destination points
+        True for destination points outside of the convex hull.
+    """
+    vtx = np.asarray(vtx)
+    wts = np.asarray(wts)
+    outside = np.any(wts < 0, axis=1)
+    ndest, nvertices = wts.shape
+    rows = np.repeat(np.arange(ndest), nvertices)
+    inside = np.repeat(~outside, nvertices)
+    operator = sparse.csr_matrix((wts.ravel()[inside],
+                                  (rows[inside], vtx.ravel()[inside])),
+                                 shape=(ndest, nsource))
+    return operator, outside
+
+
+class Interpolator:
+    """Linear interpolation between a fixed set of source points
+    (for example, a window of parent model cell centers) and a fixed
+    set of destination points (for example, the inset model cell centers).
+
+    The Delaunay triangulation of the source points and the
+    barycentric weights are only computed once. Interpolations that
+    exclude some of the source points (for example, masked-out
+    cells or values outside of a valid range) reuse the cached weights,
+    and only re-triangulate the valid source points in the vicinity
+    of the simplices that contain excluded points. Patched weights are
+    cached by set of excluded source points, so that repeated masks
+    (for example, the same inactive cells in every stress period)
+    don't require any further triangulation.
+
+    Optionally, weights can also be cached on disk, in .npz files
+    named by a hash of the source and destination points, the mask
+    and the interpolation method, so that they can be reused
+    between model setup runs. Only the max_cached_files most recently
+    used sets of patched weights for each set of source and
+    destination points are kept on disk.
+
+    The weights are applied as a sparse matrix (see :meth:`get_operator`),
+    so that a stack of source arrays (for example, all of the layers
+    in a 3D array, or all of the stress periods in a transient array)
+    can be interpolated in one matrix product (see :meth:`interpolate_stack`).
+
+    Parameters
+    ----------
+    source_xy : ndarray of shape n source points x ndims
+        x, y, (z) locations of source data.
+    dest_xy : ndarray of shape n destination points x ndims
+        x, y, (z) locations of where source data will be interpolated
+    d : int
+        Number of dimensions
+    max_cached_masks : int
+        Maximum number of sets of patched weights to keep in memory.
+    max_patch_fraction : float
+        If more than this fraction of the destination points are in simplices
+        with excluded vertices, all of the valid points are triangulated
+        instead of patching the individual simplices.
+    cache_dir : str, optional
+        Folder for caching weights on disk. By default, weights are
+        only cached in memory.
+    max_cached_files : int
+        Maximum number of sets of patched weights to keep on disk
+        (in addition to the weights for all of the source points).
+    """
+    method = 'linear'
+
+    def __init__(self, source_xy, dest_xy, d=2, max_cached_masks=100,
+                 max_patch_fraction=0.02, cache_dir=None, max_cached_files=20):
+        self.source_xy = np.asarray(source_xy, dtype=float)
+        self.dest_xy = np.asarray(dest_xy, dtype=float)
+        self.d = d
+        self.max_cached_masks = max_cached_masks
+        self.max_patch_fraction = max_patch_fraction
+        self.cache_dir = cache_dir
+        self.max_cached_files = max_cached_files
+        self._points_hash = None
+        if cache_dir is not None:
+            h = hashlib.sha1()
+            for array in self.source_xy, self.dest_xy:
+                h.update(str(array.shape).encode())
+                h.update(np.ascontiguousarray(array).tobytes())
+            h.update('{}{}'.format(self.method, self.d).encode())
+            self._points_hash = h.hexdigest()
+        self._tri = None
+        self._weights = None
+        self._masked_weights = OrderedDict()
+        self._operators = OrderedDict()
+        # weights can be requested from multiple threads
+        # (e.g. when regridding layers or stress periods concurrently)
+        self._lock = threading.RLock()
+
+    @property
+    def tri(self):
+        """Delaunay triangulation of all of the source points."""
+        if self._tri is None:
+            self._tri = qhull.Delaunay(self.source_xy)
+        return self._tri
+
+    @property
+    def weights(self):
+        """Vertices and barycentric weights for all of the destination points
+        (same as returned by interp_weights)."""
+        with self._lock:
+            if self._weights is None:
+                self._weights = self._load_cached_weights()
+            if self._weights is None:
+                print('Calculating interpolation weights...')
+                t0 = time.time()
+                with stage('interp_weights', category='regrid'):
+                    self._weights = get_barycentric_weights(self.tri, self.dest_xy, d=self.d)
+                print("finished in {:.2f}s\n".format(time.time() - t0))
+                self._save_cached_weights(*self._weights)
+        return self._weights
+
+    def get_weights(self, valid=None):
+        """Get interpolation weights that only include valid source points.
+
+        Parameters
+        ----------
+        valid : 1D boolean array of length n source points
+            True values indicate source points to include in the interpolation.
+            By default, all points are included.
+
+        Returns
+        -------
+        vtx : ndarray of shape n destination points x d + 1
+        wts : ndarray of shape n destination points x d + 1
+            Same as returned by interp_weights; destination points
+            outside of the convex hull of the valid source points
+            have one or more negative weights.
+        """
+        weights = self.weights
+        if valid is None:
+            return weights
+        valid = np.asarray(valid, dtype=bool).ravel()
+        if valid.size != len(self.source_xy):
+            raise ValueError('valid array of size {} incompatible with {} source points'
+                             .format(valid.size, len(self.source_xy)))
+        if valid.all():
+            return weights
+        vtx, wts = weights
+
+        key = np.flatnonzero(~valid).tobytes()
+        with self._lock:
+            if key in self._masked_weights:
+                self._masked_weights.move_to_end(key)
+                return self._masked_weights[key]
+
+        cached = self._load_cached_weights(valid)
+        if cached is not None:
+            self._cache_masked_weights(key, *cached)
+            return cached
+
+        vtx, wts = vtx.copy(), wts.copy()
+        # destination points inside of the triangulation,
+        # within simplices that have one or more excluded vertices
+        outside = np.any(wts < 0, axis=1)
+        patch = ~np.all(valid[vtx], axis=1) & ~outside
+        # if many simplices are affected,
+        # it's faster to just triangulate all of the valid points
+        if patch.sum() > self.max_patch_fraction * len(patch):
+            patch = ~outside
+            vtx[patch], wts[patch] = self._triangulate_locally(np.flatnonzero(valid),
+                                                               None, self.dest_xy[patch])
+        elif np.any(patch):
+            vtx[patch], wts[patch] = self._get_patched_weights(valid, vtx[patch],
+                                                               self.dest_xy[patch])
+        self._cache_masked_weights(key, vtx, wts)
+        self._save_cached_weights(vtx, wts, valid)
+        return vtx, wts
+
+    def _cache_masked_weights(self, key, vtx, wts):
+        with self._lock:
+            self._masked_weights[key] = vtx, wts
+            if len(self._masked_weights) > self.max_cached_masks:
+                self._masked_weights.popitem(last=False)
+
+    def get_cache_file(self, valid=None):
+        """Name of the file for caching weights on disk, based on
+        a hash of the source and destination points, the mask
+        (valid source points) and the interpolation method.
+        """
+        if self.cache_dir is None:
+            return
+        name = 'interp_weights_{}'.format(self._points_hash)
+        if valid is not None:
+            name += '_{}'.format(hashlib.sha1(np.packbits(valid).tobytes()).hexdigest())
+        return os.path.join(self.cache_dir, name + '.npz')
+
+    def _load_cached_weights(self, valid=None):
+        cache_file = self.get_cache_file(valid)
+        if cache_file is None:
+            return
+
+        def load(f):
+            with np.load(f) as src:
+                return src['vertices'], src['weights']
+        cached = fileio.load_cache_file(cache_file, load)
+        if cached is None:
+            return
+        vtx, wts = cached
+        if len(vtx) != len(self.dest_xy):
+            return
+        # mark the file as recently used
+        os.utime(cache_file)
+        print('loaded cached interpolation weights from {}'.format(cache_file))
+        return vtx, wts
+
+    def _save_cached_weights(self, vtx, wts, valid=None):
+        cache_file = self.get_cache_file(valid)
+        if cache_file is None:
+            return
+        fileio.atomic_write(cache_file,
+                            lambda dest: np.savez(dest, vertices=vtx, weights=wts))
+        if valid is not None:
+            self._prune_cache_files()
+
+    def _prune_cache_files(self):
+        """Remove all but the max_cached_files most recently used
+        files of patched weights for the source and destination points."""
+        prefix = 'interp_weights_{}_'.format(self._points_hash)
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                 if f.startswith(prefix) and f.endswith('.npz')]
+        fileio.prune_cache_files(files, self.max_cached_files)
+
+    def _get_patched_weights(self, valid, vertices, uvw, tile_size=16):
+        """Triangulate the valid source points in the vicinity of a set
+        of destination points; get the weights for the destination points.
+
+        Destination points are grouped into square tiles (tile_size times
+        the typical simplex size on a side), so that scattered excluded
+        points only require small local triangulations. Within each tile,
+        the area included in the triangulation is expanded until the
+        circumsphere of each simplex containing a destination point is
+        within the area, which guarantees that the simplex is also in
+        the Delaunay triangulation of all valid source points.
+        """
+        d = self.d
+        valid_idx = np.flatnonzero(valid)
+        patched_vtx = np.zeros((len(uvw), d + 1), dtype=vertices.dtype)
+        patched_wts = -np.ones((len(uvw), d + 1), dtype=float)
+        if len(valid_idx) <= d:
+            return patched_vtx, patched_wts
+
+        simplex_xy = self.source_xy[vertices]
+        simplex_size = np.max(simplex_xy.max(axis=1) - simplex_xy.min(axis=1), axis=1)
+        tile_width = tile_size * np.median(simplex_size)
+        tiles = np.floor((uvw - uvw.min(axis=0)) / tile_width).astype(int)
+        _, tile_numbers = np.unique(tiles, axis=0, return_inverse=True)
+        tile_numbers = np.ravel(tile_numbers)
+        for tile in np.unique(tile_numbers):
+            in_tile = np.flatnonzero(tile_numbers == tile)
+            patched_vtx[in_tile], patched_wts[in_tile] = \
+                self._triangulate_locally(valid_idx, simplex_xy[in_tile], uvw[in_tile])
+        return patched_vtx, patched_wts
+
+    def _triangulate_locally(self, valid_idx, simplex_xy, uvw):
+        """Get weights for destination points uvw from a triangulation of
+        the valid source points around the simplices simplex_xy (an array
+        of shape n points x d + 1 vertices x d). If simplex_xy is None,
+        all of the valid source points are triangulated.
+        """
+        d = self.d
+        valid_xy = self.source_xy[valid_idx]
+        patched_vtx = np.zeros((len(uvw), d + 1), dtype=int)
+        patched_wts = -np.ones((len(uvw), d + 1), dtype=float)
+
+        # start with the extent of the simplices that are being replaced
+        if simplex_xy is not None:
+            lower = simplex_xy.min(axis=(0, 1))
+            upper = simplex_xy.max(axis=(0, 1))
+            pad = np.max(upper - lower)
+        remaining = np.arange(len(uvw))
+        while len(remaining) > 0:
+            if simplex_xy is None:
+                in_window = np.ones(len(valid_idx), dtype=bool)
+            else:
+                lower_r = np.minimum(lower, uvw[remaining].min(axis=0)) - pad
+                upper_r = np.maximum(upper, uvw[remaining].max(axis=0)) + pad
+                in_window = np.all((valid_xy >= lower_r) & (valid_xy <= upper_r), axis=1)
+                pad *= 2
+            all_points = in_window.all()
+            local_idx = valid_idx[in_window]
+            if len(local_idx) <= d:
+                if all_points:
+                    break
+                continue
+            try:
+                tri = qhull.Delaunay(self.source_xy[local_idx])
+            except qhull.QhullError:
+                # too few or colinear points; try a bigger area
+                if not all_points:
+                    continue
+                break
+            lvtx, lwts = get_barycentric_weights(tri, uvw[remaining], d=d)
+            inside = np.all(lwts >= 0, axis=1)
+            if all_points:
+                # anything not in the triangulation of all valid points is outside
+                done = np.ones(len(remaining), dtype=bool)
+            else:
+                center, radius = get_circumspheres(tri.points[lvtx])
+                done = inside & \
+                       np.all(center - radius[:, None] >= lower_r, axis=1) & \
+                       np.all(center + radius[:, None] <= upper_r, axis=1)
+            patched_vtx[remaining[done]] = local_idx[lvtx[done]]
+            patched_wts[remaining[done]] = lwts[done]
+            remaining = remaining[~done]
+        return patched_vtx, patched_wts
+
+    def get_operator(self, valid=None):
+        """Get the interpolation weights that only include valid source points
+        (see :meth:`get_weights`), as a sparse matrix.
+
+        Parameters
+        ----------
+        valid : 1D boolean array of length n source points
+            True values indicate source points to include in the interpolation.
+            By default, all points are included.
+
+        Returns
+        -------
+        operator : scipy.sparse.csr_matrix of shape n destination points x n source points
+        outside : 1D boolean array of length n destination points
+            True for destination points outside of the convex hull
+            of the valid source points (see :func:`get_interpolation_operator`).
+        """
+        if valid is None or np.all(valid):
+            key = b''
+        else:
+            key = np.flatnonzero(~np.asarray(valid, dtype=bool).ravel()).tobytes()
+        with self._lock:
+            if key in self._operators:
+                self._operators.move_to_end(key)
+                return self._operators[key]
+        vtx, wts = self.get_weights(valid)
+        operator = get_interpolation_operator(vtx, wts, len(self.source_xy))
+        with self._lock:
+            self._operators[key] = operator
+            if len(self._operators) > self.max_cached_masks:
+                self._operators.popitem(last=False)
+        return operator
+
+    def interpolate(self, values, valid=None, fill_value='mean'):
+        """Interpolate source values to the destination points.
+
+        Parameters
+        ----------
+        values : 1D array of length n source points
+        valid : 1D boolean array of length n source points
+            True values indicate source points to include in the interpolation.
+            By default, all points are included.
+        fill_value : float or 'mean'
+            Value used to fill in destination points outside of the convex hull
+            of the valid source points. By default, the mean of the
+            interpolated values is used.
+
+        Returns
+        -------
+        interpolated values
+        """
+        return self.interpolate_stack(np.ravel(values), valid=valid,
+                                      fill_value=fill_value)
+
+    def interpolate_stack(self, values, valid=None, fill_value='mean'):
+        """Interpolate a stack of source value arrays (for example,
+        model layers or stress periods) to the destination points,
+        in one sparse matrix product for each unique set of valid
+        source points.
+
+        Parameters
+        ----------
+        values : 2D array of shape nstack x n source points
+            (or 1D array of length n source points)
+        valid : 1D or 2D boolean array
+            True values indicate source points to include in the interpolation.
+            A 1D array of length n source points is applied to all of
+            the values in the stack; a 2D array of shape nstack x n source points
+            specifies valid points for each array in the stack.
+            By default, all points are included.
+        fill_value : float or 'mean'
+            Value used to fill in destination points outside of the convex hull
+            of the valid source points. By default, the mean of the
+            interpolated values (for each array in the stack) is used.
+
+        Returns
+        -------
+        interpolated values : 2D array of shape nstack x n destination points
+            (or 1D array of length n destination points)
+        """
+        values = np.asarray(values, dtype=float)
+        single_array = values.ndim == 1
+        values = np.reshape(values, (-1, len(self.source_xy)))
+        if valid is None or np.ndim(valid) == 1:
+            groups = [(valid, slice(None))]
+        else:
+            # group arrays in the stack with the same valid points,
+            # so that they share the same weights
+            valid = np.reshape(valid, values.shape).astype(bool)
+            masks, mask_idx = np.unique(valid, axis=0, return_inverse=True)
+            mask_idx = np.ravel(mask_idx)
+            groups = [(mask, np.flatnonzero(mask_idx == n))
+                      for n, mask in enumerate(masks)]
+
+        result = np.zeros((len(values), len(self.dest_xy)))
+        for mask, rows in groups:
+            operator, outside = self.get_operator(mask)
+            with np.errstate(invalid='ignore', over='ignore'):
+                result_group = (operator @ values[rows].T).T
+            if np.any(outside):
+                if fill_value == 'mean':
+                    if np.all(outside):
+                        fill_values = np.full(len(result_group), np.nan)
+                    else:
+                        fill_values = np.nanmean(result_group[:, ~outside], axis=1)
+                    result_group[:, outside] = fill_values[:, np.newaxis]
+                else:
+                    result_group[:, outside] = fill_value
+            result[rows] = result_group
+        if single_array:
+            return result[0]
+        return result
+
+
+def get_circumspheres(simplices):
+    """Get the centers and radii of the circumscribed spheres
+    (circles in 2D) for a set of simplices.
+
+    Parameters
+    ----------
+    simplices : ndarray of shape n simplices x d + 1 vertices x d
+
+    Returns
+    -------
+    centers : ndarray of shape n simplices x d
+    radii : 1D array of length n simplices
+    """
+    p0 = simplices[:, 0, :]
+    a = 2 * (simplices[:, 1:, :] - p0[:, None, :])
+    b = np.sum(simplices[:, 1:, :]**2, axis=2) - np.sum(p0**2, axis=1)[:, None]
+    centers = np.linalg.solve(a, b[..., None])[..., 0]
+    radii = np.sqrt(np.sum((centers - p0)**2, axis=1))
+    return centers, radii
+
+
+@timed(category='regrid')
 def regrid(arr, grid, grid2, mask1=None, mask2=None, method='linear'):
     """Interpolate array values from one model grid to another,
     using scipy.interpolate.griddata.
@@ -4,7 +4,7 @@ from collections import OrderedDict
 import time
 import numpy as np
 import pandas as pd
-from scipy.ndimage import sobel
+from scipy.ndimage import sobel, find_objects, minimum
 from shapely.geometry import Polygon
 import flopy
 fm = flopy.modflow
@@ -13,12 +13,13 @@ from gisutils import shp2df, project, get_proj_str
 from mfsetup.evaporation import hamon_evaporation
 from mfsetup.fileio import save_array
 from mfsetup.grid import rasterize
-from mfsetup.sourcedata import SourceData, aggregate_dataframe_to_stress_period, TabularSourceData
+from mfsetup.sourcedata import SourceData, aggregate_dataframe_to_stress_periods, TabularSourceData
 from mfsetup.units import convert_length_units, convert_temperature_units
 
 
 def make_lakarr2d(grid, lakesdata,
-                  include_ids, id_column='hydroid'):
+                  include_ids, id_column='hydroid',
+                  cache_dir=None):
     """
     Make a nrow x ncol array with lake package extent for each lake,
     using the numbers in the 'id' column in the lakes shapefile.
@@ -35,7 +36,7 @@ def make_lakarr2d(grid, lakesdata,
     lakes = lakes.loc[include_ids]
     lakes['lakid'] = np.arange(1, len(lakes) + 1)
     lakes['geometry'] = [Polygon(g.exterior) for g in lakes.geometry]
-    arr = rasterize(lakes, grid=grid, id_column='lakid')
+    arr = rasterize(lakes, grid=grid, id_column='lakid', cache_dir=cache_dir)
 
     # ensure that order of hydroids is unchanged
     # (used to match features to lake IDs in lake package)
@@ -45,7 +46,8 @@ def make_lakarr2d(grid, lakesdata,
 
 def make_bdlknc_zones(grid, lakesshp, include_ids,
                       feat_id_column='feat_id',
-                      lake_package_id_column='lak_id'):
+                      lake_package_id_column='lak_id',
+                      cache_dir=None):
     """
     Make zones for populating with lakebed leakance values. Same as
     lakarr, but with a buffer around each lake so that horizontal
@@ -71,14 +73,14 @@ def make_bdlknc_zones(grid, lakesshp, include_ids,
     # speed up buffer construction by getting exteriors once
     # and probably more importantly,
     # simplifying possibly complex geometries of lakes generated from 2ft lidar
-    unbuffered_exteriors = [Polygon(g.exterior).simplify(5) for g in lakes.geometry]
-    lakes['geometry'] = [g.buffer(exterior_buffer) for g in unbuffered_exteriors]
-    arr = rasterize(lakes, grid=grid, id_column=lake_package_id_column)
+    lakes['geometry'] = [Polygon(g.exterior).simplify(5) for g in lakes.geometry]
+    arr = rasterize(lakes, grid=grid, id_column=lake_package_id_column,
+                    buffer=exterior_buffer, cache_dir=cache_dir)
 
     # Interior buffer for lower leakance, assumed to be 20 m around the lake
     interior_buffer = -20  # m
-    lakes['geometry'] = [g.buffer(interior_buffer) for g in unbuffered_exteriors]
-    arr2 = rasterize(lakes, grid=grid, id_column=lake_package_id_column)
+    arr2 = rasterize(lakes, grid=grid, id_column=lake_package_id_column,
+                     buffer=interior_buffer, cache_dir=cache_dir)
     arr2 = arr2 * 100  # Create new ids for the interior, as multiples of 10
 
     arr[arr2 > 0] = arr2[arr2 > 0]
@@ -152,11 +154,7 @@ def setup_lake_info(model):
                        'geometry': lakesdata['geometry']
                        })
     # get starting stages from model top, for specifying ranges
-    stages = []
-    for lakid in df['lak_id']:
-        loc = model._lakarr2d == lakid
-        est_stage = model.dis.top.array[loc].min()
-        stages.append(est_stage)
+    stages = minimum(model.dis.top.array, labels=model._lakarr2d, index=df['lak_id'].values)
     df['strt'] = np.array(stages)
 
     # save a lookup file mapping lake ids to hydroids
@@ -278,7 +276,8 @@ def setup_lake_connectiondata(model,
     if model.lake_info is None:
         model.lake_info = setup_lake_info(model)
     lakzones = make_bdlknc_zones(model.modelgrid, model.lake_info,
-                                 include_ids=model.lake_info['feat_id'])
+                                 include_ids=model.lake_info['feat_id'],
+                                 cache_dir=model.rasterize_cache)
     model.setup_external_filepaths('lak', 'lakzones',
                                    cfg['{}_filename_fmt'.format('lakzones')],
                                    nfiles=1)
@@ -294,52 +293,9 @@ def setup_lake_connectiondata(model,
     layer_elevations[0] = model.dis.top.array
     layer_elevations[1:] = model.dis.botm.array
 
-    lakeno = []
-    cellid = []
-    bedleak = []
-    for lake_id in range(1, model.nlakes + 1):
-
-        # get the vertical GWF connections for each lake
-        k, i, j = np.where(model.lakarr == lake_id)
-        # get just the unique i, j locations for each lake
-        i, j = zip(*set(zip(i, j)))
-        # assign vertical connections to the highest active layer
-        k = np.argmax(model.idomain[:, i, j], axis=0)
-        cellid += list(zip(k, i, j))
-        lakeno += [lake_id] * len(k)
-        bedleak += list(bdlknc[i, j])
-
-    df = pd.DataFrame({'lakeno': lakeno,
-                       'cellid': cellid,
-                       'claktype': 'vertical',
-                       'bedleak': bedleak,
-                       'belev': 0.,
-                       'telev': 0.,
-                       'connlen': 0.,
-                       'connwidth': 0.
-                       })
-
-    if include_horizontal_connections:
-        for lake_id in range(1, model.nlakes + 1):
-            lake_extent = model.lakarr == lake_id
-            horizontal_connections = get_horizontal_connections(lake_extent,
-                                                                layer_elevations,
-                                                                model.dis.delr.array,
-                                                                model.dis.delc.array,
-                                                                bdlknc)
-            # drop horizontal connections to inactive cells
-            k, i, j = zip(*horizontal_connections['cellid'])
-            inactive = model.idomain[k, i, j] < 1
-            horizontal_connections = horizontal_connections.loc[~inactive].copy()
-            horizontal_connections['lakeno'] = lake_id
-            df = df.append(horizontal_connections)
-    # assign iconn (connection number) values for each lake
-    dfs = []
-    for lakeno, group in df.groupby('lakeno'):
-        group = group.copy()
-        group['iconn'] = list(range(len(group)))
-        dfs.append(group)
-    df = pd.concat(dfs)
+    df = get_lake_connections(model.lakarr, model.idomain, layer_elevations,
+                              model.dis.delr.array, model.dis.delc.array, bdlknc,
+                              include_horizontal_connections=include_horizontal_connections)
     df['lakeno'] -= 1  # convert to zero-based for mf6
     return df
 
@@ -411,6 +367,148 @@ def get_lakeperioddata(lake_fluxes):
     return lakeperioddata
 
 
+def get_lake_connections(lakarr, idomain, layer_elevations, delr, delc,
+                         bdlknc=None, include_horizontal_connections=True):
+    """Get the vertical and horizontal connections for all lakes
+    in a lake array. Each lake is processed within its bounding box
+    (plus a one cell margin) from :func:`scipy.ndimage.find_objects`,
+    so that the work scales with the size of the lakes instead
+    of the number of lakes times the size of the model grid.
+
+    Parameters
+    ----------
+    lakarr : 3D array of ints
+        Lake extent in each layer; non-zero values are lake numbers (1-based).
+    idomain : 3D array of ints
+        Vertical connections are made to the highest active cell below
+        each lake; horizontal connections to inactive cells are dropped.
+    layer_elevations : np.ndarray
+        Numpy array of cell top and bottom elevations.
+        (shape = nlay + 1, nrow, ncol)
+    delr : 1D array of cell spacings along a model row
+    delc : 1D array of cell spacings along a model column
+    bdlknc : 2D array
+        Array of lakebed leakance values
+        (optional; default=1)
+    include_horizontal_connections : bool
+        Option to include horizontal connections (default True).
+
+    Returns
+    -------
+    df : DataFrame
+        Table of cell connections for the Connectiondata
+        input block in MODFLOW-6, sorted by lake.
+        Columns:
+        lakeno, iconn, cellid, claktype, bedleak, belev, telev, connlen, connwidth
+        (lakeno is 1-based; see MODFLOW-6 io guide for an explanation)
+
+    """
+    nlay, nrow, ncol = lakarr.shape
+    if bdlknc is None:
+        bdlknc = np.ones((nrow, ncol), dtype=float)
+
+    lakeno = []
+    k, i, j, di, dj = [], [], [], [], []
+    for lake_id, slices in enumerate(find_objects(lakarr.astype(int)), start=1):
+        if slices is None:
+            continue
+        # window containing the lake, and the cells next to it
+        layers, rows, cols = slices
+        i0, i1 = max(rows.start - 1, 0), min(rows.stop + 1, nrow)
+        j0, j1 = max(cols.start - 1, 0), min(cols.stop + 1, ncol)
+        lake_extent = lakarr[layers, i0:i1, j0:j1] == lake_id
+
+        # vertical connections at the unique i, j locations of the lake
+        ii, jj = np.nonzero(lake_extent.any(axis=0))
+        nconnections = len(ii)
+        i.append(ii + i0)
+        j.append(jj + j0)
+        k.append(np.zeros(len(ii), dtype=int))
+        di.append(np.zeros(len(ii), dtype=int))
+        dj.append(np.zeros(len(ii), dtype=int))
+
+        if include_horizontal_connections:
+            kh, ih, jh, dih, djh = _get_horizontal_connection_cells(lake_extent)
+            k.append(kh + layers.start)
+            i.append(ih + i0)
+            j.append(jh + j0)
+            di.append(dih)
+            dj.append(djh)
+            nconnections += len(kh)
+        lakeno.append(np.ones(nconnections, dtype=int) * lake_id)
+
+    lakeno, k, i, j, di, dj = [np.concatenate(a) if len(a) > 0 else np.array([], dtype=int)
+                               for a in (lakeno, k, i, j, di, dj)]
+    is_vertical = (di == 0) & (dj == 0)
+    # assign vertical connections to the highest active layer
+    k[is_vertical] = np.argmax(idomain[:, i[is_vertical], j[is_vertical]], axis=0)
+    # drop horizontal connections to inactive cells
+    keep = is_vertical | (idomain[k, i, j] >= 1)
+    lakeno, k, i, j, di, dj, is_vertical = [a[keep] for a in
+                                            (lakeno, k, i, j, di, dj, is_vertical)]
+    df = _get_connection_properties(k, i, j, di, dj, layer_elevations,
+                                    delr, delc, bdlknc)
+    df.loc[is_vertical, 'claktype'] = 'vertical'
+    df.loc[is_vertical, ['belev', 'telev', 'connlen', 'connwidth']] = 0.
+    df.insert(0, 'lakeno', lakeno)
+
+    # assign iconn (connection number) values for each lake
+    # (connections are already grouped by lake)
+    df.insert(1, 'iconn', df.groupby('lakeno').cumcount().values)
+    return df
+
+
+def _get_horizontal_connection_cells(lake_extent):
+    """Get the k, i, j locations of cells along the edge of a lake,
+    and the row and column offsets (di, dj) to the adjacent lake cells.
+    See :func:`get_horizontal_connections`.
+    """
+    lake_extent = lake_extent.astype(float)
+    if len(lake_extent.shape) != 3:
+        lake_extent = np.expand_dims(lake_extent, axis=0)
+
+    k, i, j, di, dj = [], [], [], [], []
+    for klay, lake_extent_k in enumerate(lake_extent):
+        sobel_x = sobel(lake_extent_k, axis=1, mode='constant', cval=0.)
+        sobel_x[lake_extent_k == 1] = 10
+        sobel_y = sobel(lake_extent_k, axis=0, mode='constant', cval=0.)
+        sobel_y[lake_extent_k == 1] = 10
+
+        # right, left, bottom and top face connections
+        faces = [((sobel_x <= -2) & (sobel_x >= -4), (0, -1)),
+                 ((sobel_x >= 2) & (sobel_x <= 4), (0, 1)),
+                 ((sobel_y <= -2) & (sobel_y >= -4), (-1, 0)),
+                 ((sobel_y >= 2) & (sobel_y <= 4), (1, 0))]
+        for is_connection, (row_offset, col_offset) in faces:
+            ii, jj = np.where(is_connection)
+            k.append(np.ones(len(ii), dtype=int) * klay)
+            i.append(ii)
+            j.append(jj)
+            di.append(np.ones(len(ii), dtype=int) * row_offset)
+            dj.append(np.ones(len(ii), dtype=int) * col_offset)
+    return tuple(np.concatenate(a) for a in (k, i, j, di, dj))
+
+
+def _get_connection_properties(k, i, j, di, dj, layer_elevations,
+                               delr, delc, bdlknc):
+    """Make a table of horizontal lake connections from cell locations
+    and the row and column offsets to the adjacent lake cells."""
+    along_row = dj != 0
+    connlen = np.where(along_row,
+                       0.5 * delr[j + dj] + 0.5 * delr[j],
+                       0.5 * delc[i + di] + 0.5 * delc[i])
+    connwidth = np.where(along_row, delc[i], delr[j])
+    df = pd.DataFrame({'cellid': list(zip(k, i, j)),
+                       'claktype': 'horizontal',
+                       'bedleak': bdlknc[i, j],
+                       'belev': layer_elevations[k + 1, i, j],
+                       'telev': layer_elevations[k, i, j],
+                       'connlen': connlen,
+                       'connwidth': connwidth
+                       })
+    return df
+
+
 def get_horizontal_connections(lake_extent, layer_elevations, delr, delc,
                                bdlknc=None):
     """Get cells along the edge of a lake, using the sobel filter method
@@ -443,72 +541,11 @@ def get_horizontal_connections(lake_extent, layer_elevations, delr, delc,
         (see MODFLOW-6 io guide for an explanation)
 
     """
-    lake_extent = lake_extent.astype(float)
-    if len(lake_extent.shape) != 3:
-        lake_extent = np.expand_dims(lake_extent, axis=0)
+    k, i, j, di, dj = _get_horizontal_connection_cells(lake_extent)
     if bdlknc is None:
-        bdlknc = np.ones_like(lake_extent[0], dtype=float)
-
-    cellid = []
-    bedleak = []
-    belev = []
-    telev = []
-    connlen = []
-    connwidth = []
-    for klay, lake_extent_k in enumerate(lake_extent):
-        sobel_x = sobel(lake_extent_k, axis=1, mode='constant', cval=0.)
-        sobel_x[lake_extent_k == 1] = 10
-        sobel_y = sobel(lake_extent_k, axis=0, mode='constant', cval=0.)
-        sobel_y[lake_extent_k == 1] = 10
-
-        # right face connections
-        i, j = np.where((sobel_x <= -2) & (sobel_x >= -4))
-        k = np.ones(len(i), dtype=int) * klay
-        cellid += list(zip(k, i, j))
-        bedleak += list(bdlknc[i, j])
-        belev += list(layer_elevations[k + 1, i, j])
-        telev += list(layer_elevations[k, i, j])
-        connlen += list(0.5 * delr[j - 1] + 0.5 * delr[j])
-        connwidth += list(delc[i])
-
-        # left face connections
-        i, j = np.where((sobel_x >= 2) & (sobel_x <= 4))
-        k = np.ones(len(i), dtype=int) * klay
-        cellid += list(zip(k, i, j))
-        bedleak += list(bdlknc[i, j])
-        belev += list(layer_elevations[k + 1, i, j])
-        telev += list(layer_elevations[k, i, j])
-        connlen += list(0.5 * delr[j + 1] + 0.5 * delr[j])
-        connwidth += list(delc[i])
-
-        # bottom face connections
-        i, j = np.where((sobel_y <= -2) & (sobel_y >= -4))
-        k = np.ones(len(i), dtype=int) * klay
-        cellid += list(zip(k, i, j))
-        bedleak += list(bdlknc[i, j])
-        belev += list(layer_elevations[k + 1, i, j])
-        telev += list(layer_elevations[k, i, j])
-        connlen += list(0.5 * delc[i-1] + 0.5 * delc[i])
-        connwidth += list(delr[j])
-
-        # top face connections
-        i, j = np.where((sobel_y >= 2) & (sobel_y <= 4))
-        k = np.ones(len(i), dtype=int) * klay
-        cellid += list(zip(k, i, j))
-        bedleak += list(bdlknc[i, j])
-        belev += list(layer_elevations[k + 1, i, j])
-        telev += list(layer_elevations[k, i, j])
-        connlen += list(0.5 * delc[i + 1] + 0.5 * delc[i])
-        connwidth += list(delr[j])
-
-    df = pd.DataFrame({'cellid': cellid,
-                       'claktype': 'horizontal',
-                       'bedleak': bedleak,
-                       'belev': belev,
-                       'telev': telev,
-                       'connlen': connlen,
-                       'connwidth': connwidth
-                       })
+        bdlknc = np.ones(lake_extent.shape[-2:], dtype=float)
+    df = _get_connection_properties(k, i, j, di, dj, layer_elevations,
+                                    delr, delc, bdlknc)
     return df
 
 
@@ -596,23 +633,16 @@ class PrismSourceData(SourceData):
         #if endtimes_equal_startimes:
         #    endtimes -= pd.Timedelta(1, unit='d')
 
-        period_data = []
+        # missing (period) keys default to the statistic for the previous period
+        period_stats = []
         current_stat = None
-        for kper, (start, end) in enumerate(zip(starttimes, endtimes)):
-            # missing (period) keys default to 'mean';
-            # 'none' to explicitly skip the stress period
-            period_stat = self.period_stats.get(kper, current_stat)
-            current_stat = period_stat
-            aggregated = aggregate_dataframe_to_stress_period(df,
-                                                              start_datetime=start,
-                                                              end_datetime=end,
-                                                              period_stat=period_stat,
-                                                              id_column=self.id_column,
-                                                              data_column=self.data_columns
-                                                              )
-            aggregated['per'] = kper
-            period_data.append(aggregated)
-        dfm = pd.concat(period_data)
+        for kper in range(len(starttimes)):
+            current_stat = self.period_stats.get(kper, current_stat)
+            period_stats.append(current_stat)
+        dfm = aggregate_dataframe_to_stress_periods(df, starttimes, endtimes,
+                                                    period_stats=period_stats,
+                                                    id_column=self.id_column,
+                                                    data_column=self.data_columns)
         dfm.sort_values(by=['per', self.id_column], inplace=True)
         return dfm.reset_index(drop=True)
 
@@ -9,13 +9,10 @@ import flopy
 fm = flopy.modflow
 mf6 = flopy.mf6
 from flopy.utils.lgrutil import Lgr
-from gisutils import get_values_at_points
-from .discretization import (make_idomain, make_lgr_idomain, deactivate_idomain_above,
-                             find_remove_isolated_cells,
-                             create_vertical_pass_through_cells)
+from .discretization import make_lgr_idomain, build_idomain
 from .fileio import (load, dump, load_cfg,
                      flopy_mfsimulation_load)
-from .grid import MFsetupGrid
+from .grid import MFsetupGrid, get_raster_statistics_for_cells
 from .lakes import (setup_lake_connectiondata, setup_lake_info,
                     setup_lake_tablefiles, setup_lake_fluxes,
                     get_lakeperioddata, setup_mf6_lake_obs)
@@ -46,6 +43,23 @@ class MF6model(MFsetupMixin, mf6.ModflowGwf):
         self._package_setup_order = ['tdis', 'dis', 'ic', 'npf', 'sto', 'rch', 'oc',
                                      'ghb', 'sfr', 'lak',
                                      'wel', 'maw', 'obs', 'ims']
+        # packages that each package depends on (for incremental builds);
+        # the DIS package idomain array excludes lake cells and cells above SFR reaches
+        self._package_dependencies = {'dis': ['lak', 'sfr'],
+                                      'ic': ['dis'],
+                                      'npf': ['dis'],
+                                      'sto': ['tdis', 'dis'],
+                                      'rch': ['tdis', 'dis', 'lak'],
+                                      'oc': ['tdis'],
+                                      'ghb': ['tdis', 'dis'],
+                                      'sfr': ['tdis', 'dis', 'ghb'],
+                                      'lak': ['tdis', 'dis'],
+                                      'wel': ['tdis', 'dis', 'ghb', 'sfr', 'lak'],
+                                      'maw': ['tdis', 'dis'],
+                                      'obs': ['dis', 'ghb', 'sfr', 'lak', 'wel'],
+                                      }
+        # simulation-level packages are always set up
+        self._always_rebuild = {'tdis', 'ims'}
         self.cfg = load(self.source_path + self.default_file) #'/mf6_defaults.yml')
         self.cfg['filename'] = self.source_path + self.default_file #'/mf6_defaults.yml'
         self._set_cfg(cfg)   # set up the model configuration dictionary
@@ -95,37 +109,35 @@ class MF6model(MFsetupMixin, mf6.ModflowGwf):
         """Remake the idomain array from the source data,
         no data values in the top and bottom arrays, and
         so that cells above SFR reaches are inactive."""
+        # cells that conincide with lakes
+        inactive = np.zeros(self.dis.idomain.array.shape, dtype=bool)
+        if self.isbc is not None:
+            inactive |= (self.isbc == 1)
         # loop thru LGR models and inactivate area of parent grid for each one
-        lgr_idomain = np.ones(self.dis.idomain.array.shape, dtype=int)
         if isinstance(self.lgr, dict):
             for k, v in self.lgr.items():
-                lgr_idomain[v.idomain == 0] = 0
-        idomain_from_layer_elevations = make_idomain(self.dis.top.array,
-                                                     self.dis.botm.array,
-                                                     nodata=self._nodata_value,
-                                                     minimum_layer_thickness=self.cfg['dis'].get('minimum_layer_thickness', 1),
-                                                     drop_thin_cells=self._drop_thin_cells,
-                                                     tol=1e-4)
-        # include cells that are active in the existing idomain array
-        # and cells inactivated on the basis of layer elevations
-        idomain = (self.dis.idomain.array == 1) & \
-                  (idomain_from_layer_elevations == 1) & \
-                  (lgr_idomain == 1)
-        idomain = idomain.astype(int)
-
-        # remove cells that conincide with lakes
-        idomain[self.isbc == 1] = 0.
+                inactive |= (v.idomain == 0)
 
         # remove cells that are above stream cells
+        sfr_packagedata = None
         if 'SFR' in self.get_package_list():
-            idomain = deactivate_idomain_above(idomain, self.sfr.packagedata)
-
-        # inactivate any isolated cells that could cause problems with the solution
-        idomain = find_remove_isolated_cells(idomain, minimum_cluster_size=20)
+            sfr_packagedata = self.sfr.packagedata
 
+        # include cells that are active in the existing idomain array
+        # and cells inactivated on the basis of layer elevations;
+        # inactivate any isolated cells that could cause problems with the solution;
         # create pass-through cells in inactive cells that have an active cell above and below
         # by setting these cells to -1
-        idomain = create_vertical_pass_through_cells(idomain)
+        idomain = build_idomain(self.dis.top.array,
+                                self.dis.botm.array,
+                                idomain=self.dis.idomain.array,
+                                inactive=inactive,
+                                sfr_packagedata=sfr_packagedata,
+                                nodata=self._nodata_value,
+                                minimum_layer_thickness=self.cfg['dis'].get('minimum_layer_thickness', 1),
+                                drop_thin_cells=self._drop_thin_cells,
+                                tol=1e-4,
+                                minimum_cluster_size=20)
 
         self._idomain = idomain
 
@@ -275,22 +287,12 @@ class MF6model(MFsetupMixin, mf6.ModflowGwf):
         # TODO: this should reference namfile dict
         return [p.name[0].upper() for p in self.packagelist]
 
-    def get_raster_values_at_cell_centers(self, raster, out_of_bounds_errors='coerce'):
-        """Sample raster values at centroids
-        of model grid cells."""
-        values = get_values_at_points(raster,
-                                      x=self.modelgrid.xcellcenters.ravel(),
-                                      y=self.modelgrid.ycellcenters.ravel(),
-                                      out_of_bounds_errors=out_of_bounds_errors)
-        if self.modelgrid.grid_type == 'structured':
-            values = np.reshape(values, (self.nrow, self.ncol))
-        return values
-
-    def get_raster_statistics_for_cells(self, top, stat='mean'):
+    def get_raster_statistics_for_cells(self, raster, stat='mean', all_touched=False):
         """Compute zonal statics for raster pixels within
-        each model cell.
+        each model cell (see :func:`mfsetup.grid.get_raster_statistics_for_cells`).
         """
-        raise NotImplementedError()
+        return get_raster_statistics_for_cells(self.modelgrid, raster, stat=stat,
+                                               all_touched=all_touched)
 
     def create_lgr_models(self):
         for k, v in self.cfg['setup_grid']['lgr'].items():
@@ -795,6 +797,7 @@ class MF6model(MFsetupMixin, mf6.ModflowGwf):
                   inset_parent_period_mapping=self.parent_stress_periods)
 
         df = tmr.get_inset_boundary_heads()
+        tmr.close()
 
         spd = {}
         by_period = df.groupby('per')
@@ -815,6 +818,7 @@ class MF6model(MFsetupMixin, mf6.ModflowGwf):
         """Same syntax as MODFLOW-2005 flopy
         """
         self.simulation.write_simulation()
+        self.write_build_state()
 
     @staticmethod
     def _parse_model_kwargs(cfg):
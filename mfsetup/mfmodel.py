@@ -1,4 +1,5 @@
 import os
+import json
 import time
 from collections import defaultdict
 import numpy as np
@@ -6,14 +7,16 @@ import pandas as pd
 import flopy
 fm = flopy.modflow
 mf6 = flopy.mf6
-from gisutils import (shp2df, get_values_at_points, project, get_proj_str)
+from gisutils import (shp2df, project, get_proj_str)
 from .bcs import get_bc_package_cells
-from .grid import MFsetupGrid, get_ij, setup_structured_grid, rasterize
+from .grid import MFsetupGrid, get_ij, setup_structured_grid, rasterize, RasterSampler
 from .fileio import load, dump, load_array, save_array, check_source_files, flopy_mf2005_load, \
-    load_cfg, setup_external_filepaths
-from .utils import update, get_input_arguments
-from .interpolate import interp_weights, interpolate, regrid, get_source_dest_model_xys
+    load_cfg, setup_external_filepaths, load_cached_features, cache_features, \
+    get_config_fingerprint
+from .utils import update, get_input_arguments, get_packages_to_rebuild
+from .interpolate import Interpolator, interpolate, regrid, get_source_dest_model_xys
 from .lakes import make_lakarr2d, setup_lake_info, setup_lake_fluxes
+from .profiling import Profiler
 from .utils import update, get_packages, get_input_arguments
 from .sourcedata import setup_array
 from .tdis import (setup_perioddata_group, setup_perioddata,
@@ -64,6 +67,7 @@ class MFsetupMixin():
         self._lake_bathymetry = None
         self._lake_recharge = None
         self._nodata_value = -9999
+        self._build_state = None
         self._model_ws = None
         self._abs_model_ws = None
         self.inset = None  # LGR model(s)
@@ -81,7 +85,16 @@ class MFsetupMixin():
         self.updated_arrays = set()
 
         # cache of interpolation weights to speed up regridding
-        self._interp_weights = None
+        self._interpolator = None
+
+        # cache of raster data and pixel locations for sampling rasters
+        self._raster_sampler = None
+
+        # cache of boundary condition package cell locations
+        self._bc_package_cells = {}
+
+        # time (and memory usage) of each stage of the model build
+        self.profiler = Profiler()
 
     def __repr__(self):
         header = '{} model:\n'.format(self.name)
@@ -277,6 +290,36 @@ class MFsetupMixin():
             tmpdir = os.path.normpath(abspath)
         return tmpdir
 
+    @property
+    def n_workers(self):
+        """Number of workers for processing array data
+        by layer or stress period (1 for serial processing)."""
+        return self.cfg['model'].get('n_workers', 1)
+
+    @property
+    def interp_weights_cache(self):
+        """Folder for caching interpolation weights between
+        setup runs (None if caching is turned off)."""
+        if not self.cfg['intermediate_data'].get('cache_interp_weights', True):
+            return
+        return os.path.join(self.tmpdir, 'interp_weights')
+
+    @property
+    def rasterize_cache(self):
+        """Folder for caching rasterized features (e.g. lake extents)
+        between setup runs (None if caching is turned off)."""
+        if not self.cfg['intermediate_data'].get('cache_rasterized_features', True):
+            return
+        return os.path.join(self.tmpdir, 'rasterized')
+
+    @property
+    def features_cache(self):
+        """Folder for caching shapefile features (within the model area,
+        in the model CRS) between setup runs (None if caching is turned off)."""
+        if not self.cfg['intermediate_data'].get('cache_features', True):
+            return
+        return os.path.join(self.tmpdir, 'features')
+
     @property
     def external_path(self):
         abspath = os.path.abspath(
@@ -293,15 +336,31 @@ class MFsetupMixin():
     def external_path(self, x):
         pass # bypass any setting in parent class
 
+    @property
+    def interpolator(self):
+        """For a given parent, only triangulate the parent model cell centers
+        once to speed up re-gridding of arrays to pfl_nwt."""
+        if self._interpolator is None:
+            parent_xy, inset_xy = get_source_dest_model_xys(self.parent,
+                                                            self)
+            self._interpolator = Interpolator(parent_xy, inset_xy,
+                                              cache_dir=self.interp_weights_cache)
+        return self._interpolator
+
+    @property
+    def raster_sampler(self):
+        """For a given model grid, only read the raster window(s)
+        covering the grid and locate the cell centers once
+        to speed up repeated sampling of the same rasters."""
+        if self._raster_sampler is None:
+            self._raster_sampler = RasterSampler(self.modelgrid)
+        return self._raster_sampler
+
     @property
     def interp_weights(self):
         """For a given parent, only calculate interpolation weights
         once to speed up re-gridding of arrays to pfl_nwt."""
-        if self._interp_weights is None:
-            parent_xy, inset_xy = get_source_dest_model_xys(self.parent,
-                                                                        self)
-            self._interp_weights = interp_weights(parent_xy, inset_xy)
-        return self._interp_weights
+        return self.interpolator.weights
 
     @property
     def parent_mask(self):
@@ -420,14 +479,50 @@ class MFsetupMixin():
             return np.array(arrays)
         return load_array(filename, shape=(self.nrow, self.ncol))
 
+    def get_bc_package_cells(self, package):
+        """Get the k, i, j locations of the cells in a boundary
+        condition package (see :func:`mfsetup.bcs.get_bc_package_cells`).
+        The locations are cached until the package changes: if the package
+        is replaced (for example, by calling the package setup method again),
+        if the stress period recarrays of an MfList are replaced or
+        resized, or if the boundary condition arrays are reset
+        (see :meth:`_reset_bc_arrays`).
+        """
+        # cheap check for changes to the stress period data
+        # (recarrays that were replaced, or resized)
+        token = None
+        spd = getattr(package, 'stress_period_data', None)
+        if isinstance(spd, flopy.utils.MfList):
+            token = tuple((per, id(recs), len(recs) if hasattr(recs, 'dtype') else recs)
+                          for per, recs in spd.data.items())
+        cached_package, cached_token, cells = \
+            self._bc_package_cells.get(package.name[0], (None, None, None))
+        if package is not cached_package or token != cached_token:
+            cells = get_bc_package_cells(package)
+            self._bc_package_cells[package.name[0]] = (package, token, cells)
+        return tuple(a.copy() for a in cells)
+
+    def get_raster_values_at_cell_centers(self, raster, out_of_bounds_errors='coerce'):
+        """Sample raster values at centroids
+        of model grid cells (see :class:`mfsetup.grid.RasterSampler`)."""
+        return self.raster_sampler.get_values_at_cell_centers(
+            raster, out_of_bounds_errors=out_of_bounds_errors)
+
     def load_features(self, filename, filter=None,
                       id_column=None, include_ids=None,
                       cache=True):
         """Load vector and attribute data from a shapefile;
         cache it to the _features dictionary.
+
+        The features within the model area (after reprojection
+        to the model CRS) are also cached to disk (see :attr:`features_cache`),
+        so that later setup runs, or other models with areas inside of
+        this model's area, don't have to read and reproject the shapefile again.
         """
         if isinstance(filename, str):
             features_file = [filename]
+        else:
+            features_file = filename
 
         dfs_list = []
         for f in features_file:
@@ -448,10 +543,23 @@ class MFsetupMixin():
                         else:
                             filter = bbox.bounds
 
-                    df = shp2df(f, filter=filter)
-                    df.columns = [c.lower() for c in df.columns]
-                    if features_proj_str.lower() != model_proj_str:
-                        df['geometry'] = project(df['geometry'], features_proj_str, model_proj_str)
+                    df = None
+                    if self.features_cache is not None:
+                        df = load_cached_features(self.features_cache, f,
+                                                  features_proj_str, model_proj_str,
+                                                  filter=filter)
+                    if df is None:
+                        df = shp2df(f, filter=filter)
+                        df.columns = [c.lower() for c in df.columns]
+                        features_bounds = np.array([g.bounds if g is not None and not g.is_empty
+                                                    else (np.nan,) * 4
+                                                    for g in df.geometry])
+                        if features_proj_str.lower() != model_proj_str:
+                            df['geometry'] = project(df['geometry'], features_proj_str, model_proj_str)
+                        if self.features_cache is not None:
+                            cache_features(self.features_cache, df, f,
+                                           features_proj_str, model_proj_str,
+                                           features_bounds, filter=filter)
                     if cache:
                         print('caching data in {}...'.format(f))
                         self._features[f] = df
@@ -528,6 +636,12 @@ class MFsetupMixin():
             Interpolation method.
         """
         if mask is not None:
+            mask = mask.astype(bool)
+            # reuse the cached triangulation if the mask is within the parent model window
+            if method == 'linear' and not np.any(mask & ~self.parent_mask):
+                regridded = self.interpolator.interpolate(parent_array[self.parent_mask],
+                                                          valid=mask[self.parent_mask])
+                return np.reshape(regridded, (self.nrow, self.ncol))
             return regrid(parent_array, self.parent.modelgrid, self.modelgrid,
                           mask1=mask,
                           method=method)
@@ -612,6 +726,7 @@ class MFsetupMixin():
         self._lake_bathymetry = None # (depends on _isbc2d)
         self._isbc = None #  (depends on _isbc2d)
         self._lakarr = None #
+        self._bc_package_cells = {}
         #self._set_lakarr2d() # calls self._set_isbc2d(), which calls self._set_lake_bathymetry()
         #self._set_isbc() # calls self._set_lakarr()
 
@@ -680,14 +795,15 @@ class MFsetupMixin():
                 kwargs.pop('include_ids')  # load all lakes in shapefile
                 lakesdata = self.load_features(**kwargs)
             if lakesdata is not None:
-                isanylake = rasterize(lakesdata, self.modelgrid)
+                isanylake = rasterize(lakesdata, self.modelgrid,
+                                      cache_dir=self.rasterize_cache)
                 isbc[isanylake > 0] = 2
                 isbc[self._lakarr2d > 0] = 1
             # add other bcs
             for packagename, bcnumber in self.bc_numbers.items():
                 if packagename.upper() in self.get_package_list() and packagename != 'lak':
                     package = getattr(self, packagename)
-                    k, i, j = get_bc_package_cells(package)
+                    k, i, j = self.get_bc_package_cells(package)
                     not_a_lake = np.where(isbc[i, j] != 1)
                     i = i[not_a_lake]
                     j = j[not_a_lake]
@@ -711,7 +827,7 @@ class MFsetupMixin():
                 if packagename.upper() in self.get_package_list() and packagename != 'lak':
                     package = getattr(self, packagename)
                     #try:
-                    k, i, j = get_bc_package_cells(package)
+                    k, i, j = self.get_bc_package_cells(package)
                     not_a_lake = np.where(isbc[k, i, j] != 1)
                     k = k[not_a_lake]
                     i = i[not_a_lake]
@@ -746,7 +862,8 @@ class MFsetupMixin():
                     lakesdata = self.load_features(**lakes_shapefile)  # caches loaded features
                     lakes_shapefile['lakesdata'] = lakesdata
                     lakes_shapefile.pop('filename')
-                    lakarr2d = make_lakarr2d(self.modelgrid, **lakes_shapefile)
+                    lakarr2d = make_lakarr2d(self.modelgrid, **lakes_shapefile,
+                                             cache_dir=self.rasterize_cache)
             self._lakarr_2d = lakarr2d
             self._set_isbc2d()
 
@@ -773,11 +890,9 @@ class MFsetupMixin():
                 bathymetry_file = bathymetry_file['filename']
 
             # sample pre-made bathymetry at grid points
-            bathy = get_values_at_points(bathymetry_file,
-                                         x=self.modelgrid.xcellcenters.ravel(),
-                                         y=self.modelgrid.ycellcenters.ravel(),
-                                         out_of_bounds_errors='coerce')
-            bathy = np.reshape(bathy, (self.nrow, self.ncol)) * lmult
+            bathy = self.get_raster_values_at_cell_centers(bathymetry_file,
+                                                           out_of_bounds_errors='coerce')
+            bathy = bathy * lmult
             bathy[(bathy < 0) | np.isnan(bathy)] = 0
 
             # fill bathymetry grid in remaining lake cells with default lake depth
@@ -889,9 +1004,10 @@ class MFsetupMixin():
     def _setup_array(self, package, var, vmin=-1e30, vmax=1e30,
                       source_model=None, source_package=None,
                       **kwargs):
-        return setup_array(self, package, var, vmin=vmin, vmax=vmax,
-                           source_model=source_model, source_package=source_package,
-                           **kwargs)
+        with self.profiler.stage('{}.{}'.format(package, var), category='variable'):
+            return setup_array(self, package, var, vmin=vmin, vmax=vmax,
+                               source_model=source_model, source_package=source_package,
+                               **kwargs)
 
     def setup_grid(self):
         """Set up the attached modelgrid instance from configuration input
@@ -916,6 +1032,7 @@ class MFsetupMixin():
         kwargs = get_input_arguments(cfg, setup_structured_grid)
         self._modelgrid = setup_structured_grid(**kwargs)
         self.cfg['grid'] = self._modelgrid.cfg
+        self._raster_sampler = None
         self._reset_bc_arrays()
 
         # set up local grid refinement
@@ -1081,11 +1198,146 @@ class MFsetupMixin():
         print("finished in {:.2f}s\n".format(time.time() - t0))
         return sfr_package
 
-    def setup_packages(self, reset_existing=True):
+    @property
+    def build_state_file(self):
+        """JSON file recording the input fingerprints and output files
+        of each package from the last (incremental) build."""
+        return os.path.join(self._abs_model_ws,
+                            self.cfg['model']['build_state_file'].format(self.name))
+
+    def get_package_fingerprint(self, package):
+        """Get a hash identifying the input to a package setup method:
+        the configuration settings (and source files) for the package,
+        and the settings shared by all packages (model, grid, parent model
+        and simulation). The package with the time discretization
+        (TDIS, or DIS for MODFLOW-2005/NWT) is also identified by the
+        stress period data. Changes to the input of upstream packages
+        are handled separately (see :meth:`setup_packages`).
+        """
+        intermediate_data = {k: v for k, v in self.cfg['intermediate_data'].items()
+                             if not isinstance(v, (dict, list))}
+        inputs = {package: self.cfg.get(package, {}),
+                  'model': self.cfg['model'],
+                  'setup_grid': self.cfg['setup_grid'],
+                  'parent': self.cfg.get('parent'),
+                  'simulation': self.cfg.get('simulation'),
+                  'intermediate_data': intermediate_data}
+        if package == 'tdis' or (package == 'dis' and self.version != 'mf6'):
+            inputs['perioddata'] = pd.util.hash_pandas_object(self.perioddata,
+                                                              index=True).values
+        return get_config_fingerprint(inputs)
+
+    def _get_package_build_state(self, package, cfg_before):
+        """Record the input file written for a package, and the
+        configuration entries added by the package setup method,
+        so that the package can be reloaded in a later incremental build."""
+        package_instance = getattr(self, package)
+        if isinstance(package_instance, list):
+            package_instance = package_instance[0]
+        if self.version == 'mf6':
+            filename = package_instance.filename
+            package_name = package_instance.package_name
+        else:
+            filename = package_instance.file_name[0]
+            package_name = package
+        cfg = {}
+        for key in package, 'intermediate_data', 'external_files':
+            cfg[key] = {}
+            for k, v in self.cfg.get(key, {}).items():
+                if key != package and cfg_before[key].get(k) is v:
+                    continue
+                # only configuration entries that can be written to JSON
+                # (e.g. file paths) are restored
+                try:
+                    json.dumps(v)
+                    cfg[key][k] = v
+                except TypeError:
+                    continue
+        return {'filename': filename, 'package_name': package_name, 'cfg': cfg}
+
+    def _reload_package(self, package, build_state):
+        """Load a package from the input file written by the last build,
+        instead of setting it up again."""
+        print('\nloading {} package from {} (inputs unchanged since last build)...'.format(
+            package.upper(), build_state['filename']))
+        t0 = time.time()
+        filename = build_state['filename']
+        if self.version == 'mf6':
+            self.load_package(package, filename, build_state['package_name'], True, None)
+        else:
+            package_class = self.mfnam_packages[package]
+            kwargs = get_input_arguments({'check': False}, package_class.load, warn=False)
+            package_class.load(os.path.join(self._abs_model_ws, filename), self, **kwargs)
+
+        # restore the configuration entries added by the setup method
+        for key, cfg in build_state['cfg'].items():
+            self.cfg[key].update(cfg)
+
+        # reset dependent attributes and arrays
+        # (the idomain or ibound array written by the last build is already final)
+        if package == 'dis':
+            self._perioddata = None
+            self.setup_grid()
+            if self.version == 'mf6':
+                self._idomain = self.dis.idomain.array
+        elif package == 'bas6':
+            self._ibound = self.bas6.ibound.array
+        if package in self.bc_numbers or package in {'dis', 'bas6'}:
+            self._reset_bc_arrays()
+        print("finished in {:.2f}s\n".format(time.time() - t0))
+
+    def setup_packages(self, reset_existing=True, incremental=None):
+        """Set up the packages listed in the configuration file.
+
+        Parameters
+        ----------
+        reset_existing : bool
+            If False, skip packages that have already been set up.
+            (default True)
+        incremental : bool
+            Option to only set up packages whose input has changed since the
+            last build, or that depend on packages whose input has changed
+            (see _package_dependencies); unchanged packages are loaded from the
+            MODFLOW input files written by the last build. Simulation-level
+            packages (see _always_rebuild) are always set up, but only count
+            as changed if their input changed. The input fingerprint
+            (see :meth:`get_package_fingerprint`) and input file for each package
+            are recorded in the :attr:`build_state_file` when the input files
+            are written (see :meth:`write_build_state`). By default, the
+            model: incremental_build: setting in the configuration file is used.
+        """
         package_list = self.package_list #['sfr'] #m.package_list # ['tdis', 'dis', 'npf', 'oc']
         if not reset_existing:
             package_list = [p for p in package_list if p.upper() not in self.get_package_list()]
+        if incremental is None:
+            incremental = self.cfg['model'].get('incremental_build', False)
+
+        rebuild = package_list
+        build_state = {}
+        if incremental:
+            # fingerprint the input to all packages before
+            # any of the setup methods modify the configuration
+            fingerprints = {pkg: self.get_package_fingerprint(pkg) for pkg in package_list}
+            if os.path.exists(self.build_state_file):
+                build_state = load(self.build_state_file)
+            changed = set()
+            for pkg in package_list:
+                last_build = build_state.get(pkg, {})
+                if last_build.get('fingerprint') != fingerprints[pkg]:
+                    changed.add(pkg)
+                elif pkg not in self._always_rebuild and \
+                        not self._is_current_input_file(last_build):
+                    changed.add(pkg)
+            rebuild = get_packages_to_rebuild(package_list, self._package_dependencies, changed)
+            rebuild = [pkg for pkg in package_list
+                       if pkg in rebuild or pkg in self._always_rebuild]
+            print('\nincremental build; setting up packages: {}'.format(', '.join(rebuild)))
+
         for pkg in package_list:
+            if pkg not in rebuild:
+                with self.profiler.stage('load_{}'.format(pkg), category='package'):
+                    self._reload_package(pkg, build_state[pkg])
+                continue
             setup_method_name = 'setup_{}'.format(pkg)
             package_setup = getattr(self, setup_method_name, None)
             if package_setup is None:
@@ -1093,7 +1345,104 @@ class MFsetupMixin():
                 continue
             if not callable(package_setup):
                 package_setup = getattr(MFsetupMixin, 'setup_{}'.format(pkg.strip('6')))
-            package_setup()
+            if incremental:
+                cfg_before = {key: dict(self.cfg.get(key, {})) for key in
+                              ['intermediate_data', 'external_files']}
+            with self.profiler.stage(setup_method_name, category='package'):
+                package_setup()
+            if incremental:
+                if pkg in self._always_rebuild:
+                    build_state[pkg] = {}
+                elif pkg.upper() in self.get_package_list():
+                    build_state[pkg] = self._get_package_build_state(pkg, cfg_before)
+                else:
+                    continue
+                build_state[pkg]['fingerprint'] = fingerprints[pkg]
+        if incremental:
+            # the build state is written with the input files
+            self._build_state = build_state
+
+    def _get_package_files(self, build_state):
+        """Get the input file for a package, and the external array
+        and intermediate data files recorded in its build state
+        (as absolute paths)."""
+        files = []
+
+        def append_files(value):
+            if isinstance(value, str):
+                files.append(value)
+            elif isinstance(value, dict):
+                for v in value.values():
+                    append_files(v)
+            elif isinstance(value, list):
+                for v in value:
+                    append_files(v)
+
+        append_files(build_state['filename'])
+        for key in 'intermediate_data', 'external_files':
+            append_files(build_state['cfg'].get(key, {}))
+        return [os.path.normpath(os.path.join(self._abs_model_ws, f)) for f in files]
+
+    def _is_current_input_file(self, build_state):
+        """Check that the input file for a package, and its external array
+        and intermediate data files, are the ones that were written with
+        the build state (and haven't been changed or removed since)."""
+        if 'filename' not in build_state or 'files' not in build_state:
+            return False
+        for filename, (mtime, size) in build_state['files'].items():
+            filename = os.path.join(self._abs_model_ws, filename)
+            if not os.path.exists(filename):
+                return False
+            stat = os.stat(filename)
+            if stat.st_mtime != mtime or stat.st_size != size:
+                return False
+        return True
+
+    def write_build_state(self):
+        """Write the input fingerprints, input files, and external array
+        and intermediate data files (with their modification times and sizes)
+        for each package from the last incremental build to the
+        :attr:`build_state_file`. Called by write_input after the input files
+        are written, so that the build state is only updated for complete builds.
+        """
+        if self._build_state is None:
+            return
+        for pkg, state in self._build_state.items():
+            if 'filename' not in state:
+                continue
+            state['files'] = {}
+            for filename in self._get_package_files(state):
+                if os.path.exists(filename):
+                    stat = os.stat(filename)
+                    relpath = os.path.relpath(filename, self._abs_model_ws)
+                    state['files'][relpath] = [stat.st_mtime, stat.st_size]
+        dump(self.build_state_file, self._build_state)
+
+    @property
+    def profile_file(self):
+        """JSON or CSV file with the time spent in each
+        stage of the model build (see :meth:`write_profile`)."""
+        profile_file = self.cfg['model'].get('profile_file')
+        if profile_file is None:
+            return
+        return os.path.join(self._abs_model_ws, profile_file.format(self.name))
+
+    def write_profile(self, filename=None):
+        """Write the number of calls, wall time, CPU time and
+        memory usage for each stage of the model build
+        (package and array setup, regridding, file I/O, etc.)
+        recorded by the model :attr:`profiler`.
+
+        Parameters
+        ----------
+        filename : str
+            JSON (.json extension) or CSV file.
+            By default, the :attr:`profile_file` is written.
+        """
+        if filename is None:
+            filename = self.profile_file
+        if filename is not None:
+            self.profiler.write(filename)
 
     @classmethod
     def load_cfg(cls, yamlfile, verbose=False):
@@ -1145,33 +1494,42 @@ class MFsetupMixin():
         """
         print('\nSetting up {} model from data in {}\n'.format(cfg['model']['modelname'], None))
         t0 = time.time()
-        cfg = cls._parse_model_kwargs(cfg)
-        kwargs = get_input_arguments(cfg['model'], mf6.ModflowGwf,
-                                     exclude='packages')
-        m = cls(cfg=cfg, **kwargs)
-
-        # make a grid if one isn't already specified
-        if 'grid' not in m.cfg.keys():
-            m.setup_grid()
-
-        # establish time discretization, including TDIS setup for MODFLOW-6
-        m.setup_tdis()
-
-        # set up all of the packages specified in the config file
-        m.setup_packages(reset_existing=False)
-
-        # perimter boundary for TMR model
-        if m.perimeter_bc_type == 'head':
-            chd = m.setup_perimeter_boundary()
-
-        # LGR inset model(s)
-        if m.inset is not None:
-            for k, v in m.inset.items():
-                if v._is_lgr:
-                    v.setup_packages()
-            m.setup_lgr_exchanges()
+        profiler = Profiler()
+        with profiler.stage('setup_from_cfg', category='model'):
+            cfg = cls._parse_model_kwargs(cfg)
+            kwargs = get_input_arguments(cfg['model'], mf6.ModflowGwf,
+                                         exclude='packages')
+            m = cls(cfg=cfg, **kwargs)
+            # the model profiler also records
+            # the model initialization (e.g. loading the parent model)
+            m.profiler = profiler
+
+            # make a grid if one isn't already specified
+            if 'grid' not in m.cfg.keys():
+                with profiler.stage('setup_grid', category='grid'):
+                    m.setup_grid()
+
+            # establish time discretization, including TDIS setup for MODFLOW-6
+            with profiler.stage('setup_tdis', category='package'):
+                m.setup_tdis()
+
+            # set up all of the packages specified in the config file
+            m.setup_packages(reset_existing=False)
+
+            # perimter boundary for TMR model
+            if m.perimeter_bc_type == 'head':
+                with profiler.stage('setup_perimeter_boundary', category='package'):
+                    chd = m.setup_perimeter_boundary()
+
+            # LGR inset model(s)
+            if m.inset is not None:
+                for k, v in m.inset.items():
+                    if v._is_lgr:
+                        v.setup_packages()
+                m.setup_lgr_exchanges()
 
         print('finished setting up model in {:.2f}s'.format(time.time() - t0))
+        m.write_profile()
         print('\n{}'.format(m))
         return m
 
@@ -47,6 +47,23 @@ class MFnwtModel(MFsetupMixin, Modflow):
         self._package_setup_order = ['dis', 'bas6', 'upw', 'rch', 'oc',
                                      'ghb', 'lak', 'sfr', 'wel', 'mnw2',
                                      'gag', 'hyd', 'nwt']
+        # packages that each package depends on (for incremental builds);
+        # the DIS package layer bottoms are adjusted for lakes, and the BAS6 package
+        # ibound array excludes cells above SFR reaches and GHB cells
+        self._package_dependencies = {'dis': ['lak'],
+                                      'bas6': ['dis', 'lak', 'sfr', 'ghb'],
+                                      'upw': ['dis', 'lak'],
+                                      'rch': ['dis', 'lak'],
+                                      'oc': ['dis'],
+                                      'ghb': ['dis', 'bas6'],
+                                      'lak': ['dis', 'bas6'],
+                                      'sfr': ['dis', 'bas6', 'ghb', 'lak'],
+                                      'wel': ['dis', 'bas6', 'ghb', 'lak', 'sfr'],
+                                      'mnw2': ['dis', 'bas6'],
+                                      'gag': ['lak', 'sfr'],
+                                      'hyd': ['dis', 'bas6'],
+                                      }
+        self._always_rebuild = set()
         # default configuration (different for nwt vs mf6)
         self.cfg = load(self.source_path + self.default_file) # '/mfnwt_defaults.yml')
         self.cfg['filename'] = self.source_path + self.default_file #'/mfnwt_defaults.yml'
@@ -553,7 +570,8 @@ class MFnwtModel(MFsetupMixin, Modflow):
 
         # make the arrays or load them
         lakzones = make_bdlknc_zones(self.modelgrid, self.lake_info,
-                                     include_ids=self.lake_info['feat_id'])
+                                     include_ids=self.lake_info['feat_id'],
+                                     cache_dir=self.rasterize_cache)
         save_array(self.cfg['intermediate_data']['lakzones'][0], lakzones, fmt='%d')
 
         bdlknc = np.zeros((self.nlay, self.nrow, self.ncol))
@@ -740,6 +758,7 @@ class MFnwtModel(MFsetupMixin, Modflow):
                   inset_parent_period_mapping=self.parent_stress_periods)
 
         df = tmr.get_inset_boundary_heads()
+        tmr.close()
 
         spd = {}
         by_period = df.groupby('per')
@@ -763,6 +782,13 @@ class MFnwtModel(MFsetupMixin, Modflow):
         print("finished in {:.2f}s\n".format(time.time() - t0))
         return chd
 
+    def write_input(self, SelPackList=False, check=False):
+        """Write the input files (see flopy.modflow.Modflow.write_input),
+        and the build state for incremental builds.
+        """
+        super().write_input(SelPackList=SelPackList, check=check)
+        self.write_build_state()
+
     @staticmethod
     def _parse_model_kwargs(cfg):
         return cfg
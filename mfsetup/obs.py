@@ -1,8 +1,7 @@
 import numpy as np
 import pandas as pd
-from shapely.geometry import Point
 from .fileio import check_source_files
-from .grid import get_ij
+from .grid import get_ij, get_points_within
 
 
 def read_observation_data(f=None, column_info=None,
@@ -109,8 +108,7 @@ def setup_head_observations(model, obs_info_files=None,
     df = pd.concat(dfs, axis=0)
 
     print('\nCulling observations to model area...')
-    df['geometry'] = [Point(x, y) for x, y in zip(df.x, df.y)]
-    within = [g.within(self.bbox) for g in df.geometry]
+    within = get_points_within(df.x.values, df.y.values, self.bbox)
     df = df.loc[within].copy()
 
     print('Dropping head observations that coincide with Lake Package Lakes...')
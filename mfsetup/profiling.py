@@ -0,0 +1,295 @@
+"""
+Functions and classes for recording the time spent
+in each stage of a model build
+"""
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+import pandas as pd
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def get_rss():
+    """Get the current resident set size (memory usage)
+    of the current process, in megabytes. Returns None if
+    it can't be determined (on platforms other than Linux,
+    psutil is needed)."""
+    try:
+        with open('/proc/self/statm') as src:
+            pages = int(src.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024**2
+    except ImportError:
+        return None
+
+
+def get_peak_rss():
+    """Get the peak resident set size (high-water mark of memory usage)
+    of the current process, in megabytes. Returns None
+    on platforms without the resource module (Windows)."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    if sys.platform == 'darwin':
+        return maxrss / 1024**2
+    return maxrss / 1024
+
+
+class Profiler:
+    """Registry of timing information for named stages
+    of a model build (e.g. package setup, array setup,
+    regridding or file I/O).
+
+    For each stage, the number of calls, the total wall time
+    and CPU time, and the memory usage (resident set size) are recorded:
+
+    * rss_delta: total change in the current memory usage
+      (memory retained by the stage; negative if memory was freed)
+    * peak_rss_increase: total increase in the process high-water mark
+      of memory usage. This is zero for calls that don't set a new
+      peak, so it only shows the stages responsible for raising the
+      peak memory usage of the build (not the memory that each stage uses).
+    * peak_rss: high-water mark of memory usage at the end of the stage
+
+    Stages can be nested; the time spent (and memory retained)
+    in a nested stage is also included in the enclosing stage.
+    While a stage is running, the profiler is active: stages
+    recorded with the module-level :func:`stage` and :func:`timed`
+    helpers (e.g. in the regridding and file I/O functions)
+    are recorded to it (see :func:`get_profiler`). Each model
+    has its own profiler (see ``MFsetupMixin.profiler``).
+
+    Parameters
+    ----------
+    callback : callable, optional
+        Function that is called with a dictionary
+        describing each stage (name, category, start, wall_time, cpu_time,
+        rss_delta, peak_rss_increase, peak_rss) as it finishes,
+        for example to stream the events to a log or monitoring service.
+    enabled : bool
+        Option to record stages (default True).
+    memory : bool
+        Option to record the memory usage of each stage (default True).
+        Sampling the memory usage requires reading /proc/self/statm
+        and calling getrusage at the start and end of each stage,
+        so it can be turned off for stages that are called many times
+        (see the memory argument to :meth:`stage`).
+
+    Notes
+    -----
+    CPU time and memory usage are for the whole process,
+    so for stages that run concurrently in threads, they
+    include the time spent (and memory used) in the other threads.
+    Stages run in subprocesses (e.g. by :func:`mfsetup.utils.parallel_map`
+    with processes=True) are not recorded.
+
+    Examples
+    --------
+    >>> from mfsetup.profiling import Profiler, timed
+    >>> profiler = Profiler()
+    >>> @timed(category='io')
+    ... def load_data(filename):
+    ...     pass
+    >>> with profiler.stage('setup_dis', category='package'):
+    ...     load_data('botm.dat')
+    >>> profiler.to_dataframe()
+    """
+    def __init__(self, callback=None, enabled=True, memory=True):
+        self.callback = callback
+        self.enabled = enabled
+        self.memory = memory
+        self.records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Clear the recorded stages."""
+        with self._lock:
+            self.records = OrderedDict()
+
+    @contextmanager
+    def stage(self, name, category=None, memory=None):
+        """Context manager for recording a named stage.
+
+        Parameters
+        ----------
+        name : str
+            Stage name (e.g. 'setup_dis', 'dis.botm' or 'load_array').
+            Stages with the same name are aggregated.
+        category : str, optional
+            Type of stage (e.g. 'package', 'variable', 'regrid' or 'io').
+        memory : bool, optional
+            Option to record the memory usage of the stage.
+            By default, the memory attribute of the profiler is used.
+        """
+        if not self.enabled:
+            yield
+            return
+        if memory is None:
+            memory = self.memory
+        start = time.time()
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        if memory:
+            rss0 = get_rss()
+            peak_rss0 = get_peak_rss()
+        _activate(self)
+        try:
+            yield
+        finally:
+            _deactivate(self)
+            wall_time = time.perf_counter() - t0
+            cpu_time = time.process_time() - cpu0
+            rss, peak_rss = None, None
+            if memory:
+                rss = get_rss()
+                peak_rss = get_peak_rss()
+            rss_delta = rss - rss0 if rss is not None else None
+            peak_rss_increase = peak_rss - peak_rss0 if peak_rss is not None else None
+            self._record({'name': name,
+                          'category': category,
+                          'start': start,
+                          'wall_time': wall_time,
+                          'cpu_time': cpu_time,
+                          'rss_delta': rss_delta,
+                          'peak_rss_increase': peak_rss_increase,
+                          'peak_rss': peak_rss})
+
+    def _record(self, event):
+        with self._lock:
+            record = self.records.get(event['name'])
+            if record is None:
+                record = {'category': event['category'],
+                          'calls': 0,
+                          'wall_time': 0.,
+                          'cpu_time': 0.,
+                          'max_wall_time': 0.,
+                          'rss_delta': None,
+                          'peak_rss_increase': None,
+                          'peak_rss': None}
+                self.records[event['name']] = record
+            record['calls'] += 1
+            record['wall_time'] += event['wall_time']
+            record['cpu_time'] += event['cpu_time']
+            record['max_wall_time'] = max(record['max_wall_time'], event['wall_time'])
+            for key in 'rss_delta', 'peak_rss_increase':
+                if event[key] is not None:
+                    record[key] = (record[key] or 0.) + event[key]
+            if event['peak_rss'] is not None:
+                record['peak_rss'] = max(record['peak_rss'] or 0., event['peak_rss'])
+        if self.callback is not None:
+            self.callback(event)
+
+    def timed(self, name=None, category=None, memory=None):
+        """Decorator for recording each call to a function
+        as a stage. By default, the function name is used
+        as the stage name."""
+        def decorator(function):
+            stage_name = name if name is not None else function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name, category=category, memory=memory):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_dataframe(self):
+        """Get the recorded stages as a DataFrame,
+        indexed by stage name.
+
+        Returns
+        -------
+        df : DataFrame
+            With columns category, calls, wall_time, cpu_time,
+            max_wall_time, rss_delta, peak_rss_increase and peak_rss
+            (see :class:`Profiler`).
+            Times are in seconds; memory is in megabytes.
+        """
+        columns = ['category', 'calls', 'wall_time', 'cpu_time',
+                   'max_wall_time', 'rss_delta', 'peak_rss_increase', 'peak_rss']
+        with self._lock:
+            df = pd.DataFrame.from_dict(self.records, orient='index',
+                                        columns=columns)
+        df.index.name = 'name'
+        return df
+
+    def write(self, filename):
+        """Write the recorded stages to a JSON (.json extension)
+        or CSV (other extensions) file."""
+        df = self.to_dataframe()
+        if filename.lower().endswith('.json'):
+            profile = {'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'stages': json.loads(df.reset_index().to_json(orient='records'))}
+            with open(filename, 'w') as output:
+                json.dump(profile, output, indent=4)
+        else:
+            df.to_csv(filename, float_format='%g')
+        print('wrote {}'.format(os.path.abspath(filename)))
+
+
+# default registry, for stages that are run outside of
+# the stages of another profiler (e.g. of a model)
+profiler = Profiler()
+
+# profilers with running stages (most recent last); process-wide,
+# so that stages run in worker threads are recorded to the same profiler
+_active_profilers = []
+_active_lock = threading.Lock()
+
+
+def _activate(profiler):
+    with _active_lock:
+        _active_profilers.append(profiler)
+
+
+def _deactivate(profiler):
+    with _active_lock:
+        for i in range(len(_active_profilers) - 1, -1, -1):
+            if _active_profilers[i] is profiler:
+                del _active_profilers[i]
+                break
+
+
+def get_profiler():
+    """Get the active profiler: the profiler with the most recently
+    started stage that is still running (e.g. of the model being built),
+    or the default :data:`profiler` if there isn't one."""
+    with _active_lock:
+        if _active_profilers:
+            return _active_profilers[-1]
+    return profiler
+
+
+def stage(name, category=None, memory=None):
+    """Context manager for recording a named stage
+    in the active profiler (see :func:`get_profiler`
+    and :meth:`Profiler.stage`)."""
+    return get_profiler().stage(name, category=category, memory=memory)
+
+
+def timed(name=None, category=None, memory=None):
+    """Decorator for recording each call to a function
+    as a stage in the active profiler (see :func:`get_profiler`
+    and :meth:`Profiler.timed`)."""
+    def decorator(function):
+        stage_name = name if name is not None else function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name, category=category, memory=memory):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
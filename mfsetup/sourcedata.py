@@ -3,22 +3,24 @@ import shutil
 import numbers
 import warnings
 import numpy as np
-from scipy.interpolate import griddata
-from shapely.geometry import Point
 import pandas as pd
 import xarray as xr
 from flopy.utils import binaryfile as bf
 from mfsetup.discretization import weighted_average_between_layers
-from mfsetup.tdis import aggregate_dataframe_to_stress_period, aggregate_xarray_to_stress_period
+from mfsetup.tdis import (aggregate_dataframe_to_stress_period, aggregate_dataframe_to_stress_periods,
+                          aggregate_xarray_to_stress_period,
+                          aggregate_xarray_to_stress_periods, get_period_time_indices,
+                          RunningStatistic)
 from .fileio import save_array
 from .discretization import (fix_model_layer_conflicts, verify_minimum_layer_thickness,
                              fill_empty_layers, fill_cells_vertically, populate_values)
-from gisutils import (get_values_at_points, shp2df)
-from .grid import get_ij, rasterize
-from .interpolate import get_source_dest_model_xys, interp_weights, interpolate, regrid
+from gisutils import shp2df
+from .grid import get_ij, rasterize, get_raster_statistics_for_cells, get_points_within
+from .interpolate import get_source_dest_model_xys, interp_weights, regrid, Interpolator, get_nearest_index
 from .mf5to6 import get_variable_package_name, get_variable_name
+from .profiling import stage
 from .units import (convert_length_units, convert_time_units, convert_volume_units)
-from .utils import get_input_arguments
+from .utils import get_input_arguments, parallel_map
 
 renames = {'mult': 'multiplier',
            'elevation_units': 'length_units',
@@ -82,6 +84,12 @@ class SourceData:
         return convert_time_units(self.time_units,
                                   getattr(self.dest_model, 'time_units', 'unknown'))
 
+    @property
+    def n_workers(self):
+        """Number of workers for processing layers or
+        stress periods concurrently (from the destination model)."""
+        return getattr(self.dest_model, 'n_workers', 1)
+
     def set_filenames(self, filenames):
 
         def normpath(f):
@@ -206,7 +214,8 @@ class ArraySourceData(SourceData):
         self.include_ids = include_ids
         self.column_mappings = column_mappings
         self.resample_method = resample_method
-        self._interp_weights = None
+        self._interpolator = None
+        self._nearest_index = None
         self.vmin = vmin
         self.vmax = vmax
         self.dtype = dtype
@@ -234,15 +243,42 @@ class ArraySourceData(SourceData):
                                 .format(nlay, nspecified, self.filenames))
 
     @property
-    def interp_weights(self):
-        """For a given parent, only calculate interpolation weights
+    def interpolator(self):
+        """For a given parent, only triangulate the source model cell centers
         once to speed up re-gridding of arrays to pfl_nwt."""
-        if self._interp_weights is None:
+        if self._interpolator is None:
             source_xy, dest_xy = get_source_dest_model_xys(self.source_modelgrid,
                                                            self.dest_model,
                                                            source_mask=self._source_grid_mask)
-            self._interp_weights = interp_weights(source_xy, dest_xy)
-        return self._interp_weights
+            self._interpolator = Interpolator(source_xy, dest_xy,
+                                              cache_dir=self.interp_weights_cache)
+        return self._interpolator
+
+    @property
+    def interp_weights(self):
+        """For a given parent, only calculate interpolation weights
+        once to speed up re-gridding of arrays to pfl_nwt."""
+        return self.interpolator.weights
+
+    @property
+    def nearest_index(self):
+        """Index of the nearest source model cell center (in a flattened
+        source model layer) to each destination model cell center;
+        computed once with a KD-tree, so that nearest-neighbor
+        resampling is a single gather."""
+        if self._nearest_index is None:
+            source_xy = np.array([self.source_modelgrid.xcellcenters.ravel(),
+                                  self.source_modelgrid.ycellcenters.ravel()]).transpose()
+            dest_xy = np.array([self.dest_modelgrid.xcellcenters.ravel(),
+                                self.dest_modelgrid.ycellcenters.ravel()]).transpose()
+            self._nearest_index = get_nearest_index(source_xy, dest_xy)
+        return self._nearest_index
+
+    @property
+    def interp_weights_cache(self):
+        """Folder for caching interpolation weights on disk
+        (from the destination model, if it has one)."""
+        return getattr(self.dest_model, 'interp_weights_cache', None)
 
     @property
     def _source_grid_mask(self):
@@ -288,39 +324,92 @@ class ArraySourceData(SourceData):
             Interpolation method.
         """
         if mask is not None:
+            mask = mask.astype(bool)
+            # reuse the cached triangulation if the mask is within the source model window
+            if method == 'linear' and not np.any(mask & ~self._source_grid_mask):
+                regridded = self.interpolator.interpolate(source_array[self._source_grid_mask],
+                                                          valid=mask[self._source_grid_mask])
+                return np.reshape(regridded, (self.dest_modelgrid.nrow,
+                                              self.dest_modelgrid.ncol))
             return regrid(source_array, self.source_modelgrid, self.dest_modelgrid,
                           mask1=mask,
                           method=method)
         if method == 'linear':
             parent_values = source_array.flatten()[self._source_grid_mask.flatten()]
-            regridded = interpolate(parent_values,
-                                    *self.interp_weights)
+            regridded = self.interpolator.interpolate(parent_values)
         elif method == 'nearest':
-            regridded = regrid(source_array, self.source_modelgrid, self.dest_modelgrid,
-                               method='nearest')
+            regridded = np.ravel(source_array)[self.nearest_index]
         regridded = np.reshape(regridded, (self.dest_modelgrid.nrow,
                                            self.dest_modelgrid.ncol))
         return regridded
 
+    def regrid_stack_from_source_model(self, source_arrays, method='linear',
+                                       exclude_invalid=True):
+        """Regrid a stack of source model arrays (for example,
+        layers or stress periods) onto the destination model grid at once.
+        Linear interpolation uses one sparse matrix product for each set
+        of valid source model cells (see :meth:`Interpolator.interpolate_stack`);
+        nearest-neighbor resampling is a single gather (see :attr:`nearest_index`).
+
+        Parameters
+        ----------
+        source_arrays : 3D numpy array
+            Stack of 2D arrays of the same size as a
+            layer of the source model.
+        method : str ('linear', 'nearest')
+            Interpolation method.
+        exclude_invalid : bool
+            Option to exclude values outside of the vmin, vmax
+            range from linear interpolation. By default, True.
+
+        Returns
+        -------
+        regridded : 3D numpy array
+            Stack of 2D arrays on the destination model grid.
+        """
+        source_arrays = np.asarray(source_arrays)
+        if method == 'nearest':
+            values = np.reshape(source_arrays, (len(source_arrays), -1))
+            regridded = values[:, self.nearest_index]
+        elif method == 'linear':
+            values = source_arrays[:, self._source_grid_mask]
+            valid = None
+            if exclude_invalid:
+                valid = (values > self.vmin) & (values < self.vmax)
+            regridded = self.interpolator.interpolate_stack(values, valid=valid)
+        else:
+            raise ValueError("Unrecognized interpolation method: {}".format(method))
+        return np.reshape(regridded, (len(source_arrays),
+                                      self.dest_modelgrid.nrow,
+                                      self.dest_modelgrid.ncol))
+
     def _read_array_from_file(self, filename):
         f = filename
         if isinstance(f, numbers.Number):
             data = f
         elif isinstance(f, str):
             # sample "source_data" that may not be on same grid
-            # TODO: add bilinear and zonal statistics methods
+            # TODO: add bilinear method
             if f.endswith(".asc") or f.endswith(".tif"):
-                if self.resample_method != 'nearest':
+                zonal_stat = self.resample_method in {'mean', 'min', 'max', 'median'} or \
+                             str(self.resample_method).startswith('percentile_')
+                if not zonal_stat and self.resample_method != 'nearest':
                     warnings.warn('{}: resample method {} not implemented; '
                                   'falling back to nearest'.format(self.variable,
                                                                    self.resample_method))
-                arr = get_values_at_points(f,
-                                           self.dest_model.modelgrid.xcellcenters.ravel(),
-                                           self.dest_model.modelgrid.ycellcenters.ravel())
-                arr = np.reshape(arr, (self.dest_modelgrid.nrow,
-                                       self.dest_modelgrid.ncol))
+                # statistics for the pixels within each cell
+                arr = None
+                if zonal_stat:
+                    arr = get_raster_statistics_for_cells(self.dest_modelgrid, f,
+                                                          stat=self.resample_method)
+                # values at cell centers
+                # (for cells that don't contain any pixel centers)
+                if arr is None or np.any(np.isnan(arr)):
+                    values = self.dest_model.get_raster_values_at_cell_centers(f)
+                    arr = values if arr is None else np.where(np.isnan(arr), values, arr)
             elif f.endswith('.shp'):
-                arr = rasterize(f, self.dest_modelgrid, id_column=self.id_column)
+                arr = rasterize(f, self.dest_modelgrid, id_column=self.id_column,
+                                cache_dir=getattr(self.dest_model, 'rasterize_cache', None))
             # TODO: add code to interpret hds and cbb files
             # interpolate from source model using source model grid
             # otherwise assume the grids are the same
@@ -347,8 +436,11 @@ class ArraySourceData(SourceData):
                                                              self.dest_modelgrid.ncol))
 
         if self.filenames is not None:
-            for i, f in self.filenames.items():
-                data[i] = self._read_array_from_file(f)
+            arrays = parallel_map(self._read_array_from_file,
+                                  self.filenames.values(),
+                                  n_workers=self.n_workers)
+            for i, arr in zip(self.filenames.keys(), arrays):
+                data[i] = arr
 
             # interpolate any missing arrays from consecutive files based on weights
             for i, arr in data.items():
@@ -372,43 +464,20 @@ class ArraySourceData(SourceData):
         # regrid source data from another model
         elif self.source_array is not None:
 
-            for dest_k, source_k in self.dest_source_layer_mapping.items():
-                if source_k >= self.source_array.shape[0]:
-                    continue
-                # destination model layers copied from source model layers
-                # if source_array has an extra layer, assume layer 0 is the model top
-                # (only included for weighted average)
-                # could use a better approach
-                # check source_k is a whole number to 4 decimal places
-                # and if is a layer in source_array
-                if np.round(source_k, 4) in range(self.source_array.shape[0]):
-                    if self.source_array.shape[0] - self.dest_model.nlay == 1:
-                        source_k +=1
-                    source_k = int(np.round(source_k, 4))
-                    arr = self.source_array[source_k]
-                # destination model layers that are a weighted average
-                # of consecutive source model layers
-                else:
-                    weight0 = source_k - np.floor(source_k)
-                    source_k0 = int(np.floor(source_k))
-                    # first layer in the average can't be negative
-                    source_k0 = 0 if source_k0 < 0 else source_k0
-                    source_k1 = int(np.ceil(source_k))
-                    arr = weighted_average_between_layers(self.source_array[source_k0],
-                                                          self.source_array[source_k1],
-                                                          weight0=weight0)
-                # interpolate from source model using source model grid
-                # otherwise assume the grids are the same
-                if self.source_modelgrid is not None:
-                    # exclude invalid values in interpolation from parent model
-                    mask = self._source_grid_mask & (arr > self.vmin) & (arr < self.vmax)
-
-                    regridded = self.regrid_from_source_model(arr,
-                                                              mask=mask,
-                                                              method='linear')
-
-                assert regridded.shape == self.dest_modelgrid.shape[1:]
-                data[dest_k] = regridded * self.mult * self.unit_conversion
+            layer_mapping = {dest_k: source_k for dest_k, source_k
+                             in self.dest_source_layer_mapping.items()
+                             if source_k < self.source_array.shape[0]}
+            arrays = [self._get_source_layer(source_k)
+                      for source_k in layer_mapping.values()]
+            # interpolate from source model using source model grid
+            # (all layers at once)
+            # otherwise assume the grids are the same
+            if self.source_modelgrid is not None:
+                # exclude invalid values in interpolation from parent model
+                arrays = self.regrid_stack_from_source_model(arrays)
+            for dest_k, arr in zip(layer_mapping.keys(), arrays):
+                assert arr.shape == self.dest_modelgrid.shape[1:]
+                data[dest_k] = arr * self.mult * self.unit_conversion
 
         # no files or source array provided
         else:
@@ -417,6 +486,33 @@ class ArraySourceData(SourceData):
         self.data = data
         return data
 
+    def _get_source_layer(self, source_k):
+        """Get a source model layer, or a weighted average
+        of two source model layers."""
+        # destination model layers copied from source model layers
+        # if source_array has an extra layer, assume layer 0 is the model top
+        # (only included for weighted average)
+        # could use a better approach
+        # check source_k is a whole number to 4 decimal places
+        # and if is a layer in source_array
+        if np.round(source_k, 4) in range(self.source_array.shape[0]):
+            if self.source_array.shape[0] - self.dest_model.nlay == 1:
+                source_k +=1
+            source_k = int(np.round(source_k, 4))
+            arr = self.source_array[source_k]
+        # destination model layers that are a weighted average
+        # of consecutive source model layers
+        else:
+            weight0 = source_k - np.floor(source_k)
+            source_k0 = int(np.floor(source_k))
+            # first layer in the average can't be negative
+            source_k0 = 0 if source_k0 < 0 else source_k0
+            source_k1 = int(np.ceil(source_k))
+            arr = weighted_average_between_layers(self.source_array[source_k0],
+                                                  self.source_array[source_k1],
+                                                  weight0=weight0)
+        return arr
+
 
 class TransientArraySourceData(ArraySourceData):
     def __init__(self, filenames, variable, period_stats=None,
@@ -444,9 +540,9 @@ class TransientArraySourceData(ArraySourceData):
         # get data from list of files; one per stress period
         # (files are assumed to be sorted)
         if self.filenames is not None:
-            source_data = []
-            for i, f in self.filenames.items():
-                source_data.append(self._read_array_from_file(f))
+            source_data = parallel_map(self._read_array_from_file,
+                                       self.filenames.values(),
+                                       n_workers=self.n_workers)
             source_data = np.array(source_data)
             regrid = False  # data already regridded by _read_array_from_file
 
@@ -462,18 +558,27 @@ class TransientArraySourceData(ArraySourceData):
 
         # for now, just assume one-to-one correspondance
         # between source and dest model stress periods
-        results = {}
-        for inset_kper, parent_kper in self.dest_model.parent_stress_periods.items():
+        periods = self.dest_model.parent_stress_periods
+        if regrid:
+            # sample the data for all periods onto the model grid at once
+            resampled = self.regrid_stack_from_source_model(source_data[list(periods.values())],
+                                                            method=self.resample_method,
+                                                            exclude_invalid=False)
+            results = {kper: period_data * self.unit_conversion
+                       for kper, period_data in zip(periods.keys(), resampled)}
+            self.data = results
+            return results
+
+        def get_period_data(parent_kper):
             data = source_data[parent_kper]
-            if regrid:
-                # sample the data onto the model grid
-                resampled = self.regrid_from_source_model(data, method=self.resample_method)
-            else:
-                resampled = data
             # reshape results to model grid
-            period_mean2d = resampled.reshape(self.dest_model.nrow,
-                                              self.dest_model.ncol)
-            results[inset_kper] = period_mean2d * self.unit_conversion
+            period_mean2d = data.reshape(self.dest_model.nrow,
+                                         self.dest_model.ncol)
+            return period_mean2d * self.unit_conversion
+
+        period_data = parallel_map(get_period_data, periods.values(),
+                                   n_workers=self.n_workers)
+        results = dict(zip(periods.keys(), period_data))
         self.data = results
         return results
 
@@ -483,7 +588,8 @@ class NetCDFSourceData(ArraySourceData):
                  length_units='unknown', time_units='days',
                  dest_model=None, source_modelgrid=None,
                  from_source_model_layers=None, datatype='transient2d',
-                 resample_method='nearest', vmin=-1e30, vmax=1e30
+                 resample_method='nearest', vmin=-1e30, vmax=1e30,
+                 chunksize=100
                  ):
 
         ArraySourceData.__init__(self, variable=None,
@@ -506,6 +612,7 @@ class NetCDFSourceData(ArraySourceData):
         self.resample_method = resample_method
         self.dest_model = dest_model
         self.time_col = 'time'
+        self.chunksize = chunksize
 
         # set xy value arrays for source and dest. grids
         with xr.open_dataset(self.filename) as ds:
@@ -518,13 +625,23 @@ class NetCDFSourceData(ArraySourceData):
         self.dest_grid_xy = np.array([x2, y2]).transpose()
 
     @property
-    def interp_weights(self):
-        """For a given parent, only calculate interpolation weights
-        once to speed up re-gridding of arrays to pfl_nwt."""
-        if self._interp_weights is None:
-            self._interp_weights = interp_weights(self.source_grid_xy,
-                                                  self.dest_grid_xy)
-        return self._interp_weights
+    def interpolator(self):
+        """Only triangulate the NetCDF grid cell centers once
+        to speed up re-gridding of arrays to the destination model."""
+        if self._interpolator is None:
+            self._interpolator = Interpolator(self.source_grid_xy,
+                                              self.dest_grid_xy,
+                                              cache_dir=self.interp_weights_cache)
+        return self._interpolator
+
+    @property
+    def nearest_index(self):
+        """Index of the nearest NetCDF grid cell center to each
+        destination model cell center (computed once)."""
+        if self._nearest_index is None:
+            self._nearest_index = get_nearest_index(self.source_grid_xy,
+                                                    self.dest_grid_xy)
+        return self._nearest_index
 
     def regrid_from_source(self, source_array,
                            method='linear'):
@@ -543,45 +660,124 @@ class NetCDFSourceData(ArraySourceData):
         """
         values = source_array.flatten()
         if method == 'linear':
-            regridded = interpolate(values,
-                                    *self.interp_weights)
+            regridded = self.interpolator.interpolate(values)
         elif method == 'nearest':
-            regridded = griddata(self.source_grid_xy, values, self.dest_grid_xy, method=method)
+            regridded = values[self.nearest_index]
         regridded = np.reshape(regridded, (self.dest_model.nrow,
                                            self.dest_model.ncol))
         return regridded
 
     def get_data(self):
+        """Aggregate the NetCDF data to the model stress periods,
+        and regrid the results to the model grid.
 
-        # create an xarray dataset instance
-        ds = xr.open_dataset(self.filename)
-        data = ds[self.variable]
-
-        # sample values to model stress periods
-        # TODO: make this general for using with lists of files or other input by stress period
+        If the statistics for all of the stress periods can be computed
+        incrementally, the data are read in a single pass over the time axis,
+        in chunks of self.chunksize time steps, so that the whole
+        dataset never has to be held in memory.
+        """
         starttimes = self.dest_model.perioddata['start_datetime']
         endtimes = self.dest_model.perioddata['end_datetime']
+        period_stats = self.period_stats or {}
+        # set up before any concurrent regridding
+        if self.resample_method == 'linear':
+            self.interpolator
+        elif self.resample_method == 'nearest':
+            self.nearest_index
+
+        # create an xarray dataset instance
+        with xr.open_dataset(self.filename) as ds:
+            data = ds[self.variable]
+            try:
+                stats, _ = get_period_time_indices(data[self.time_col].values,
+                                                   starttimes, endtimes,
+                                                   period_stats=period_stats)
+                streaming = set(stats).issubset(RunningStatistic.supported_stats)
+            # times that aren't monotonic or can't be cast to pandas datetimes
+            except (ValueError, TypeError):
+                streaming = False
+            if streaming:
+                results = self._get_data_streaming(data, starttimes, endtimes, period_stats)
+            else:
+                results = self._get_data_by_period(data, starttimes, endtimes, period_stats)
+        self.data = results
+        return results
+
+    def _regrid_period_data(self, aggregated):
+        # sample the data onto the model grid
+        resampled = self.regrid_from_source(aggregated,
+                                            method=self.resample_method)
+
+        # reshape results to model grid
+        period_mean2d = resampled.reshape(self.dest_model.nrow,
+                                          self.dest_model.ncol)
+        return period_mean2d * self.unit_conversion
+
+    def _regrid_periods(self, aggregated):
+        """Regrid a sequence of aggregated stress period arrays."""
+        aggregated = list(aggregated)
+        if len(aggregated) == 0:
+            return []
+        # sample all of the periods onto the model grid at once
+        values = np.reshape(aggregated, (len(aggregated), -1))
+        if self.resample_method == 'linear':
+            resampled = self.interpolator.interpolate_stack(values)
+        elif self.resample_method == 'nearest':
+            resampled = values[:, self.nearest_index]
+        else:
+            return parallel_map(self._regrid_period_data, aggregated,
+                                n_workers=self.n_workers)
+        resampled = np.reshape(resampled, (len(aggregated),
+                                           self.dest_model.nrow,
+                                           self.dest_model.ncol))
+        return list(resampled * self.unit_conversion)
+
+    def _get_data_streaming(self, data, starttimes, endtimes, period_stats):
+        """Aggregate the data to stress periods in a single pass over time chunks;
+        regrid the stress periods as they are completed."""
         results = {}
+        pending = {}
+        # regrid completed stress periods in batches
+        # (up to chunksize periods at once for linear or nearest resampling,
+        # otherwise n_workers)
+        batch_size = self.n_workers
+        if self.resample_method in {'linear', 'nearest'}:
+            batch_size = max(self.chunksize, 1)
+        for kper, aggregated in aggregate_xarray_to_stress_periods(data, starttimes, endtimes,
+                                                                   period_stats=period_stats,
+                                                                   datetime_column=self.time_col,
+                                                                   chunksize=self.chunksize):
+            pending[kper] = aggregated
+            if len(pending) >= batch_size:
+                results.update(zip(pending.keys(), self._regrid_periods(pending.values())))
+                pending = {}
+        results.update(zip(pending.keys(), self._regrid_periods(pending.values())))
+        return {kper: results[kper] for kper in sorted(results)}
+
+    def _get_data_by_period(self, data, starttimes, endtimes, period_stats):
+        """Aggregate the data to each stress period separately;
+        for period statistics that can't be computed incrementally."""
+        stats = []
         current_stat = None
-        for kper, (start, end) in enumerate(zip(starttimes, endtimes)):
-            period_stat = self.period_stats.get(kper, current_stat)
+        for kper in range(len(starttimes)):
+            period_stat = period_stats.get(kper, current_stat)
             current_stat = period_stat
+            if isinstance(period_stat, list):
+                # aggregate_xarray_to_stress_period modifies the list
+                period_stat = period_stat.copy()
+            stats.append(period_stat)
+
+        def get_period_data(start, end, period_stat):
             aggregated = aggregate_xarray_to_stress_period(data,
                                                            start_datetime=start,
                                                            end_datetime=end,
                                                            period_stat=period_stat,
                                                            datetime_column=self.time_col)
+            return self._regrid_period_data(aggregated)
 
-            # sample the data onto the model grid
-            resampled = self.regrid_from_source(aggregated,
-                                                method=self.resample_method)
-
-            # reshape results to model grid
-            period_mean2d = resampled.reshape(self.dest_model.nrow,
-                                              self.dest_model.ncol)
-            results[kper] = period_mean2d * self.unit_conversion
-        self.data = results
-        return results
+        period_data = parallel_map(get_period_data, starttimes, endtimes, stats,
+                                   n_workers=self.n_workers)
+        return dict(enumerate(period_data))
 
 
 class MFBinaryArraySourceData(ArraySourceData):
@@ -643,8 +839,7 @@ class MFBinaryArraySourceData(ArraySourceData):
         elif self.filename[:-4] in {'.cbb', '.cbc'}:
             raise NotImplementedError('Cell Budget files not supported yet.')
 
-        data = {}
-        for dest_k, source_k in self.dest_source_layer_mapping.items():
+        def get_layer_data(source_k):
 
             # destination model layers copied from source model layers
             if source_k <= 0:
@@ -664,19 +859,20 @@ class MFBinaryArraySourceData(ArraySourceData):
                 arr = weighted_average_between_layers(self.source_array[source_k0],
                                                       self.source_array[source_k1],
                                                       weight0=weight0)
-            # interpolate from source model using source model grid
-            # otherwise assume the grids are the same
-            if self.source_modelgrid is not None:
-                # exclude invalid values in interpolation from parent model
-                mask = self._source_grid_mask & (arr > self.vmin) & (arr < self.vmax)
-
-                arr = self.regrid_from_source_model(arr,
-                                                    mask=mask,
-                                                    method='linear')
-
+            return arr
+
+        layer_mapping = self.dest_source_layer_mapping
+        layer_data = [get_layer_data(source_k) for source_k in layer_mapping.values()]
+        # interpolate from source model using source model grid
+        # (all layers at once)
+        # otherwise assume the grids are the same
+        if self.source_modelgrid is not None:
+            # exclude invalid values in interpolation from parent model
+            layer_data = self.regrid_stack_from_source_model(layer_data)
+        data = {}
+        for dest_k, arr in zip(layer_mapping.keys(), layer_data):
             assert arr.shape == self.dest_modelgrid.shape[1:]
             data[dest_k] = arr * self.mult * self.unit_conversion
-
         self.data = data
         return data
 
@@ -835,8 +1031,10 @@ class TransientTabularSourceData(SourceData):
 
         # cull data to model bounds
         if 'geometry' not in df.columns:
-            df['geometry'] = [Point(x, y) for x, y in zip(df[self.x_col], df[self.y_col])]
-        within = [g.within(self.dest_model.bbox) for g in df.geometry]
+            x, y = df[self.x_col].values, df[self.y_col].values
+        else:
+            x, y = np.array([g.coords[0] for g in df.geometry]).reshape(-1, 2).transpose()
+        within = get_points_within(x, y, self.dest_model.bbox)
         df = df.loc[within]
 
         # sample values to model stress periods
@@ -850,24 +1048,13 @@ class TransientTabularSourceData(SourceData):
         if endtimes_equal_startimes:
             endtimes -= pd.Timedelta(1, unit='d')
 
-        period_data = []
-        current_stat = None
-        for kper, (start, end) in enumerate(zip(starttimes, endtimes)):
-            # missing (period) keys default to 'mean';
-            # 'none' to explicitly skip the stress period
-            period_stat = self.period_stats.get(kper, current_stat)
-            if period_stat is not None and period_stat.lower() == 'none':
-                continue
-            aggregated = aggregate_dataframe_to_stress_period(df,
-                                                              start_datetime=start,
-                                                              end_datetime=end,
-                                                              period_stat=period_stat,
-                                                              id_column=self.id_column,
-                                                              data_column=self.data_column
-                                                              )
-            aggregated['per'] = kper
-            period_data.append(aggregated)
-        dfm = pd.concat(period_data)
+        # missing (period) keys default to 'mean';
+        # 'none' to explicitly skip the stress period
+        period_stats = [self.period_stats.get(kper) for kper in range(len(starttimes))]
+        dfm = aggregate_dataframe_to_stress_periods(df, starttimes, endtimes,
+                                                    period_stats=period_stats,
+                                                    id_column=self.id_column,
+                                                    data_column=self.data_column)
 
         if self.data_column is not None:
             dfm[self.data_column] *= self.unit_conversion
@@ -1103,7 +1290,9 @@ def setup_array(model, package, var, data=None,
     # (for lakes)
     if var == 'botm':
         bathy = model.lake_bathymetry
-        top = model.load_array(model.cfg[external_files_key]['top'][0])
+        # read the top from the (potentially binary) intermediate file if there is one
+        top_files = model.cfg['intermediate_data'].get('top', model.cfg[external_files_key].get('top'))
+        top = model.load_array(top_files[0])
         lake_botm_elevations = top[bathy != 0] - bathy[bathy != 0]
 
         # fill missing layers if any
@@ -1182,16 +1371,18 @@ def setup_array(model, package, var, data=None,
     # assign lake recharge values (water balance surplus) for any high-K lakes
     if write_nodata is None:
         write_nodata = model._nodata_value
-    for i, arr in data.items():
-        save_array(filepaths[i], arr,
-                   nodata=write_nodata,
-                   fmt=write_fmt)
-        # still write intermediate files for MODFLOW-6
-        # even though input and output filepaths are same
-        if model.version == 'mf6':
-            src = filepaths[i]['filename']
-            dst = model.cfg['intermediate_data'][var][i]
-            shutil.copy(src, dst)
+    # (text formatting holds the GIL, so use processes to write concurrently)
+    layers = list(data.keys())
+    if model.version == 'mf6':
+        intermediate_files = [model.cfg['intermediate_data'][var][i] for i in layers]
+    else:
+        intermediate_files = [None] * len(layers)
+    # (timed here, because stages in the worker processes aren't recorded)
+    with stage('write_external_arrays', category='io'):
+        parallel_map(_write_external_array, intermediate_files,
+                     [filepaths[i] for i in layers], [data[i] for i in layers],
+                     [write_nodata] * len(layers), [write_fmt] * len(layers),
+                     n_workers=model.n_workers, processes=True)
 
     # write the top array again, because top was filled
     # with botm array above
@@ -1199,13 +1390,50 @@ def setup_array(model, package, var, data=None,
         top_filepath = model.setup_external_filepaths(package, 'top',
                                                       model.cfg[package]['top_filename_fmt'],
                                                       nfiles=1)[0]
-        save_array(top_filepath, top,
-                   nodata=write_nodata,
-                   fmt=write_fmt)
-        if model.version == 'mf6':
-            src = filepaths[i]['filename']
-            dst = model.cfg['intermediate_data'][var][i]
-            shutil.copy(src, dst)
+        write_external_array(model, 'top', 0, top_filepath, top,
+                             nodata=write_nodata,
+                             fmt=write_fmt)
+
+
+def write_external_array(model, var, i, filepath, arr, nodata=-9999, fmt='%.6e'):
+    """Write an array to an external file, and for MODFLOW-6 models,
+    also to the intermediate file (a copy of the external file,
+    or a binary .npy file if intermediate_data: format: npy).
+
+    Parameters
+    ----------
+    model : mfsetup.MF6model or mfsetup.MFnwtModel instance
+    var : str
+        Variable name (key in model.cfg['intermediate_data'])
+    i : int
+        Layer or stress period
+    filepath : str or dict
+        External file path, as returned by model.setup_external_filepaths
+    arr : 2D numpy array
+    nodata : numeric
+        Value to write in place of nans (text files only)
+    fmt : str
+        Format for writing the text file.
+    """
+    intermediate_file = None
+    if model.version == 'mf6':
+        intermediate_file = model.cfg['intermediate_data'][var][i]
+    _write_external_array(intermediate_file, filepath, arr, nodata=nodata, fmt=fmt)
+
+
+def _write_external_array(intermediate_file, filepath, arr, nodata=-9999, fmt='%.6e'):
+    """Write an external file, and the intermediate file if there is one
+    (module-level function so that it can be run in a separate process)."""
+    if intermediate_file is not None and intermediate_file.endswith('.npy'):
+        save_array(intermediate_file, arr)
+    save_array(filepath, arr,
+               nodata=nodata,
+               fmt=fmt)
+    # still write intermediate files for MODFLOW-6
+    # even though input and output filepaths are same
+    if intermediate_file is not None and not intermediate_file.endswith('.npy'):
+        src = filepath['filename']
+        shutil.copy(src, intermediate_file)
 
 
 def get_source_data_file_ext(cfg_data, package, var):
@@ -453,6 +453,163 @@ def aggregate_dataframe_to_stress_period(data, start_datetime, end_datetime,
     return aggregated
 
 
+def aggregate_dataframe_to_stress_periods(data, start_datetimes, end_datetimes,
+                                          period_stats, id_column, data_column):
+    """Aggregate time series data in a DataFrame (for example, pumping rates
+    by well and month) to model stress periods, in one grouped pass over
+    the data. The results are the same as concatenating the results of
+    :func:`aggregate_dataframe_to_stress_period` for each stress period
+    (except for the index).
+
+    Each record is assigned to the stress period(s) that it contributes to
+    (using searchsorted on the period start and end dates, for stress periods
+    without a specified time period), and then the data are summed by
+    location and record start date, and aggregated to each location,
+    for all stress periods at once.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data with a DatetimeIndex, and 'start_datetime' and 'end_datetime'
+        columns with dates indicating the time bounds associated with each row.
+    start_datetimes, end_datetimes : sequences of datetimes
+        Start and end of each model stress period.
+    period_stats : sequence
+        Statistic input for each stress period (e.g. 'mean', ['mean', '2014'],
+        ['mean', 'august'], ['mean', '2012-01-01', '2017-12-31']); None for
+        the mean; 'none' to skip the stress period.
+    id_column : str
+        Column with location identifier (e.g. node or well id)
+    data_column : str or list of str
+        Column(s) with data to aggregate (e.g. fluxes)
+
+    Returns
+    -------
+    aggregated : pd.DataFrame
+        Aggregated data, with a 'per' column indicating the stress period.
+    """
+    if isinstance(data_column, str):
+        data_columns = [data_column]
+    else:
+        data_columns = list(data_column)
+    start_datetimes = pd.DatetimeIndex(start_datetimes)
+    end_datetimes = pd.DatetimeIndex(end_datetimes)
+    nrows = len(data)
+
+    # positions of the records in order of the DatetimeIndex
+    # (for selecting records by date, as with data.loc[start:end])
+    order = np.argsort(data.index.values, kind='stable')
+    sorted_index = pd.DatetimeIndex(data.index.values[order])
+
+    stats = {}
+    record_indices = []
+    periods = []
+    default_periods = []
+    for kper, period_stat in enumerate(period_stats):
+        if isinstance(period_stat, str):
+            if period_stat.lower() == 'none':
+                continue
+            period_stat = [period_stat]
+        elif period_stat is None:
+            period_stat = ['mean']
+        stat, *period = period_stat
+        stats[kper] = stat
+
+        # stat for specified period
+        if len(period) == 2:
+            start, end = period
+            idx = np.sort(order[sorted_index.slice_indexer(start, end)])
+
+        # stat specified by single item
+        elif len(period) == 1:
+            period = period[0]
+            # stat for a specified month
+            if period in months.keys() or period in months.values():
+                idx = np.flatnonzero(data.index.month == months.get(period, period))
+
+            # stat for a period specified by single string (e.g. '2014', '2014-01', etc.)
+            else:
+                idx = np.sort(order[sorted_index.slice_indexer(period, period)])
+
+        # no time period in source data specified for statistic; use start/end of current model period
+        elif len(period) == 0:
+            default_periods.append(kper)
+            continue
+        else:
+            raise Exception("Unrecognized period_stat input: {}".format(period_stat))
+        record_indices.append(idx)
+        periods.append(np.ones(len(idx), dtype=int) * kper)
+
+    # records that overlap stress periods
+    if len(default_periods) > 0:
+        assert 'start_datetime' in data.columns and 'end_datetime' in data.columns, \
+            "start_datetime and end_datetime columns needed for " \
+            "resampling irregular data to model stress periods"
+        data = data.copy()
+        for col in ['start_datetime', 'end_datetime']:
+            if data[col].dtype == np.object:
+                data[col] = pd.to_datetime(data[col])
+        default_periods = np.array(default_periods)
+        starts = start_datetimes[default_periods].values
+        ends = end_datetimes[default_periods].values
+        record_starts = data['start_datetime'].values
+        record_ends = data['end_datetime'].values
+        if np.all(np.diff(starts) >= np.timedelta64(0)) and \
+                np.all(np.diff(ends) >= np.timedelta64(0)):
+            # periods overlapping each record are contiguous;
+            # first period ending after the record starts,
+            # through the last period starting before the record ends
+            k0 = np.searchsorted(ends, record_starts, side='right')
+            k1 = np.searchsorted(starts, record_ends, side='left')
+            counts = np.maximum(k1 - k0, 0)
+            counts[pd.isnull(record_starts) | pd.isnull(record_ends)] = 0
+            idx = np.repeat(np.arange(nrows), counts)
+            position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            record_indices.append(idx)
+            periods.append(default_periods[k0[idx] + position])
+        else:
+            for kper, start, end in zip(default_periods, starts, ends):
+                overlaps = (record_starts < end) & (record_ends > start)
+                idx = np.flatnonzero(overlaps)
+                record_indices.append(idx)
+                periods.append(np.ones(len(idx), dtype=int) * kper)
+
+    record_indices = np.concatenate(record_indices) if len(record_indices) > 0 \
+        else np.array([], dtype=int)
+    periods = np.concatenate(periods) if len(periods) > 0 \
+        else np.array([], dtype=int)
+    # sort by stress period, keeping the records for each period in their original order
+    sort = np.lexsort((record_indices, periods))
+    period_data = data.iloc[record_indices[sort]].reset_index(drop=True)
+    period_data['_per'] = periods[sort]
+
+    # ensure that ids are unique in each time period
+    # by summing multiple id instances by period
+    # (only sum the data column)
+    groups = period_data.groupby(['_per', id_column, 'start_datetime'])
+    by_period = groups.first()
+    by_period[data_columns] = groups[data_columns].sum()
+    by_period.reset_index(inplace=True)
+
+    # compute the statistic for each stress period
+    # (grouping together the stress periods with the same statistic)
+    groups = by_period.groupby(['_per', id_column])
+    aggregated = groups.first()
+    period_stat = by_period['_per'].map(stats)
+    values = []
+    for stat in period_stat.unique():
+        stat_groups = by_period.loc[period_stat == stat].groupby(['_per', id_column])
+        values.append(getattr(stat_groups[data_columns], stat)())
+    if len(values) > 0:
+        aggregated[data_columns] = pd.concat(values)
+    aggregated.reset_index(inplace=True)
+    aggregated['start_datetime'] = start_datetimes[aggregated['_per'].values]  # add datetime back in
+    aggregated['per'] = aggregated.pop('_per')
+    columns = [id_column, 'start_datetime'] + \
+              [c for c in aggregated.columns if c not in {id_column, 'start_datetime'}]
+    return aggregated[columns]
+
+
 def aggregate_xarray_to_stress_period(data, start_datetime, end_datetime,
                                       period_stat, datetime_column):
 
@@ -494,4 +651,211 @@ def aggregate_xarray_to_stress_period(data, start_datetime, end_datetime,
     # compute statistic on data
     period_stat = getattr(arr, stat)(axis=0)
 
-    return period_stat
\ No newline at end of file
+    return period_stat
+
+def get_period_time_indices(times, start_datetimes, end_datetimes,
+                            period_stats=None):
+    """Get the positions along a (sorted) time axis of the time steps
+    included in the statistic for each model stress period, following the
+    same rules as :func:`aggregate_xarray_to_stress_period`.
+
+    Parameters
+    ----------
+    times : sequence of datetimes
+        Time axis of the source data (must be monotonically increasing).
+    start_datetimes, end_datetimes : sequences of datetimes
+        Start and end of each model stress period.
+    period_stats : dict, optional
+        Period statistics (e.g. 'mean', ['mean', '2014'],
+        ['mean', 'august'], ['mean', '2012-01-01', '2017-12-31'])
+        keyed by zero-based stress period; periods without an entry
+        use the statistic from the previous period (default 'mean').
+
+    Returns
+    -------
+    stats : list of str
+        Statistic for each stress period.
+    indices : list of 1D integer arrays
+        Positions in times of the time steps for each stress period.
+    """
+    times = pd.DatetimeIndex(times)
+    if not times.is_monotonic_increasing:
+        raise ValueError('times must be monotonically increasing')
+    if period_stats is None:
+        period_stats = {}
+
+    # time steps within each model stress period
+    # (as with partial string slicing of the dates, end dates are inclusive)
+    start_days = pd.DatetimeIndex(start_datetimes).floor('D')
+    end_days = pd.DatetimeIndex(end_datetimes).floor('D') + pd.Timedelta(1, unit='D')
+    i0 = times.searchsorted(start_days, side='left')
+    i1 = times.searchsorted(end_days, side='left')
+
+    stats = []
+    indices = []
+    current_stat = None
+    for kper in range(len(start_days)):
+        period_stat = period_stats.get(kper, current_stat)
+        current_stat = period_stat
+        if isinstance(period_stat, str):
+            period_stat = [period_stat]
+        elif period_stat is None:
+            period_stat = ['mean']
+        stat, *period = period_stat
+
+        # stat for specified period
+        if len(period) == 2:
+            start, end = period
+            loc = times.slice_indexer(start, end)
+            period_indices = np.arange(len(times))[loc]
+
+        # stat specified by single item
+        elif len(period) == 1:
+            period = period[0]
+            # stat for a specified month
+            if period in months.keys() or period in months.values():
+                period_indices = np.flatnonzero(times.month == months.get(period, period))
+
+            # stat for a period specified by single string (e.g. '2014', '2014-01', etc.)
+            else:
+                loc = times.slice_indexer(period, period)
+                period_indices = np.arange(len(times))[loc]
+
+        # no period specified; use start/end of current period
+        elif len(period) == 0:
+            period_indices = np.arange(i0[kper], i1[kper])
+        else:
+            raise Exception("Unrecognized period_stat input: {}".format(period_stat))
+        stats.append(stat)
+        indices.append(period_indices)
+    return stats, indices
+
+
+class RunningStatistic:
+    """Statistic (mean, sum, min, max, std or var) over the first axis
+    of an array, that can be updated incrementally, one chunk of the
+    array at a time. Chunks are combined with the pairwise algorithm
+    of Chan et al. (1979), so the results are the same as
+    computing the statistic on the whole array (with ddof=0).
+    """
+    supported_stats = {'mean', 'sum', 'min', 'max', 'std', 'var'}
+
+    def __init__(self, stat):
+        if stat not in self.supported_stats:
+            raise ValueError('Statistic {} not supported; must be one of {}'
+                             .format(stat, self.supported_stats))
+        self.stat = stat
+        self.n = 0
+        self.value = None
+        self.mean = None
+        self.m2 = None
+
+    def update(self, chunk):
+        n = len(chunk)
+        if n == 0:
+            return
+        if self.stat in {'sum', 'min', 'max'}:
+            value = getattr(chunk, self.stat)(axis=0)
+            if self.value is None:
+                self.value = value
+            elif self.stat == 'sum':
+                self.value = self.value + value
+            else:
+                func = np.minimum if self.stat == 'min' else np.maximum
+                self.value = func(self.value, value)
+        else:
+            mean = chunk.mean(axis=0)
+            m2 = ((chunk - mean)**2).sum(axis=0)
+            if self.mean is None:
+                self.mean, self.m2 = mean, m2
+            else:
+                ntotal = self.n + n
+                delta = mean - self.mean
+                self.mean = self.mean + delta * n / ntotal
+                self.m2 = self.m2 + m2 + delta**2 * self.n * n / ntotal
+        self.n += n
+
+    @property
+    def result(self):
+        if self.n == 0:
+            return
+        if self.stat in {'sum', 'min', 'max'}:
+            return self.value
+        elif self.stat == 'mean':
+            return self.mean
+        elif self.stat == 'var':
+            return self.m2 / self.n
+        return np.sqrt(self.m2 / self.n)
+
+
+def aggregate_xarray_to_stress_periods(data, start_datetimes, end_datetimes,
+                                       period_stats=None, datetime_column='time',
+                                       chunksize=100):
+    """Aggregate gridded time series data (for example, a NetCDF variable)
+    to model stress periods, in a single pass over the time axis.
+
+    Data are read one chunk of time steps at a time, and the statistic for each
+    stress period is updated incrementally, so that only one chunk (plus
+    the statistics for the stress periods that overlap the current chunk)
+    is held in memory. The results are the same as calling
+    :func:`aggregate_xarray_to_stress_period` for each stress period.
+
+    Parameters
+    ----------
+    data : xarray.DataArray
+        Data with time as the first dimension. Can be lazily loaded
+        (for example, from xarray.open_dataset).
+    start_datetimes, end_datetimes : sequences of datetimes
+        Start and end of each model stress period.
+    period_stats : dict, optional
+        Period statistic input keyed by zero-based stress period
+        (see :func:`get_period_time_indices`).
+    datetime_column : str
+        Name of the time coordinate in data. (default 'time')
+    chunksize : int
+        Number of time steps to read at a time. (default 100)
+
+    Yields
+    ------
+    kper : int
+        Zero-based stress period (in order of the last time step
+        included in the stress period's statistic).
+    period_stat : ndarray
+        Statistic for the stress period
+        (all nan if there are no time steps in the period).
+    """
+    times = data[datetime_column].values
+    stats, indices = get_period_time_indices(times, start_datetimes, end_datetimes,
+                                             period_stats=period_stats)
+    for stat in stats:
+        if stat not in RunningStatistic.supported_stats:
+            raise ValueError('Statistic {} not supported; must be one of {}'
+                             .format(stat, RunningStatistic.supported_stats))
+    shape = data.shape[1:]
+    # last time step in each stress period
+    last = np.array([idx[-1] if len(idx) > 0 else -1 for idx in indices])
+    running = {}
+    finished = np.zeros(len(indices), dtype=bool)
+    for c0 in range(0, len(times) + 1, chunksize):
+        c1 = min(c0 + chunksize, len(times))
+        chunk = None
+        for kper in np.flatnonzero(~finished):
+            idx = indices[kper]
+            lo, hi = np.searchsorted(idx, [c0, c1])
+            if hi > lo:
+                if chunk is None:
+                    chunk = data[c0:c1].values
+                if kper not in running:
+                    running[kper] = RunningStatistic(stats[kper])
+                running[kper].update(chunk[idx[lo:hi] - c0])
+        # yield stress periods that don't include any later time steps
+        for kper in np.flatnonzero(~finished & (last < c1)):
+            finished[kper] = True
+            result = None
+            if kper in running:
+                result = running.pop(kper).result
+            if result is None:
+                result = np.full(shape, np.nan)
+            yield kper, result
+        if c1 == len(times):
+            break
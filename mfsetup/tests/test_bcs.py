@@ -1,6 +1,8 @@
 import numpy as np
 import pytest
-from mfsetup.bcs import get_bc_package_cells
+import flopy
+fm = flopy.modflow
+from mfsetup.bcs import get_bc_package_cells, get_stress_period_data_cells
 from mfsetup.testing import dtypeisinteger
 
 
@@ -64,6 +66,22 @@ def test_get_bc_package_cells(pleasant_mf6_setup_from_yaml): #pleasant_model):
                 assert np.all(m.isbc[k, i, j] == m.bc_numbers[packagename])
 
 
+def test_get_stress_period_data_cells():
+    m = fm.Modflow()
+    dis = fm.ModflowDis(m, nlay=3, nrow=5, ncol=6, nper=3)
+    spd = {0: [[0, 1, 1, -1.],
+               [0, 1, 1, -2.],  # two wells in one cell
+               [2, 4, 5, -1.]],
+           1: [[0, 1, 1, -1.],
+               [1, 0, 3, -3.]],
+           2: [[1, 0, 3, -3.]]}
+    wel = fm.ModflowWel(m, stress_period_data=spd)
+    k, i, j = get_stress_period_data_cells(wel.stress_period_data)
+    assert list(zip(k, i, j)) == [(0, 1, 1), (1, 0, 3), (2, 4, 5)]
+    for var in k, i, j:
+        assert dtypeisinteger(var.dtype)
+
+
 def test_ghb_sfr_overlap(pleasant_nwt_with_dis_bas6):
     m = pleasant_nwt_with_dis_bas6
     m.cfg['ghb']['source_data']['shapefile'] = \
@@ -78,3 +96,18 @@ def test_ghb_sfr_overlap(pleasant_nwt_with_dis_bas6):
     sfr_cells = set(zip(m.sfrdata.reach_data.i.values,
                     m.sfrdata.reach_data.j.values))
     assert len(ghb_cells.intersection(sfr_cells)) == 0
+
+
+def test_model_bc_package_cells_cache(pleasant_nwt_with_dis_bas6):
+    m = pleasant_nwt_with_dis_bas6
+    wel = fm.ModflowWel(m, stress_period_data={0: [[0, 1, 1, -1.]],
+                                               1: [[1, 0, 3, -3.]]})
+    k, i, j = m.get_bc_package_cells(wel)
+    assert list(zip(k, i, j)) == [(0, 1, 1), (1, 0, 3)]
+    # stress period data replaced in place
+    wel.stress_period_data[1] = [[2, 4, 5, -1.], [1, 0, 3, -3.]]
+    k, i, j = m.get_bc_package_cells(wel)
+    assert list(zip(k, i, j)) == [(0, 1, 1), (1, 0, 3), (2, 4, 5)]
+    # cache is cleared with the other boundary condition arrays
+    m._reset_bc_arrays()
+    assert m._bc_package_cells == {}
@@ -1,11 +1,14 @@
+import time
 import numpy as np
 import pandas as pd
 import pytest
+from scipy import ndimage
+from scipy.signal import convolve2d
 from ..discretization import (fix_model_layer_conflicts, verify_minimum_layer_thickness,
                               fill_empty_layers, fill_cells_vertically, make_idomain, make_ibound,
                               get_layer_thicknesses, create_vertical_pass_through_cells,
                               deactivate_idomain_above, find_remove_isolated_cells,
-                              populate_values, voxels_to_layers)
+                              build_idomain, populate_values, voxels_to_layers)
 
 
 @pytest.fixture(scope="function")
@@ -217,6 +220,71 @@ def test_get_layer_thicknesses(all_layers):
     assert np.allclose(thicknesses[:, 2, 2].copy(), expected, equal_nan=True)
 
 
+def get_layer_thicknesses_loop(top, botm):
+    """Reference (per-cell loop) implementation of get_layer_thicknesses."""
+    all_layers = np.stack([top] + [b for b in botm])
+    thicknesses = np.zeros_like(botm) * np.nan
+    nrow, ncol = top.shape
+    for i in range(nrow):
+        for j in range(ncol):
+            cells = all_layers[:, i, j]
+            valid_b = list(-np.diff(cells[~np.isnan(cells)]))
+            b_ij = np.zeros_like(cells[1:]) * np.nan
+            has_top = False
+            for k, elev in enumerate(cells):
+                if not has_top and not np.isnan(elev):
+                    has_top = True
+                elif has_top and not np.isnan(elev):
+                    b_ij[k-1] = valid_b.pop(0)
+            thicknesses[:, i, j] = b_ij
+    thicknesses[thicknesses == 0] = 0
+    return thicknesses
+
+
+def test_get_layer_thicknesses_random_pinchouts():
+    np.random.seed(0)
+    nlay, nrow, ncol = 10, 20, 30
+    top = np.ones((nrow, ncol)) * 100.
+    botm = 100 - np.cumsum(np.random.rand(nlay, nrow, ncol) * 10, axis=0)
+    botm[np.random.rand(nlay, nrow, ncol) < 0.3] = np.nan
+    top[np.random.rand(nrow, ncol) < 0.1] = np.nan
+    result = get_layer_thicknesses(top, botm)
+    expected = get_layer_thicknesses_loop(top, botm)
+    np.testing.assert_array_equal(result, expected)
+
+    # idomain=0 cells are treated like nans
+    idomain = (np.random.rand(nlay, nrow, ncol) > 0.2).astype(int)
+    result = get_layer_thicknesses(top, botm, idomain=idomain)
+    top2 = top.copy()
+    botm2 = botm.copy()
+    top2[idomain[0] != 1] = np.nan
+    botm2[idomain != 1] = np.nan
+    expected = get_layer_thicknesses_loop(top2, botm2)
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize('model', ['shellmound_model_with_dis',
+                                   'get_pleasant_nwt_with_dis'])
+def test_get_layer_thicknesses_benchmark(model, request):
+    """Compare the vectorized thickness computation to the
+    per-cell loop on the grids of the test models."""
+    m = request.getfixturevalue(model)
+    top = m.dis.top.array.astype(float)
+    botm = m.dis.botm.array.astype(float)
+    # pinch out some of the layers
+    botm[1:-1][np.abs(botm[1:-1] - botm[:-2]) < 5] = np.nan
+
+    t0 = time.time()
+    expected = get_layer_thicknesses_loop(top, botm)
+    loop_time = time.time() - t0
+    t0 = time.time()
+    result = get_layer_thicknesses(top, botm)
+    vectorized_time = time.time() - t0
+    print('{} ({} cells): loop {:.3f}s, vectorized {:.3f}s'.format(model, botm.size,
+                                                                 loop_time, vectorized_time))
+    np.testing.assert_array_equal(result, expected)
+
+
 def test_deactivate_idomain_above(all_layers):
     top = all_layers[0].copy()
     botm = all_layers[1:].copy()
@@ -274,6 +342,98 @@ def test_create_vertical_pass_through_cells():
                       (np.sum(passthru, axis=0) < 0))
 
 
+def build_idomain_loop(top, botm, idomain, inactive, packagedata,
+                      minimum_layer_thickness=1, minimum_cluster_size=20):
+    """Reference (looped) implementation of build_idomain."""
+    idomain_from_layer_elevations = make_idomain(top, botm,
+                                                 minimum_layer_thickness=minimum_layer_thickness,
+                                                 drop_thin_cells=True, tol=1e-4)
+    idomain = (idomain == 1) & (idomain_from_layer_elevations == 1)
+    idomain = idomain.astype(int)
+    idomain[inactive] = 0.
+
+    # deactivate cells above SFR reaches
+    for ck, ci, cj in zip(packagedata['k'], packagedata['i'], packagedata['j']):
+        for k in range(ck):
+            idomain[k, ci, cj] = 0
+
+    # remove isolated cells
+    structure = np.zeros((3, 3))
+    structure[1, :] = 1
+    structure[:, 1] = 1
+    retained_arraylist = []
+    for arr in idomain:
+        convolved = convolve2d(arr, structure, mode='same')
+        atleast_2_connections = (arr == 1) & (convolved > 2)
+        labeled, ncomponents = ndimage.label(atleast_2_connections,
+                                             structure=structure)
+        retain_areas = [c for c in range(1, ncomponents+1)
+                        if (labeled == c).sum() >= minimum_cluster_size]
+        retain = np.in1d(labeled.ravel(), retain_areas)
+        retained_arraylist.append(np.reshape(retain, arr.shape).astype(idomain.dtype))
+    idomain = np.array(retained_arraylist, dtype=idomain.dtype)
+
+    # vertical pass-through cells
+    revised = idomain.copy()
+    for i in range(1, idomain.shape[0]-1):
+        has_active_above = np.any(idomain[:i] > 0, axis=0)
+        has_active_below = np.any(idomain[i+1:] > 0, axis=0)
+        bounded = has_active_above & has_active_below
+        pass_through = (idomain[i] <= 0) & bounded
+        revised[i][pass_through] = -1
+        revised[i][(idomain[i] <= 0) & ~bounded] = 0
+    for i in (0, -1):
+        revised[i][revised[i] < 0] = 0
+    return revised
+
+
+def test_build_idomain():
+    np.random.seed(0)
+    nlay, nrow, ncol = 8, 60, 70
+    top = np.ones((nrow, ncol)) * 100.
+    botm = 100 - np.cumsum(np.random.rand(nlay, nrow, ncol) * 10, axis=0)
+    idomain = (np.random.rand(nlay, nrow, ncol) > 0.1).astype(int)
+    inactive = np.random.rand(nlay, nrow, ncol) > 0.95
+    packagedata = pd.DataFrame({'k': np.random.randint(0, nlay, 200),
+                                'i': np.random.randint(0, nrow, 200),
+                                'j': np.random.randint(0, ncol, 200)})
+    result = build_idomain(top, botm, idomain=idomain, inactive=inactive,
+                           sfr_packagedata=packagedata, minimum_cluster_size=20)
+    expected = build_idomain_loop(top, botm, idomain, inactive, packagedata)
+    np.testing.assert_array_equal(result, expected)
+    assert np.issubdtype(result.dtype, np.integer)
+    assert np.any(result == -1)
+    # inputs aren't modified
+    assert set(np.unique(idomain)) == {0, 1}
+
+
+def test_build_idomain_benchmark(shellmound_model_with_dis):
+    """Compare the fused idomain builder to the looped
+    sequence of functions on the shellmound grid."""
+    m = shellmound_model_with_dis
+    top = m.dis.top.array.copy()
+    botm = m.dis.botm.array.copy()
+    idomain = m.dis.idomain.array.copy()
+    np.random.seed(0)
+    inactive = np.random.rand(*botm.shape) > 0.99
+    nreaches = 2000
+    packagedata = pd.DataFrame({'k': np.random.randint(0, m.nlay, nreaches),
+                                'i': np.random.randint(0, m.nrow, nreaches),
+                                'j': np.random.randint(0, m.ncol, nreaches)})
+    t0 = time.time()
+    expected = build_idomain_loop(top, botm, idomain, inactive, packagedata,
+                                  minimum_layer_thickness=m.cfg['dis'].get('minimum_layer_thickness', 1))
+    loop_time = time.time() - t0
+    t0 = time.time()
+    result = build_idomain(top, botm, idomain=idomain, inactive=inactive,
+                           sfr_packagedata=packagedata,
+                           minimum_layer_thickness=m.cfg['dis'].get('minimum_layer_thickness', 1))
+    fused_time = time.time() - t0
+    print('shellmound ({} cells): loop {:.3f}s, fused {:.3f}s'.format(botm.size,
+                                                                    loop_time, fused_time))
+    np.testing.assert_array_equal(result, expected)
+
+
 def test_populate_values():
     v = populate_values({0: 1.0, 2: 2.0})
     assert v == {0: 1.0, 1: 1.5, 2: 2.0}
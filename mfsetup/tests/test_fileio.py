@@ -3,8 +3,10 @@ import platform
 import numpy as np
 import pytest
 import flopy.modflow as fm
-from ..fileio import (load, load_array, dump_yml, load_yml,
-                      load_modelgrid, load_cfg, which, exe_exists)
+from ..fileio import (load, load_array, save_array, dump_yml, load_yml,
+                      load_modelgrid, load_cfg, which, exe_exists,
+                      load_cached_features, cache_features, get_config_fingerprint,
+                      atomic_write, load_cache_file)
 
 
 @pytest.fixture
@@ -58,6 +60,20 @@ def test_load_array(tmpdir):
     np.testing.assert_allclose(a, b)
 
 
+@pytest.mark.parametrize('ext', ['.txt', '.npy'])
+def test_save_load_array(tmpdir, ext):
+    a = np.random.randn(100, 100)
+    a[0:2, 0:2] = np.nan
+    f = os.path.join(tmpdir, 'junk{}'.format(ext))
+    save_array(f, a.copy(), fmt='%.6e')
+    b = load_array(f, shape=(100, 100))
+    np.testing.assert_allclose(a, b, rtol=1e-6)
+
+    # multiple layers
+    b = load_array([f, f], shape=(2, 100, 100))
+    assert b.shape == (2, 100, 100)
+
+
 def test_load_grid():
     gridfile = '/Users/aleaf/Documents/CSLS/source/test/data/Transient_MODFLOW-NWT/LPR_parent_grid.yml'
     if os.path.exists(gridfile):
@@ -117,3 +133,107 @@ def test_exe_exists(modflow_executable):
         assert exe_exists(modflow_executable)
         print('{} exists'.format(modflow_executable))
 
+
+def test_atomic_write(tmpdir):
+    cache_file = os.path.join(tmpdir, 'cache', 'array.npy')
+    atomic_write(cache_file, lambda dest: np.save(dest, np.arange(5)))
+    np.testing.assert_array_equal(load_cache_file(cache_file, np.load), np.arange(5))
+    assert os.listdir(os.path.dirname(cache_file)) == ['array.npy']
+
+    # an interrupted write leaves the previous file
+    def writer(dest):
+        dest.write(b'incomplete')
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        atomic_write(cache_file, writer)
+    np.testing.assert_array_equal(load_cache_file(cache_file, np.load), np.arange(5))
+    assert os.listdir(os.path.dirname(cache_file)) == ['array.npy']
+
+    # missing or corrupted files aren't loaded
+    assert load_cache_file(os.path.join(tmpdir, 'missing.npy'), np.load) is None
+    with open(cache_file, 'wb') as dest:
+        dest.write(b'corrupted')
+    assert load_cache_file(cache_file, np.load) is None
+
+
+def test_features_cache(tmpdir):
+    import pandas as pd
+    from shapely.geometry import Point
+    shapefile = os.path.join(tmpdir, 'lakes.shp')
+    with open(shapefile, 'w') as dest:
+        dest.write('placeholder')
+    cache_dir = os.path.join(tmpdir, 'features')
+    x = np.arange(10) * 100.
+    df = pd.DataFrame({'geometry': [Point(xx, xx).buffer(10) for xx in x],
+                       'feat_id': np.arange(10)})
+    bounds = np.array([g.bounds for g in df.geometry])
+    assert load_cached_features(cache_dir, shapefile, 'epsg:26915', 'epsg:5070') is None
+
+    # features were filtered to (0, 0, 500, 500) in the shapefile CRS,
+    # and reprojected to a different model CRS (represented by an offset)
+    in_filter = bounds[:, 0] <= 500
+    projected = df.loc[in_filter].copy()
+    projected['geometry'] = [Point(xx + 1e6, xx).buffer(10) for xx in x[in_filter]]
+    cache_features(cache_dir, projected, shapefile, 'epsg:26915', 'epsg:5070',
+                   filter=(0, 0, 500, 500), features_bounds=bounds[in_filter])
+
+    # same filter
+    cached = load_cached_features(cache_dir, shapefile, 'epsg:26915', 'epsg:5070',
+                                  filter=(0, 0, 500, 500))
+    pd.testing.assert_frame_equal(cached, projected.reset_index(drop=True))
+    # filter within the cached area
+    cached = load_cached_features(cache_dir, shapefile, 'epsg:26915', 'epsg:5070',
+                                  filter=(150, 150, 305, 305))
+    assert cached.feat_id.tolist() == [2, 3]
+    assert np.allclose(cached.geometry[0].centroid.x, 1e6 + 200)
+    # larger filter, different model CRS or modified shapefile
+    assert load_cached_features(cache_dir, shapefile, 'epsg:26915', 'epsg:5070',
+                                filter=(0, 0, 600, 600)) is None
+    assert load_cached_features(cache_dir, shapefile, 'epsg:26915', 'epsg:3070',
+                                filter=(0, 0, 500, 500)) is None
+
+    # only the most recently used sets of features are kept
+    for xmax in 600, 700, 800:
+        cache_features(cache_dir, projected, shapefile, 'epsg:26915', 'epsg:5070',
+                       features_bounds=bounds[in_filter], filter=(0, 0, xmax, xmax),
+                       max_cached_files=3)
+    folder, = os.listdir(cache_dir)
+    assert len(os.listdir(os.path.join(cache_dir, folder))) == 6
+    assert load_cached_features(cache_dir, shapefile, 'epsg:26915', 'epsg:5070',
+                                filter=(0, 0, 550, 550)).feat_id.tolist() == \
+           [0, 1, 2, 3, 4, 5]
+
+    # features cached for previous versions of the shapefile are removed
+    os.utime(shapefile, (0, 0))
+    assert load_cached_features(cache_dir, shapefile, 'epsg:26915', 'epsg:5070',
+                                filter=(0, 0, 500, 500)) is None
+    cache_features(cache_dir, projected, shapefile, 'epsg:26915', 'epsg:5070',
+                   features_bounds=bounds[in_filter], filter=(0, 0, 500, 500))
+    assert os.listdir(cache_dir) != [folder]
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_get_config_fingerprint(module_tmpdir):
+    source_file = os.path.join(module_tmpdir, 'source_data.csv')
+    with open(source_file, 'w') as dest:
+        dest.write('a,b\n1,2\n')
+    cfg = {'sfr': {'source_data': {'flowlines': {'filename': source_file}},
+                   'minimum_slope': 1e-4},
+           'model': {'simulation': object()},  # objects are skipped
+           'botm': np.ones((2, 3))}
+    fingerprint = get_config_fingerprint(cfg)
+    assert get_config_fingerprint(cfg) == fingerprint
+    cfg2 = {'botm': np.ones((2, 3)),
+            'model': {'simulation': object()},
+            'sfr': {'minimum_slope': 1e-4,
+                    'source_data': {'flowlines': {'filename': source_file}}}}
+    assert get_config_fingerprint(cfg2) == fingerprint
+
+    # changes to settings, arrays and source files
+    cfg2['sfr']['minimum_slope'] = 1e-5
+    assert get_config_fingerprint(cfg2) != fingerprint
+    cfg['botm'][0, 0] = 2.
+    assert get_config_fingerprint(cfg) != fingerprint
+    cfg['botm'][0, 0] = 1.
+    os.utime(source_file, (0, 0))
+    assert get_config_fingerprint(cfg) != fingerprint
@@ -1,10 +1,11 @@
 import copy
 import os
+import shutil
 import numpy as np
 import fiona
 import pytest
 from gisutils import shp2df
-from ..grid import MFsetupGrid
+from ..grid import MFsetupGrid, get_ij, get_raster_statistics_for_cells
 
 # TODO: add tests for grid.py
 
@@ -50,3 +51,192 @@ def test_grid_write_shapefile(modelgrid, tmpdir):
     assert np.array_equal(j.ravel(), df.j.values)
 
 
+
+
+@pytest.mark.parametrize('angrot', [0., 20., -33.])
+def test_get_ij(angrot):
+    np.random.seed(0)
+    delr = np.random.rand(50) * 10 + 1
+    delc = np.random.rand(40) * 10 + 1
+    grid = MFsetupGrid(xoff=100., yoff=200., angrot=angrot,
+                       delr=delr, delc=delc)
+    # cell centers map back to their cells
+    i, j = get_ij(grid, grid.xcellcenters.ravel(), grid.ycellcenters.ravel())
+    ii, jj = np.indices((grid.nrow, grid.ncol))
+    assert np.array_equal(i, ii.ravel())
+    assert np.array_equal(j, jj.ravel())
+
+    # random points within the grid are consistent with flopy
+    x, y = grid.get_coords(np.random.rand(100) * delr.sum(),
+                           np.random.rand(100) * delc.sum())
+    i, j = get_ij(grid, x, y)
+    for xx, yy, ii, jj in zip(x, y, i, j):
+        assert grid.intersect(xx, yy) == (ii, jj)
+        assert get_ij(grid, xx, yy) == (ii, jj)
+
+    # points outside of the grid are assigned to the nearest cell
+    x, y = grid.get_coords(np.array([-50., delr.sum() + 50, delr[0] / 2]),
+                           np.array([delc[-1] / 2, delc[-1] / 2, delc.sum() + 50]))
+    i, j = get_ij(grid, x, y)
+    assert np.array_equal(i, [grid.nrow - 1, grid.nrow - 1, 0])
+    assert np.array_equal(j, [0, grid.ncol - 1, 0])
+
+
+@pytest.mark.parametrize('stat', ['mean', 'min', 'max', 'sum', 'count',
+                                  'std', 'median', 'percentile_90'])
+@pytest.mark.parametrize('all_touched', [False, True])
+def test_get_raster_statistics_for_cells(stat, all_touched, tmpdir):
+    import rasterio
+    from rasterio.features import geometry_mask
+    from rasterio.transform import from_origin
+    np.random.seed(0)
+    nrow, ncol, res = 5, 6, 10
+    data = np.random.rand(nrow * res, ncol * res).astype('float32')
+    raster = os.path.join(tmpdir, 'random.tif')
+    # shift the raster by a fraction of a pixel,
+    # so that no pixel centers (or edges) fall on cell edges
+    transform = from_origin(-0.3, nrow * res - 0.3, 1, 1)
+    with rasterio.open(raster, 'w', driver='GTiff', height=data.shape[0],
+                       width=data.shape[1], count=1, dtype=data.dtype,
+                       transform=transform) as dst:
+        dst.write(data, 1)
+    grid = MFsetupGrid(xoff=0., yoff=0., delr=np.ones(ncol) * res,
+                       delc=np.ones(nrow) * res)
+    mask = np.ones((nrow, ncol), dtype=bool)
+    mask[0, 0] = False
+    results = get_raster_statistics_for_cells(grid, raster, stat=stat, mask=mask,
+                                              all_touched=all_touched)
+    assert results.shape == (nrow, ncol)
+    if stat == 'count':
+        assert results[0, 0] == 0
+    else:
+        assert np.isnan(results[0, 0])
+
+    # reference statistics from the pixels whose centers are in
+    # (or that touch) each cell, according to rasterio
+    expected = np.zeros((nrow, ncol))
+    for i in range(nrow):
+        for j in range(ncol):
+            in_cell = geometry_mask([grid.polygons[i * ncol + j]], data.shape,
+                                    transform, all_touched=all_touched, invert=True)
+            values = data[in_cell]
+            if stat == 'count':
+                expected[i, j] = values.size
+            elif stat.startswith('percentile'):
+                expected[i, j] = np.percentile(values, 90)
+            else:
+                expected[i, j] = getattr(np, stat)(values)
+    np.testing.assert_allclose(results[mask], expected[mask], rtol=1e-6)
+
+    # same results when the raster is read in small blocks
+    # (values are reduced by block, and cells are completed across blocks)
+    results2 = get_raster_statistics_for_cells(grid, raster, stat=stat, mask=mask,
+                                               all_touched=all_touched,
+                                               max_pixels_per_block=100)
+    np.testing.assert_allclose(results2, results, rtol=1e-6)
+
+
+@pytest.mark.parametrize('angrot', [0., 20.])
+def test_raster_sampler(angrot, tmpdir):
+    import rasterio
+    from rasterio.transform import from_origin
+    from ..grid import RasterSampler
+    np.random.seed(0)
+    data = np.random.rand(200, 300).astype('float32')
+    data[::7, ::3] = -9999
+    raster = os.path.join(tmpdir, 'random.tif')
+    transform = from_origin(-500.37, 1500.21, 7, 7)
+    with rasterio.open(raster, 'w', driver='GTiff', height=data.shape[0],
+                       width=data.shape[1], count=1, dtype=data.dtype,
+                       nodata=-9999, transform=transform) as dst:
+        dst.write(data, 1)
+    # grid extends past the edge of the raster
+    grid = MFsetupGrid(xoff=0., yoff=0., angrot=angrot,
+                       delr=np.ones(100) * 20, delc=np.ones(60) * 20)
+    sampler = RasterSampler(grid, max_cached_mb=0.1)
+    results = sampler.get_values_at_cell_centers(raster)
+    assert results.shape == (grid.nrow, grid.ncol)
+
+    with rasterio.open(raster) as src:
+        i, j = src.index(grid.xcellcenters.ravel(), grid.ycellcenters.ravel())
+    i, j = np.array(i), np.array(j)
+    within = (i >= 0) & (i < data.shape[0]) & (j >= 0) & (j < data.shape[1])
+    expected = np.full(i.size, np.nan)
+    expected[within] = data[i[within], j[within]]
+    expected[expected == -9999] = np.nan
+    np.testing.assert_array_equal(results.ravel(), expected)
+    assert np.any(~within)
+    with pytest.raises(ValueError):
+        sampler.get_values_at_cell_centers(raster, out_of_bounds_errors='raise')
+
+    # the window is only read once, and kept in the raster data type
+    window = sampler.get_window(raster)
+    assert sampler.get_window(raster)[0] is window[0]
+    assert window[0].size < data.size
+    assert window[0].dtype == data.dtype
+
+    # the cache is bounded by size; the most recently used window is kept
+    raster2 = os.path.join(tmpdir, 'random2.tif')
+    shutil.copy(raster, raster2)
+    sampler.get_window(raster2)
+    assert len(sampler._windows) == 1
+    assert sampler.get_window(raster)[0] is not window[0]
+
+
+def test_rasterize_cache(tmpdir):
+    import pandas as pd
+    from shapely.geometry import Point
+    from ..grid import rasterize, get_rasterize_cache_key
+    grid = MFsetupGrid(xoff=0., yoff=0., delr=np.ones(50) * 10, delc=np.ones(40) * 10)
+    df = pd.DataFrame({'geometry': [Point(100, 100).buffer(50),
+                                    Point(300, 250).buffer(80)],
+                       'lak_id': [1, 2]})
+    cache_dir = os.path.join(tmpdir, 'rasterized')
+    result = rasterize(df, grid, id_column='lak_id', cache_dir=cache_dir)
+    key = get_rasterize_cache_key(df, grid, id_column='lak_id', include_ids=None,
+                                  epsg=None, proj4=None, buffer=None)
+    assert os.path.exists(os.path.join(cache_dir, 'rasterized_{}.npy'.format(key)))
+    np.testing.assert_array_equal(result, rasterize(df, grid, id_column='lak_id',
+                                                    cache=False))
+    # cached results are copied
+    result[:] = 0
+    cached = rasterize(df, grid, id_column='lak_id', cache_dir=cache_dir)
+    assert set(np.unique(cached)) == {0, 1, 2}
+
+    # different geometries, buffers or grids have different keys
+    df2 = df.copy()
+    df2['geometry'] = [g.buffer(20) for g in df.geometry]
+    buffered = rasterize(df, grid, id_column='lak_id', buffer=20)
+    np.testing.assert_array_equal(buffered, rasterize(df2, grid, id_column='lak_id'))
+    assert buffered.sum() > cached.sum()
+    grid2 = MFsetupGrid(xoff=0., yoff=0., delr=np.ones(50) * 10, delc=np.ones(41) * 10)
+    assert rasterize(df, grid2, id_column='lak_id').shape == (41, 50)
+
+    # no key for input that can't be identified
+    # (or that would be consumed by making the key)
+    assert get_rasterize_cache_key([], grid) is None
+    assert get_rasterize_cache_key((g for g in df.geometry), grid) is None
+    assert get_rasterize_cache_key(os.path.join(tmpdir, 'missing.shp'), grid) is None
+    assert get_rasterize_cache_key(list(df.geometry), grid) is not None
+    assert get_rasterize_cache_key(df.geometry, grid) == \
+           get_rasterize_cache_key(list(df.geometry), grid)
+
+
+@pytest.mark.parametrize('angrot', [0., 20.])
+def test_get_points_within(angrot):
+    from shapely.geometry import Point
+    from ..grid import get_points_within
+    np.random.seed(0)
+    grid = MFsetupGrid(xoff=100., yoff=200., angrot=angrot,
+                       delr=np.ones(50) * 10, delc=np.ones(40) * 10)
+    x = np.random.rand(1000) * 800 - 50
+    y = np.random.rand(1000) * 700 + 100
+    # include points on the boundary
+    x0, y0, x1, y1 = grid.bbox.bounds
+    x[:3] = x0, x1, (x0 + x1) / 2
+    y[:3] = (y0 + y1) / 2, (y0 + y1) / 2, y0
+    for polygon in grid.bbox, grid.bbox.buffer(-100).difference(Point(400, 450).buffer(50)):
+        within = get_points_within(x, y, polygon)
+        expected = [Point(xx, yy).within(polygon) for xx, yy in zip(x, y)]
+        assert np.array_equal(within, expected)
+        assert 0 < within.sum() < len(x)
@@ -5,7 +5,8 @@ import rasterio
 from scipy.interpolate import griddata, interpn
 import pytest
 from ..grid import MFsetupGrid
-from ..interpolate import interp_weights, get_source_dest_model_xys
+from ..interpolate import (interp_weights, interpolate, get_source_dest_model_xys, Interpolator,
+                           get_nearest_index)
 from ..testing import compare_float_arrays
 
 
@@ -139,6 +140,109 @@ def test_regrid_linear_with_mask(pfl_nwt_with_grid):
     np.testing.assert_allclose(rg1, rg2)
 
 
+@pytest.mark.parametrize('fraction_excluded', [0., 0.001, 0.01, 0.2])
+def test_interpolator_with_mask(fraction_excluded):
+    np.random.seed(0)
+    source_xy = np.random.rand(2000, 2)
+    dest_xy = np.random.rand(5000, 2) * 1.1 - 0.05
+    values = np.random.rand(2000)
+    valid = np.random.rand(2000) >= fraction_excluded
+    interpolator = Interpolator(source_xy, dest_xy)
+    result = interpolator.interpolate(values, valid=valid)
+    # same result as triangulating only the valid points
+    expected = griddata(source_xy[valid], values[valid], dest_xy,
+                        method='linear', fill_value=np.nan)
+    outside = np.isnan(expected)
+    expected[outside] = np.nanmean(expected[~outside])
+    np.testing.assert_allclose(result, expected)
+    # patched weights are reused for the same mask
+    assert interpolator.get_weights(valid) is interpolator.get_weights(valid)
+
+
+def test_interpolator_cache(tmpdir):
+    np.random.seed(0)
+    source_xy = np.random.rand(2000, 2)
+    dest_xy = np.random.rand(5000, 2)
+    valid = np.random.rand(2000) > 0.01
+    cache_dir = os.path.join(tmpdir, 'interp_weights')
+    interpolator = Interpolator(source_xy, dest_xy, cache_dir=cache_dir)
+    vtx, wts = interpolator.weights
+    vtx2, wts2 = interpolator.get_weights(valid)
+    assert os.path.exists(interpolator.get_cache_file())
+    assert os.path.exists(interpolator.get_cache_file(valid))
+
+    # a new instance with the same points loads the weights
+    # without triangulating
+    interpolator2 = Interpolator(source_xy, dest_xy, cache_dir=cache_dir)
+    np.testing.assert_array_equal(interpolator2.weights[0], vtx)
+    np.testing.assert_array_equal(interpolator2.weights[1], wts)
+    np.testing.assert_array_equal(interpolator2.get_weights(valid)[1], wts2)
+    assert interpolator2._tri is None
+
+    # different points or masks have different cache files
+    interpolator3 = Interpolator(source_xy, dest_xy[:-1], cache_dir=cache_dir)
+    assert interpolator3.get_cache_file() != interpolator.get_cache_file()
+    assert interpolator.get_cache_file(~valid) != interpolator.get_cache_file(valid)
+
+    # only the most recently used sets of patched weights are kept on disk
+    interpolator4 = Interpolator(source_xy, dest_xy, cache_dir=cache_dir,
+                                 max_cached_files=3)
+    masks = [np.random.rand(2000) > 0.01 for i in range(5)]
+    for mask in masks:
+        interpolator4.get_weights(mask)
+    cached_files = [f for f in os.listdir(cache_dir) if f.endswith('.npz')]
+    assert len(cached_files) == 4  # unmasked weights + 3 masks
+    assert os.path.exists(interpolator4.get_cache_file())
+    for mask in masks[2:]:
+        assert os.path.exists(interpolator4.get_cache_file(mask))
+
+
+def test_interpolate_stack():
+    np.random.seed(0)
+    source_xy = np.random.rand(500, 2)
+    dest_xy = np.random.rand(200, 2) * 1.1 - 0.05
+    values = np.random.rand(10, 500)
+    valid = np.ones(values.shape, dtype=bool)
+    # some arrays with the same excluded points; one with different ones
+    valid[2:5, ::7] = False
+    valid[6, ::5] = False
+    interpolator = Interpolator(source_xy, dest_xy)
+    results = interpolator.interpolate_stack(values, valid=valid)
+    assert results.shape == (10, 200)
+    for row, valid_row, result in zip(values, valid, results):
+        vtx, wts = interpolator.get_weights(valid_row)
+        expected = interpolate(row, vtx, wts, fill_value=np.nan)
+        outside = np.isnan(expected)
+        expected[outside] = expected[~outside].mean()
+        np.testing.assert_allclose(result, expected)
+
+    # same valid points for all arrays in the stack
+    results = interpolator.interpolate_stack(values, valid=valid[6], fill_value=-1)
+    np.testing.assert_allclose(results[3], interpolator.interpolate(values[3], valid=valid[6],
+                                                                    fill_value=-1))
+    operator, outside = interpolator.get_operator(valid[6])
+    assert operator.shape == (200, 500)
+    assert np.all(results[:, outside] == -1)
+    assert interpolator.get_operator(valid[6])[0] is operator
+
+
+def test_regrid_linear_with_window_mask(pfl_nwt_with_grid):
+
+    from mfsetup.interpolate import regrid
+    m = pfl_nwt_with_grid
+    arr = m.parent.dis.top.array.copy()
+    arr[m.parent_mask & (np.arange(arr.size).reshape(arr.shape) % 7 == 0)] = -9999.
+    mask = m.parent_mask & (arr > -9999.)
+    rg1 = m.regrid_from_parent(arr, mask=mask, method='linear')
+    rg2 = regrid(arr, m.parent.modelgrid, m.modelgrid, mask1=mask,
+                 method='linear')
+    # excluded values aren't included in the interpolation
+    assert rg1.min() >= arr[mask].min()
+    # results may not match exactly, because the
+    # triangulation of a regular grid isn't unique
+    np.testing.assert_allclose(rg1.mean(), rg2.mean(), atol=0.01, rtol=1e-4)
+
+
 def test_regrid_nearest(pfl_nwt_with_grid):
 
     from mfsetup.interpolate import regrid
@@ -150,3 +254,14 @@ def test_regrid_nearest(pfl_nwt_with_grid):
     rg2 = regrid(arr, m.parent.modelgrid, m.modelgrid, method='nearest')
     np.testing.assert_allclose(rg1, rg2)
 
+
+def test_get_nearest_index(pfl_nwt_with_grid):
+    m = pfl_nwt_with_grid
+    arr = m.parent.dis.top.array
+    source_xy = np.array([m.parent.modelgrid.xcellcenters.ravel(),
+                          m.parent.modelgrid.ycellcenters.ravel()]).transpose()
+    dest_xy = np.array([m.modelgrid.xcellcenters.ravel(),
+                        m.modelgrid.ycellcenters.ravel()]).transpose()
+    index = get_nearest_index(source_xy, dest_xy)
+    expected = griddata(source_xy, arr.ravel(), dest_xy, method='nearest')
+    np.testing.assert_array_equal(arr.ravel()[index], expected)
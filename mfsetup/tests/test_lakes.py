@@ -7,7 +7,8 @@ import pytest
 from mfsetup.fileio import load_array
 from mfsetup.lakes import (PrismSourceData, setup_lake_info,
                            setup_lake_connectiondata,
-                           get_horizontal_connections)
+                           get_horizontal_connections,
+                           get_lake_connections)
 
 
 @pytest.fixture
@@ -142,3 +143,46 @@ def test_get_horizontal_connections():
 
         ncon = np.sum(np.abs(sobel_x) > 1) + np.sum(np.abs(sobel_y) > 1)
         assert ncon == np.sum(connections['k'] == k)
+
+
+def test_get_lake_connections():
+    nlay, nrow, ncol = 3, 20, 25
+    lakarr = np.zeros((nlay, nrow, ncol), dtype=int)
+    lakarr[0, 2:6, 3:8] = 1
+    lakarr[1, 3:5, 4:7] = 1
+    lakarr[0, 0:3, 20:25] = 2  # lake at the edge of the grid
+    lakarr[0, 10:15, 10:12] = 3
+    lakarr[0, 12, 12] = 3
+    idomain = np.ones((nlay, nrow, ncol), dtype=int)
+    idomain[lakarr > 0] = 0
+    idomain[0, 9, 10:12] = 0  # inactive cells next to lake 3
+    layer_elevations = np.zeros((nlay + 1, nrow, ncol))
+    layer_elevations[0] = 3
+    layer_elevations[1] = 2
+    layer_elevations[2] = 1
+    delr = np.arange(1, ncol + 1, dtype=float)
+    delc = np.arange(1, nrow + 1, dtype=float)
+    df = get_lake_connections(lakarr, idomain, layer_elevations, delr, delc)
+
+    for lake_id in range(1, 4):
+        lake_connections = df.loc[df.lakeno == lake_id]
+        assert np.array_equal(lake_connections.iconn, np.arange(len(lake_connections)))
+
+        # one vertical connection to the highest active layer at each lake location
+        vertical = lake_connections.loc[lake_connections.claktype == 'vertical']
+        k, i, j = zip(*vertical.cellid)
+        footprint = (lakarr == lake_id).any(axis=0)
+        assert set(zip(i, j)) == set(zip(*np.where(footprint)))
+        assert np.array_equal(k, np.argmax(idomain[:, i, j], axis=0))
+
+        # horizontal connections are the same as with the single-lake function,
+        # minus those to inactive cells
+        horizontal = lake_connections.loc[lake_connections.claktype == 'horizontal']
+        expected = get_horizontal_connections(lakarr == lake_id, layer_elevations,
+                                              delr, delc)
+        k, i, j = zip(*expected['cellid'])
+        expected = expected.loc[idomain[k, i, j] > 0]
+        assert horizontal.cellid.tolist() == expected.cellid.tolist()
+        for col in ['belev', 'telev', 'connlen', 'connwidth']:
+            assert np.allclose(horizontal[col], expected[col])
+    assert not np.any(df.cellid.isin([(0, 9, 10), (0, 9, 11)]))
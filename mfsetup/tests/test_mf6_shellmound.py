@@ -360,6 +360,30 @@ def test_dis_setup(shellmound_model_with_grid):
     assert np.allclose(m.dis.botm.array[3].mean() / .3048, np.nanmean(mcaq_data), atol=5)
 
 
+def test_dis_setup_binary_intermediate_data(shellmound_model_with_grid):
+    m = shellmound_model_with_grid
+    m.cfg['intermediate_data']['format'] = 'npy'
+    try:
+        m.cfg['dis']['remake_top'] = True
+        dis = m.setup_dis()
+    finally:
+        m.cfg['intermediate_data']['format'] = 'text'
+    # intermediate files are binary
+    arrayfiles = m.cfg['intermediate_data']['top'] + \
+                 m.cfg['intermediate_data']['botm']
+    for f in arrayfiles:
+        assert f.endswith('.npy')
+        assert os.path.exists(f)
+    top = load_array(m.cfg['intermediate_data']['top'][0])
+    botm = load_array(m.cfg['intermediate_data']['botm'])
+    np.testing.assert_allclose(top, dis.top.array, atol=0.01)
+    np.testing.assert_allclose(botm, dis.botm.array, atol=0.01)
+    # external files read by MODFLOW are still text
+    for f in m.cfg['dis']['griddata']['botm']:
+        assert not f['filename'].endswith('.npy')
+        assert os.path.exists(f['filename'])
+
+
 def test_idomain(shellmound_model_with_dis):
     m = shellmound_model_with_dis
     assert issubclass(m.idomain.dtype.type, np.integer)
@@ -533,6 +557,19 @@ def test_rch_setup(shellmound_model_with_dis):
     assert np.allclose(m.rch.recharge.array[0, 0].ravel(), rech0.ravel())
 
 
+def test_rch_setup_parallel(shellmound_model_with_dis):
+    m = shellmound_model_with_dis
+    rch = m.setup_rch()
+    serial = rch.recharge.array.copy()
+    m.cfg['model']['n_workers'] = 4
+    try:
+        rch = m.setup_rch()
+    finally:
+        m.cfg['model']['n_workers'] = 1
+    # same results, in the same order
+    np.testing.assert_array_equal(rch.recharge.array, serial)
+
+
 def test_wel_setup(shellmound_model_with_dis):
     m = shellmound_model_with_dis  # deepcopy(model)
     wel = m.setup_wel()
@@ -679,6 +716,51 @@ def test_load(model_setup, shellmound_cfg_path):
     assert m == m2
 
 
+def test_incremental_build(shellmound_cfg_path, tmpdir):
+    cfg = load_cfg(shellmound_cfg_path, default_file='/mf6_defaults.yml')
+    cfg['model']['incremental_build'] = True
+    # copy the recharge source data, so that it can be modified
+    source_data = cfg['rch']['source_data']['recharge']
+    rch_source = os.path.join(tmpdir, os.path.split(source_data['filename'])[1])
+    shutil.copy(source_data['filename'], rch_source)
+    source_data['filename'] = rch_source
+    build_state_file = os.path.join(cfg['simulation']['sim_ws'],
+                                    cfg['model']['build_state_file'].format(
+                                        cfg['model']['modelname']))
+    if os.path.exists(build_state_file):
+        os.remove(build_state_file)
+
+    m = MF6model.setup_from_cfg(deepcopy(cfg))
+    assert 'setup_npf' in m.profiler.to_dataframe().index
+    # the build state is only written with the input files
+    assert m.build_state_file == build_state_file
+    assert not os.path.exists(build_state_file)
+    m.write_input()
+    assert os.path.exists(build_state_file)
+
+    # only the recharge package (and the simulation-level packages)
+    # are set up again when the recharge source data change
+    os.utime(rch_source, (0, 0))
+    m2 = MF6model.setup_from_cfg(deepcopy(cfg))
+    stages = m2.profiler.to_dataframe().index
+    for package in 'dis', 'ic', 'npf', 'sto', 'oc':
+        assert 'load_{}'.format(package) in stages
+        assert 'setup_{}'.format(package) not in stages
+    assert 'setup_rch' in stages
+    assert 'load_rch' not in stages
+    np.testing.assert_array_equal(m2.dis.idomain.array, m.dis.idomain.array)
+    np.testing.assert_allclose(m2.dis.botm.array, m.dis.botm.array)
+    np.testing.assert_allclose(m2.rch.recharge.array, m.rch.recharge.array)
+
+    # packages are also set up again if their external array files change
+    k_file = os.path.join(m._abs_model_ws, m.cfg['external_files']['k'][0])
+    os.remove(k_file)
+    m3 = MF6model.setup_from_cfg(deepcopy(cfg))
+    stages = m3.profiler.to_dataframe().index
+    assert 'setup_npf' in stages
+    assert 'load_dis' in stages
+
+
 def test_packagelist(shellmound_cfg_path):
 
     cfg = load_cfg(shellmound_cfg_path, default_file='/mf6_defaults.yml')
@@ -0,0 +1,94 @@
+"""
+Tests for profiling.py module
+"""
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from ..profiling import Profiler, get_profiler, timed
+
+
+@pytest.mark.parametrize('extension', ['.json', '.csv'])
+def test_profiler(tmpdir, extension):
+    events = []
+    profiler = Profiler(callback=events.append)
+
+    @profiler.timed(category='io')
+    def load_data(n):
+        time.sleep(0.01)
+        return np.ones(n)
+
+    with profiler.stage('setup_dis', category='package'):
+        with profiler.stage('dis.botm', category='variable'):
+            for i in range(3):
+                load_data(10)
+    assert load_data.__name__ == 'load_data'
+
+    df = profiler.to_dataframe()
+    assert df.index.tolist() == ['load_data', 'dis.botm', 'setup_dis']
+    assert df.loc['load_data', 'calls'] == 3
+    assert df.loc['load_data', 'category'] == 'io'
+    assert df.loc['load_data', 'wall_time'] >= 0.03
+    assert df.loc['load_data', 'max_wall_time'] < df.loc['load_data', 'wall_time']
+    # nested stages include the time in the stages within them
+    assert df.loc['setup_dis', 'wall_time'] >= df.loc['dis.botm', 'wall_time'] >= \
+           df.loc['load_data', 'wall_time']
+    assert [e['name'] for e in events] == ['load_data'] * 3 + ['dis.botm', 'setup_dis']
+
+    profile_file = os.path.join(tmpdir, 'model_profile' + extension)
+    profiler.write(profile_file)
+    if extension == '.json':
+        with open(profile_file) as src:
+            written = pd.DataFrame(json.load(src)['stages']).set_index('name')
+    else:
+        written = pd.read_csv(profile_file, index_col='name')
+    assert written['calls'].tolist() == [3, 1, 1]
+
+    # memory retained by a stage; the high-water mark only increases
+    if sys.platform.startswith('linux'):
+        with profiler.stage('allocate'):
+            data = np.ones(50 * 1024**2 // 8)  # 50 MB
+        df = profiler.to_dataframe()
+        assert df.loc['allocate', 'rss_delta'] > 40
+        assert df.loc['allocate', 'peak_rss_increase'] >= 0
+        assert df.loc['allocate', 'peak_rss'] >= df.loc['setup_dis', 'peak_rss']
+        del data
+
+    # memory usage isn't sampled for stages with memory=False
+    with profiler.stage('no_memory', memory=False):
+        pass
+    df = profiler.to_dataframe()
+    assert df.loc['no_memory', 'calls'] == 1
+    assert df.loc['no_memory', ['rss_delta', 'peak_rss_increase', 'peak_rss']].isna().all()
+    assert events[-1]['rss_delta'] is None
+
+    # stages are not recorded when the profiler is disabled
+    profiler.reset()
+    profiler.enabled = False
+    load_data(10)
+    assert len(profiler.to_dataframe()) == 0
+
+
+def test_active_profiler():
+    from ..profiling import profiler as default_profiler
+    model1, model2 = Profiler(), Profiler()
+
+    @timed(category='io')
+    def load_data():
+        return get_profiler()
+
+    # stages in helper functions are recorded
+    # to the profiler with the most recently started stage
+    with model1.stage('setup_dis', category='package'):
+        assert load_data() is model1
+        # e.g. another model built within the first one
+        with model2.stage('setup_from_cfg', category='model'):
+            assert load_data() is model2
+        assert load_data() is model1
+    assert model1.to_dataframe().loc['load_data', 'calls'] == 2
+    assert model2.to_dataframe().loc['load_data', 'calls'] == 1
+    # or to the default profiler
+    assert load_data() is default_profiler
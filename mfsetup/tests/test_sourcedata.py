@@ -7,7 +7,7 @@ import xarray as xr
 from ..fileio import _parse_file_path_keys_from_source_data
 from ..sourcedata import (ArraySourceData, TabularSourceData, TransientTabularSourceData,
                           MFArrayData, MFBinaryArraySourceData, transient2d_to_xarray)
-from mfsetup.tdis import aggregate_dataframe_to_stress_period
+from mfsetup.tdis import aggregate_dataframe_to_stress_period, aggregate_dataframe_to_stress_periods
 from mfsetup.discretization import weighted_average_between_layers
 from ..units import convert_length_units, convert_time_units
 from mfsetup import MFnwtModel
@@ -360,6 +360,53 @@ def test_aggregate_dataframe_to_stress_period(shellmound_datapath, sourcefile, d
     assert np.allclose(result['flux_m3'].sum(), expected_sum)
 
 
+
+@pytest.mark.parametrize('freq', ['MS', 'D'])
+@pytest.mark.parametrize('sourcefile', ['tables/iwum_m3_1M.csv',
+                                        'tables/iwum_m3_6M.csv'])
+def test_aggregate_dataframe_to_stress_periods(shellmound_datapath, sourcefile, freq):
+    welldata = pd.read_csv(os.path.join(shellmound_datapath, sourcefile))
+    welldata['start_datetime'] = pd.to_datetime(welldata.start_datetime)
+    welldata['end_datetime'] = pd.to_datetime(welldata.end_datetime)
+    duplicate_well = welldata.groupby('node').get_group(welldata.node.values[0])
+    welldata = welldata.append(duplicate_well)
+    welldata.index = welldata['start_datetime']
+    welldata.sort_index(kind='mergesort', inplace=True)
+
+    # initial steady-state period, followed by monthly or daily periods
+    start_datetimes = pd.date_range('2007-01-01', '2009-12-31', freq=freq)
+    end_datetimes = start_datetimes + pd.offsets.MonthEnd(0) if freq == 'MS' \
+        else start_datetimes
+    start_datetimes = start_datetimes.insert(0, pd.Timestamp('2008-01-01'))
+    end_datetimes = end_datetimes.insert(0, pd.Timestamp('2008-01-01'))
+    period_stats = {0: ['mean', '2008-01-01', '2010-12-31'],
+                    3: 'sum',
+                    5: 'none',
+                    6: ['max', '2008'],
+                    8: 'min'}
+    period_stats = [period_stats.get(kper) for kper in range(len(start_datetimes))]
+    results = aggregate_dataframe_to_stress_periods(welldata, start_datetimes, end_datetimes,
+                                                    period_stats=period_stats,
+                                                    id_column='node',
+                                                    data_column='flux_m3')
+    expected = []
+    for kper, (start, end) in enumerate(zip(start_datetimes, end_datetimes)):
+        if period_stats[kper] == 'none':
+            continue
+        aggregated = aggregate_dataframe_to_stress_period(welldata,
+                                                          start_datetime=start,
+                                                          end_datetime=end,
+                                                          period_stat=copy.copy(period_stats[kper]),
+                                                          id_column='node',
+                                                          data_column='flux_m3')
+        aggregated['per'] = kper
+        expected.append(aggregated)
+    expected = pd.concat(expected).sort_values(by=['per', 'node']).reset_index(drop=True)
+    results = results.sort_values(by=['per', 'node']).reset_index(drop=True)
+    assert 5 not in results.per.values
+    pd.testing.assert_frame_equal(results[expected.columns], expected, check_dtype=False)
+
+
 def test_transient2d_to_DataArray():
     data = np.random.randn(2, 2, 2)
     times = ['2008-01-01', '2008-02-01']
@@ -11,7 +11,9 @@ import copy
 import numpy as np
 import pandas as pd
 import pytest
-from mfsetup.tdis import get_parent_stress_periods
+import xarray as xr
+from mfsetup.tdis import (get_parent_stress_periods, aggregate_xarray_to_stress_period,
+                          aggregate_xarray_to_stress_periods)
 from .test_pleasant_mf6_inset import get_pleasant_mf6
 
 
@@ -219,3 +221,34 @@ def test_get_parent_stress_periods(copy_periods, nper, basic_model_instance, req
     m._set_parent()
     m._set_perioddata()
     assert np.array_equal(m.perioddata['parent_sp'], np.array(expected[test_name]))
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 100, 10000])
+def test_aggregate_xarray_to_stress_periods(chunksize):
+    np.random.seed(0)
+    times = pd.date_range('2012-01-01', '2014-12-31', freq='D')
+    data = xr.DataArray(np.random.rand(len(times), 5, 6),
+                        coords={'time': times}, dims=('time', 'y', 'x'))
+    data[10, 0, 0] = np.nan
+    start_datetimes = pd.date_range('2012-01-01', '2014-12-01', freq='MS')
+    start_datetimes = start_datetimes.insert(0, pd.Timestamp('2012-01-01'))
+    end_datetimes = pd.date_range('2012-01-31', '2014-12-31', freq='M')
+    end_datetimes = end_datetimes.insert(0, pd.Timestamp('2014-12-31'))
+    period_stats = {0: ['mean', '2012-01-01', '2014-12-31'],  # steady-state period
+                    1: 'mean',
+                    5: 'sum',
+                    6: ['max', 'august'],
+                    7: ['min', '2013'],
+                    8: 'std',
+                    9: 'mean'}
+    results = dict(aggregate_xarray_to_stress_periods(data, start_datetimes, end_datetimes,
+                                                      period_stats=period_stats,
+                                                      chunksize=chunksize))
+    assert set(results.keys()) == set(range(len(start_datetimes)))
+    current_stat = None
+    for kper, (start, end) in enumerate(zip(start_datetimes, end_datetimes)):
+        period_stat = period_stats.get(kper, current_stat)
+        current_stat = period_stat
+        expected = aggregate_xarray_to_stress_period(data, start, end,
+                                                     copy.copy(period_stat), 'time')
+        np.testing.assert_allclose(results[kper], expected)
@@ -1,9 +1,10 @@
+import numpy as np
 import pytest
 from flopy.utils import binaryfile as bf
 from mfsetup.discretization import get_layer
 from mfsetup.grid import get_ij
 from mfsetup.testing import rms_error
-from mfsetup.tmr import Tmr
+from mfsetup.tmr import Tmr, distribute_parent_fluxes_to_inset
 
 
 # fixture to feed multiple model fixtures to a test
@@ -64,4 +65,134 @@ def test_get_inset_boundary_heads(tmr, parent_heads):
         k = get_layer(tmr.parent.dis.botm.array, i, j, iz)
 
         # error between parent heads and inset heads
-        # todo: interpolate parent head solution to inset points for comparison
\ No newline at end of file
+        # todo: interpolate parent head solution to inset points for comparison
+
+def test_parent_file_readers(tmr):
+    # the same head file reader is reused
+    hdsobj = tmr.hdsobj
+    assert tmr.hdsobj is hdsobj
+    bheads_df = tmr.get_inset_boundary_heads()
+    assert tmr.hdsobj is hdsobj
+    bheads_df2 = tmr.get_inset_boundary_heads()
+    assert bheads_df.equals(bheads_df2)
+    tmr.close()
+    assert tmr._hdsobj is None
+    # reopened on next access
+    assert tmr.hdsobj is not hdsobj
+    tmr.close()
+
+
+def distribute_parent_fluxes_to_inset_loop(Q_parent, botm_parent, top_parent,
+                                           botm_inset, kh_inset, water_table_parent,
+                                           phiramp=0.05):
+    """Reference (looped) implementation of distribute_parent_fluxes_to_inset,
+    for a single location."""
+    Q1 = np.array(Q_parent, dtype=float)
+    botm1 = botm_parent
+    botm2 = botm_inset
+    aqtop = water_table_parent if water_table_parent < top_parent \
+        else top_parent  # top of the aquifer
+
+    # Replace nans with 0s bc these are where cells are dry
+    Q1[np.isnan(Q1)] = 0
+    # In parent model cells with sat thickness fraction less than phiramp,
+    # Distribute flux to next layer with sat thickness frac > phiramp
+    b_parent = -np.diff(np.array([top_parent] + list(botm_parent)))
+    sthick = aqtop - botm_parent
+    confined = (sthick - b_parent) > 0
+    sthick[confined] = b_parent[confined]
+    stfrac = sthick/b_parent
+    q_excess = 0.
+    for k, stfk in enumerate(stfrac):
+        if stfk < phiramp:
+            q_excess += Q1[k]
+            Q1[k] = 0.
+            continue
+        Q1[k] = Q1[k] + q_excess
+        q_excess = 0.
+
+    kh2 = np.append(kh_inset, [0])  # for any layers below bottom
+    nlay1 = len(botm1)
+    nlay2 = len(botm2)
+
+    # all botms in both models, in reverse order (layer-positive)
+    allbotms = np.sort(np.unique(np.hstack([botm1, botm2])))[::-1]
+
+    # layer numbers in parent and child model for each flux connection between them
+    k1 = 0
+    k2 = 0
+    l1 = []
+    l2 = []
+    for botm in allbotms:
+        l1.append(k1)
+        l2.append(k2)
+        if botm in botm1:
+            k1 += 1
+        if botm in botm2:
+            k2 += 1
+    l1 = np.array(l1)
+    l2 = np.array(l2)
+    l2[l2 >= nlay2] = nlay2
+    l1[l1 >= nlay1] = nlay1 - 1
+
+    # thickness of all layer connections between parent and child models
+    # (assign 0 for connections above the water table)
+    b = np.diff(sorted([aqtop] + allbotms.tolist()), axis=0)[::-1]
+    b[allbotms > aqtop] = 0
+
+    # transmissivities and transmissivity fractions (weights)
+    T2 = kh2[l2] * b
+    T1 = []
+    for k in range(nlay1):
+        T1.append(np.sum(T2[l1 == k]))
+    tfrac = []
+    for i2, i1 in enumerate(l1):
+        itfrac = T2[i2] / T1[i1] if T2[i2] > 0 else 0
+        tfrac.append(itfrac)
+    tfrac = np.array(tfrac)
+
+    Qs = Q1[l1] * tfrac
+    Qs[np.isnan(Qs)] = 0
+    Q_inset = []
+    for k in range(nlay2):
+        Q_inset.append(Qs[l2 == k].sum())
+    return np.array(Q_inset)
+
+
+def test_distribute_parent_fluxes_to_inset():
+    # flux divided among pfl_nwt layers by transmissivity
+    Q_inset = distribute_parent_fluxes_to_inset(Q_parent=np.array([10.]),
+                                                botm_parent=np.array([0.]),
+                                                top_parent=10.,
+                                                botm_inset=np.array([5., 0.]),
+                                                kh_inset=np.array([1., 3.]),
+                                                water_table_parent=20.)
+    np.testing.assert_allclose(Q_inset, [2.5, 7.5])
+
+    # multiple locations at once give the same result
+    # as each location by itself
+    np.random.seed(0)
+    n = 100
+    top = np.random.uniform(90, 100, n)
+    botm_parent = top[:, None] - np.cumsum(np.random.uniform(5, 20, (n, 3)), axis=1)
+    botm_inset = top[:, None] - np.cumsum(np.random.uniform(13, 20, (n, 5)), axis=1)
+    # some layer bottoms that coincide
+    botm_inset[::5, 1] = botm_parent[::5, 0]
+    kh_inset = np.random.uniform(0.1, 50, (n, 5))
+    water_table = top + np.random.uniform(-10, 10, n)
+    Q_parent = np.random.uniform(-10, 10, (n, 3))
+    Q_parent[::7, 0] = np.nan
+    Q_inset = distribute_parent_fluxes_to_inset(Q_parent, botm_parent, top,
+                                                botm_inset, kh_inset, water_table)
+    assert Q_inset.shape == (n, 5)
+    for i in range(n):
+        Q_inset_i = distribute_parent_fluxes_to_inset(Q_parent[i], botm_parent[i], top[i],
+                                                      botm_inset[i], kh_inset[i],
+                                                      water_table[i])
+        np.testing.assert_allclose(Q_inset[i], Q_inset_i)
+        # same result as the original (looped) implementation
+        expected = distribute_parent_fluxes_to_inset_loop(Q_parent[i], botm_parent[i], top[i],
+                                                          botm_inset[i], kh_inset[i],
+                                                          water_table[i])
+        np.testing.assert_allclose(Q_inset[i], expected, atol=1e-10)
+    np.testing.assert_allclose(Q_inset.sum(axis=1), np.nansum(Q_parent, axis=1))
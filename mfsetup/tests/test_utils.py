@@ -2,7 +2,7 @@
 Tests for utils.py module
 """
 import pytest
-from ..utils import flatten, update
+from ..utils import flatten, update, parallel_map, get_packages_to_rebuild
 
 
 @pytest.fixture(scope="function")
@@ -45,3 +45,34 @@ def test_update(default_config, specified_config):
     # test that only keys in specified are updated
     assert 'parent' not in result
 
+
+
+def add(a, b):
+    return a + b
+
+
+@pytest.mark.parametrize('n_workers,processes', [(1, False),
+                                                 (4, False),
+                                                 (2, True)])
+def test_parallel_map(n_workers, processes):
+    a = list(range(20))
+    b = list(range(20, 40))
+    results = parallel_map(add, a, b, n_workers=n_workers, processes=processes)
+    assert results == [aa + bb for aa, bb in zip(a, b)]
+
+
+@pytest.mark.parametrize('changed,expected', [({'ic'}, ['ic']),
+                                              ({'wel'}, ['wel', 'obs']),
+                                              # circular dependency (dis <-> sfr)
+                                              ({'sfr'}, ['dis', 'ic', 'sfr', 'wel', 'obs']),
+                                              ({'ghb'}, ['dis', 'ic', 'ghb', 'sfr', 'wel', 'obs']),
+                                              (set(), [])])
+def test_get_packages_to_rebuild(changed, expected):
+    package_list = ['dis', 'ic', 'ghb', 'sfr', 'wel', 'obs']
+    dependencies = {'dis': ['sfr'],
+                    'ic': ['dis'],
+                    'sfr': ['dis', 'ghb'],
+                    'wel': ['dis', 'ghb', 'sfr'],
+                    'obs': ['dis', 'ghb', 'sfr', 'wel']}
+    rebuild = get_packages_to_rebuild(package_list, dependencies, changed)
+    assert rebuild == expected
@@ -67,7 +67,8 @@ def test_get_mean_pumping_rates(pfl_nwt_with_dis_bas6):
     assert np.allclose(compare.Q1, compare.Q2, rtol=0.02)
 
 
-def test_resample_pumping_rates(pleasant_nwt_with_dis_bas6):
+@pytest.mark.parametrize('dropna', [False, True])
+def test_resample_pumping_rates(pleasant_nwt_with_dis_bas6, dropna):
 
     m = pleasant_nwt_with_dis_bas6
     assert m.perioddata is not None
@@ -82,8 +83,16 @@ def test_resample_pumping_rates(pleasant_nwt_with_dis_bas6):
                                                           active_area=active_area
                                                           )
     wu_resampled = resample_pumping_rates(wu_file, wu_points, m,
-                                          active_area=active_area
+                                          active_area=active_area,
+                                          dropna=dropna
                                           )
+    # one row per site and transient stress period, unless periods without data are dropped
+    nsites = len(wu_resampled.index.unique())
+    ntransient = (~m.perioddata.steady).sum()
+    if dropna:
+        assert len(wu_resampled) <= nsites * ntransient
+    else:
+        assert len(wu_resampled) == nsites * ntransient
 
     for site in wu_resampled.index.unique():
         loc = (monthly_data.site_no == site) & \
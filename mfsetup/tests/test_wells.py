@@ -3,7 +3,8 @@ import numpy as np
 import pandas as pd
 import pytest
 from mfsetup.wells import (setup_wel_data, get_open_interval_thickness,
-                           get_package_stress_period_data)
+                           get_package_stress_period_data,
+                           copy_fluxes_to_subsequent_periods)
 
 
 @pytest.fixture(scope='function')
@@ -57,3 +58,36 @@ def test_get_package_stress_period_data(models_with_dis):
     elif models_with_dis.name == 'pfl':
         assert np.array_equal(result.per.unique(),
                               np.arange(models_with_dis.nper))
+
+
+def test_copy_fluxes_to_subsequent_periods():
+    df = pd.DataFrame({'per': [0, 2, 1, 3, 0, 0],
+                       'k': [0, 0, 0, 0, 1, 2],
+                       'i': [0, 0, 0, 0, 1, 1],
+                       'j': [0, 0, 1, 1, 1, 1],
+                       'flux': [-1., -3., -5., 0., -2., 0.],
+                       'comments': ['a', 'a', 'b', 'b', 'c', 'c']})
+    results = copy_fluxes_to_subsequent_periods(df)
+    results.sort_values(by=['comments', 'k', 'per'], inplace=True)
+    expected_per = [0, 1, 2, 3,  # gap in period 1 filled
+                    1, 2, 3,  # zero flux specified in period 3
+                    0, 1, 2, 3,  # copied to last specified period
+                    0]  # zero fluxes aren't copied
+    expected_flux = [-1., -1., -3., -3.,
+                     -5., -5., 0.,
+                     -2., -2., -2., -2.,
+                     0.]
+    assert results.per.tolist() == expected_per
+    assert results.flux.tolist() == expected_flux
+
+    # wells with more than one row in a period
+    df = pd.DataFrame({'per': [0, 0, 2],
+                       'k': [0, 0, 1],
+                       'i': [0, 0, 1],
+                       'j': [0, 0, 1],
+                       'flux': [-1., -2., -3.],
+                       'comments': ['a', 'a', 'b']})
+    results = copy_fluxes_to_subsequent_periods(df)
+    results.sort_values(by=['comments', 'per', 'flux'], inplace=True)
+    assert results.per.tolist() == [0, 0, 1, 1, 2, 2, 2]
+    assert results.flux.tolist() == [-2., -1., -2., -1., -2., -1., -3.]
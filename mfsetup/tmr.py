@@ -8,8 +8,7 @@ from flopy.utils import binaryfile as bf
 from flopy.utils.postprocessing import get_water_table
 #from .export import get_surface_bc_flux
 from .fileio import check_source_files
-from .discretization import weighted_average_between_layers
-from .interpolate import get_source_dest_model_xys, interp_weights, interpolate, regrid
+from .interpolate import get_source_dest_model_xys, Interpolator, interpolate, regrid
 from .grid import get_ij
 from .units import convert_length_units
 import numpy as np
@@ -36,6 +35,10 @@ class Tmr:
 
     Notes
     -----
+    The parent model head and cell budget files are opened once (on first access
+    of the :attr:`hdsobj` and :attr:`cbbobj` attributes), and the readers
+    are reused for all stress periods. Use :meth:`close` to release the files.
+
     Assumptions:
     * Uniform parent and pfl_nwt grids, with equal delr and delc spacing.
     * Inset model upper right corner coincides with an upper right corner of a cell
@@ -67,8 +70,14 @@ class Tmr:
         self.parent = parent_model
         self.inset._set_parent_modelgrid()
         self.cbc = None
+        self._cbc_kstpkper = None
+        self._hdsobj = None
+        self._cbbobj = None
         self._inset_parent_layer_mapping = inset_parent_layer_mapping
         self._source_mask = None
+        self._interpolator = None
+        self._boundary_interpolator = None
+        self._boundary_interpolator_cells = None
         self._inset_parent_period_mapping = inset_parent_period_mapping
         if parent_length_units is None:
             parent_length_units = self.inset.cfg['parent']['length_units']
@@ -142,6 +151,35 @@ class Tmr:
     def inset_parent_period_mapping(self, inset_parent_period_mapping):
         self._inset_parent_period_mapping = inset_parent_period_mapping
 
+    @property
+    def hdsobj(self):
+        """Parent model head file reader, opened on first access.
+        Record positions are indexed once when the file is opened,
+        so that subsequent reads for each stress period only seek
+        to the requested records."""
+        if self._hdsobj is None:
+            check_source_files([self.hpth])
+            self._hdsobj = bf.HeadFile(self.hpth)
+        return self._hdsobj
+
+    @property
+    def cbbobj(self):
+        """Parent model cell budget file reader, opened on first access
+        (see :attr:`hdsobj`)."""
+        if self._cbbobj is None:
+            check_source_files([self.cpth])
+            self._cbbobj = bf.CellBudgetFile(self.cpth)
+        return self._cbbobj
+
+    def close(self):
+        """Close the parent model head and cell budget files,
+        if they are open."""
+        for attr in '_hdsobj', '_cbbobj':
+            fileobj = getattr(self, attr)
+            if fileobj is not None:
+                fileobj.close()
+                setattr(self, attr, None)
+
     @property
     def _source_grid_mask(self):
         """Boolean array indicating window in parent model grid (subset of cells)
@@ -163,15 +201,22 @@ class Tmr:
         return self._source_mask
 
     @property
-    def interp_weights(self):
-        """For a given parent, only calculate interpolation weights
+    def interpolator(self):
+        """For a given parent, only triangulate the parent model cell centers
         once to speed up re-gridding of arrays to pfl_nwt."""
-        if self._interp_weights is None:
+        if self._interpolator is None:
             source_xy, dest_xy = get_source_dest_model_xys(self.parent.modelgrid,
-                                                           self.inset.modelgrid,
+                                                           self.inset,
                                                            source_mask=self._source_grid_mask)
-            self._interp_weights = interp_weights(source_xy, dest_xy)
-        return self._interp_weights
+            self._interpolator = Interpolator(source_xy, dest_xy,
+                                              cache_dir=getattr(self.inset, 'interp_weights_cache', None))
+        return self._interpolator
+
+    @property
+    def interp_weights(self):
+        """For a given parent, only calculate interpolation weights
+        once to speed up re-gridding of arrays to pfl_nwt."""
+        return self.interpolator.weights
 
     def regrid_from_parent(self, source_array,
                                  mask=None,
@@ -196,6 +241,13 @@ class Tmr:
             Interpolation method.
         """
         if mask is not None:
+            mask = mask.astype(bool)
+            # reuse the cached triangulation if the mask is within the parent model window
+            if method == 'linear' and not np.any(mask & ~self._source_grid_mask):
+                regridded = self.interpolator.interpolate(source_array[self._source_grid_mask],
+                                                          valid=mask[self._source_grid_mask])
+                return np.reshape(regridded, (self.inset.modelgrid.nrow,
+                                              self.inset.modelgrid.ncol))
             return regrid(source_array, self.parent.modelgrid, self.inset.modelgrid,
                           mask1=mask,
                           method=method)
@@ -256,8 +308,8 @@ class Tmr:
 
         Parameters
         ----------
-        i, j : int
-            Cell in parent model connected to boundary of pfl_nwt model.
+        i, j : int or sequence of ints
+            Cell(s) in parent model connected to boundary of pfl_nwt model.
         pi0, pj0 : int
             Parent cell coinciding with origin (0, 0) cell of pfl_nwt model
         refinement : int
@@ -269,39 +321,34 @@ class Tmr:
         -------
         i, j : 1D arrays of ints
             Corresponding i, j locations along boundary of pfl_nwt grid
+            (2D arrays of shape n parent cells x refinement if
+            sequences of parent cells were supplied)
         """
+        scalar = np.isscalar(i)
         pi0, pj0 = self.pi0, self.pj0
         refinement = self.refinement
+        i = np.atleast_1d(i)[:, np.newaxis]
+        j = np.atleast_1d(j)[:, np.newaxis]
+        offsets = np.arange(refinement)[np.newaxis, :]
 
         if side == 'top':
-            ij0 = (j - pj0) * refinement
-            ij1 = np.min([ij0 + refinement,
-                          self.inset.ncol])
-            ij = np.arange(ij0, ij1)
-            ii = np.array([0] * len(ij))
+            ij = (j - pj0) * refinement + offsets
+            ii = np.zeros_like(ij)
         elif side == 'left':
-            ii0 = (i - pi0) * refinement
-            ii1 = np.min([ii0 + refinement,
-                          self.inset.nrow])
-            ii = np.arange(ii0, ii1)
-            ij = np.array([0] * len(ii))
+            ii = (i - pi0) * refinement + offsets
+            ij = np.zeros_like(ii)
         elif side == 'right':
-            ii0 = (i - pi0) * refinement
-            ii1 = np.min([ii0 + refinement,
-                          self.inset.nrow])
-            ii = np.arange(ii0, ii1)
-            ij0 = np.min([(j - pj0 + 1) * refinement,
-                          self.inset.ncol]) - 1
-            ij = np.array([ij0] * len(ii))
+            ii = (i - pi0) * refinement + offsets
+            ij0 = np.minimum((j - pj0 + 1) * refinement,
+                             self.inset.ncol) - 1
+            ij = np.broadcast_to(ij0, ii.shape).copy()
         elif side == 'bottom':
-            # Needed to adjust
-            ij0 = (j - pj0) * refinement
-            ij1 = np.min([ij0 + refinement,
-                          self.inset.ncol + 1])
-            ij = np.arange(ij0, ij1)
-            ii0 = np.min([(i - pi0 + 1) * refinement,
-                          self.inset.nrow]) - 1
-            ii = np.array([ii0] * len(ij))
+            ij = (j - pj0) * refinement + offsets
+            ii0 = np.minimum((i - pi0 + 1) * refinement,
+                             self.inset.nrow) - 1
+            ii = np.broadcast_to(ii0, ij.shape).copy()
+        if scalar:
+            return ii[0], ij[0]
         return ii, ij
 
     def get_inset_boundary_flux_side(self, side):
@@ -323,44 +370,45 @@ class Tmr:
             quantities for the pfl_nwt model side.
         """
         parent_cells = self.get_parent_cells(side=side)
+        i, j = parent_cells
         nlay_inset = self.inset.nlay
 
-        Qside = []  # boundary fluxes
-        kside = []  # k locations of boundary fluxes
-        iside = []  # i locations ...
-        jside = []
-        for i, j in zip(*parent_cells):
-
-            # get the pfl_nwt model cells
-            ii, jj = self.get_inset_cells(i, j, side=side)
-
-            # parent model flow and layer bottoms
-            Q_parent = self.cbc[self.flow_component[side]][:, i, j] * self.flow_sign[side]
-            botm_parent = self.parent.dis.botm.array[:, i, j]
-
-            # pfl_nwt model bottoms, and K
-            # assume equal transmissivity for child cell to a parent cell, within each layer
-            # (use average child cell k and thickness for each layer)
-            # These are the layer bottoms for the pfl_nwt
-            botm_inset = self.inset.dis.botm.array[:, ii, jj].mean(axis=1, dtype=np.float64)
-            # These are the ks from the pfl_nwt model
-            kh_inset = self.inset.upw.hk.array[:, ii, jj].mean(axis=1, dtype=np.float64)
-
-            # determine aquifer top
-            water_table_parent = self.wt[i, j]
-            top_parent = self.parent.dis.top.array[i, j]
-
-            Q_inset_ij = distribute_parent_fluxes_to_inset(Q_parent=Q_parent,
-                                                           botm_parent=botm_parent,
-                                                           top_parent=top_parent,
-                                                           botm_inset=botm_inset,
-                                                           kh_inset=kh_inset,
-                                                           water_table_parent=water_table_parent)
-            assert len(ii) == self.refinement # no partial parent cells
-            Qside += np.array(list(Q_inset_ij / self.refinement) * len(ii)).ravel().tolist()
-            kside += list(range(0, nlay_inset)) * len(ii)
-            iside += sorted(ii.tolist() * nlay_inset)
-            jside += sorted(jj.tolist() * nlay_inset)
+        # get the pfl_nwt model cells (n parent cells x refinement)
+        ii, jj = self.get_inset_cells(i, j, side=side)
+        # no partial parent cells
+        assert np.all((ii >= 0) & (ii < self.inset.nrow) &
+                      (jj >= 0) & (jj < self.inset.ncol))
+
+        # parent model flow and layer bottoms (n parent cells x n parent layers)
+        Q_parent = self.cbc[self.flow_component[side]][:, i, j].T * self.flow_sign[side]
+        botm_parent = self.parent.dis.botm.array[:, i, j].T
+
+        # pfl_nwt model bottoms, and K
+        # assume equal transmissivity for child cell to a parent cell, within each layer
+        # (use average child cell k and thickness for each layer)
+        # These are the layer bottoms for the pfl_nwt
+        botm_inset = self.inset.dis.botm.array[:, ii, jj].mean(axis=2, dtype=np.float64).T
+        # These are the ks from the pfl_nwt model
+        kh_inset = self.inset.upw.hk.array[:, ii, jj].mean(axis=2, dtype=np.float64).T
+
+        # determine aquifer top
+        water_table_parent = self.wt[i, j]
+        top_parent = self.parent.dis.top.array[i, j]
+
+        Q_inset = distribute_parent_fluxes_to_inset(Q_parent=Q_parent,
+                                                    botm_parent=botm_parent,
+                                                    top_parent=top_parent,
+                                                    botm_inset=botm_inset,
+                                                    kh_inset=kh_inset,
+                                                    water_table_parent=water_table_parent)
+        # distribute the fluxes evenly to the child cells for each parent cell;
+        # in order of parent cell, child cell, then layer
+        nparent, nchild = ii.shape
+        Qside = np.broadcast_to(Q_inset[:, np.newaxis, :] / self.refinement,
+                                (nparent, nchild, nlay_inset)).ravel()
+        kside = np.tile(np.arange(nlay_inset), nparent * nchild)
+        iside = np.repeat(ii.ravel(), nlay_inset)
+        jside = np.repeat(jj.ravel(), nlay_inset)
 
         # check that fluxes for the side match the parent
         Qparent_side = self.get_parent_boundary_fluxes_side(parent_cells[0],
@@ -395,44 +443,46 @@ class Tmr:
         t0 = time.time()
         print('getting boundary fluxes from {}...'.format(self.cpth))
         dfs = []
+        tol = 0.01
         for kp in kstpkper:
-            hdsobj = bf.HeadFile(self.hpth)
-            hds = hdsobj.get_data(kstpkper=kp)
+            hds = self.hdsobj.get_data(kstpkper=kp)
             hdry = -9999
             self.wt = get_water_table(hds, nodata=hdry)
 
             self.read_parent_cbc_per(kstpkper=kp)
 
+            Qnet_inset = 0
             for side in ['top', 'left', 'bottom', 'right']:
                 print(side)
                 Qside = self.get_inset_boundary_flux_side(side)
                 Qside['per'] = kp[1]
+                Qnet_inset += Qside.flux.sum()
                 dfs.append(Qside)
 
-        df = pd.concat(dfs)
-
-        # check that Qnet out of the parent model equals
-        # the derived fluxes on the pfl_nwt side
-        tol = 0.01
-        for per, dfp in df.groupby('per'):
-
-            Qnet_parent = self.get_parent_boundary_net_flux(kstpkper=per)
-            Qnet_inset = dfp.flux.sum()
+            # check that Qnet out of the parent model equals
+            # the derived fluxes on the pfl_nwt side
+            Qnet_parent = self.get_parent_boundary_net_flux(kstpkper=kp)
             assert np.abs(Qnet_parent - Qnet_inset) < tol
 
+        df = pd.concat(dfs)
+
         print("finished in {:.2f}s\n".format(time.time() - t0))
         return df
 
     def read_parent_cbc_per(self, kstpkper=(0, 0)):
-        cbbobj = bf.CellBudgetFile(self.cpth)
+        kstpkper = tuple(kstpkper)
+        # fluxes for this period were already read
+        if self.cbc is not None and kstpkper == self._cbc_kstpkper:
+            return
         text = {'FLOW RIGHT FACE': 'frf',
                 'FLOW FRONT FACE': 'fff'}
         self.cbc = {}
         for fulltxt, shorttxt in text.items():
-            self.cbc[shorttxt] = get_surface_bc_flux(cbbobj, fulltxt,
+            self.cbc[shorttxt] = get_surface_bc_flux(self.cbbobj, fulltxt,
                                                      kstpkper=kstpkper, idx=0)
+        self._cbc_kstpkper = kstpkper
 
-    def get_parent_boundary_fluxes_side(self, i, j, side, kstpkper=(0, 0)):
+    def get_parent_boundary_fluxes_side(self, i, j, side, kstpkper=None):
         """Get boundary fluxes at a sequence of i, j locations
         in the parent model, for a specified side of the pfl_nwt model,
         for a given stress period.
@@ -444,7 +494,9 @@ class Tmr:
         side : str
             left, right, top or bottom
         kstpkper : tuple
-            (timestep, Stress Period)
+            (timestep, Stress Period). By default, None, in which case
+            the parent model fluxes that were last read are used
+            (or (0, 0), if no fluxes have been read yet).
 
         Returns
         -------
@@ -456,19 +508,23 @@ class Tmr:
             even though MODFLOW fluxes are right-positive.
             Shape: (n parent layers, len(i, j))
         """
-        if self.cbc is None:
+        if kstpkper is not None:
             self.read_parent_cbc_per(kstpkper=kstpkper)
+        elif self.cbc is None:
+            self.read_parent_cbc_per()
         Qside_parent = self.cbc[self.flow_component[side]][:, i, j] * self.flow_sign[side]
         #Qside_inset = self.get_inset_boundary_flux_side(side)
 
         return Qside_parent
 
-    def get_parent_boundary_net_flux(self, kstpkper=(0, 0)):
+    def get_parent_boundary_net_flux(self, kstpkper=None):
         """
 
         Parameters
         ----------
-        kstpkper : int, Stress Period
+        kstpkper : tuple
+            (timestep, Stress Period). By default, None, in which case
+            the parent model fluxes that were last read are used.
 
         Returns
         -------
@@ -538,82 +594,156 @@ class Tmr:
         for k, v in components.items():
             print('{} {parent} {inset}'.format(k, **v))
 
-    def get_inset_boundary_heads(self):
+    def get_boundary_interpolator(self, i, j):
+        """Interpolator from the parent model window (see
+        :attr:`_source_grid_mask`) to a subset of pfl_nwt model cell centers
+        (for example, the cells along the model perimeter).
+
+        Parameters
+        ----------
+        i, j : 1D arrays of ints
+            Row, column locations of pfl_nwt model cells.
+
+        Returns
+        -------
+        interpolator : mfsetup.interpolate.Interpolator instance
+        """
+        i, j = np.atleast_1d(i), np.atleast_1d(j)
+        if self._boundary_interpolator is not None:
+            bi, bj = self._boundary_interpolator_cells
+            if np.array_equal(i, bi) and np.array_equal(j, bj):
+                return self._boundary_interpolator
+        source_xy, _ = get_source_dest_model_xys(self.parent.modelgrid,
+                                                 self.inset,
+                                                 source_mask=self._source_grid_mask)
+        dest_xy = np.array([self.inset.modelgrid.xcellcenters[i, j],
+                            self.inset.modelgrid.ycellcenters[i, j]]).transpose()
+        self._boundary_interpolator = Interpolator(source_xy, dest_xy,
+                                                   cache_dir=getattr(self.inset, 'interp_weights_cache', None))
+        self._boundary_interpolator_cells = i, j
+        return self._boundary_interpolator
+
+    def get_layer_weights(self, nlay_parent):
+        """Get the parent model layers and weights for computing
+        pfl_nwt model layer values, as weighted averages
+        of consecutive parent model layers, based on
+        :attr:`inset_parent_layer_mapping`.
+
+        Parameters
+        ----------
+        nlay_parent : int
+            Number of layers in the parent model.
 
+        Returns
+        -------
+        source_k0, source_k1 : 1D arrays of ints
+            First and second parent model layer for each
+            pfl_nwt model layer (the same, if a pfl_nwt layer is
+            copied from a single parent layer).
+        weight0 : 1D array of floats
+            Weight applied to source_k0 (1 - weight0 is applied to source_k1).
+        """
+        nlay = self.inset.nlay
+        source_k0 = np.zeros(nlay, dtype=int)
+        source_k1 = np.zeros(nlay, dtype=int)
+        weight0 = np.ones(nlay)
+        for dest_k, source_k in self.inset_parent_layer_mapping.items():
+
+            # destination model layers copied from source model layers
+            if source_k <= 0:
+                continue
+            elif np.round(source_k, 4) in range(nlay_parent):
+                source_k0[dest_k] = source_k1[dest_k] = int(np.round(source_k, 4))
+            # destination model layers that are a weighted average
+            # of consecutive source model layers
+            else:
+                weight0[dest_k] = source_k - np.floor(source_k)
+                # first layer in the average can't be negative
+                source_k0[dest_k] = np.max([int(np.floor(source_k)), 0])
+                source_k1[dest_k] = int(np.ceil(source_k))
+        return source_k0, source_k1, weight0
+
+    def get_inset_boundary_heads(self, batch_size=100):
+        """Get heads from the parent model, interpolated to the
+        active cells along the pfl_nwt model perimeter.
+
+        Interpolation weights are only computed for the perimeter cell
+        locations (instead of the whole pfl_nwt model grid), and are
+        applied to the heads for all of the layers in a batch of
+        parent model stress periods at once (in one sparse matrix
+        product for each set of valid parent model cells).
+
+        Parameters
+        ----------
+        batch_size : int
+            Number of parent model stress periods to interpolate at once.
+            By default, 100.
+
+        Returns
+        -------
+        df : DataFrame
+            Columns per, k, i, j, bhead; with interpolated
+            heads at each perimeter cell location, for each
+            pfl_nwt model stress period.
+        """
         # source data
-        headfile = self.hpth
         vmin, vmax = -1e30, 1e30,
-        check_source_files([headfile])
-        hdsobj = bf.HeadFile(headfile) #, precision='single')
+        hdsobj = self.hdsobj
         all_kstpkper = hdsobj.get_kstpkper()
 
         # get the last timestep in each stress period if there are more than one
-        #kstpkper = []
-        #unique_kper = []
-        #for (kstp, kper) in all_kstpkper:
-        #    if kper not in unique_kper:
-        #        kstpkper.append((kstp, kper))
-        #        unique_kper.append(kper)
         last_steps = {kper: kstp for kstp, kper in all_kstpkper}
 
-        #assert len(unique_kper) == len(set(self.copy_stress_periods)), \
-        #"read {} from {},\nexpected stress periods: {}".format(kstpkper,
-        #                                                       headfile,
-        #                                                       sorted(list(set(self.copy_stress_periods)))
-        #                                                       )
-
         # get active cells along model perimeter
         k, i, j = self.inset.get_boundary_cells(exclude_inactive=True)
+        # unique row, column locations along the perimeter;
+        # heads are only interpolated to these locations
+        ncol = self.inset.ncol
+        columns, column_idx = np.unique(i * ncol + j, return_inverse=True)
+        interpolator = self.get_boundary_interpolator(*np.divmod(columns, ncol))
+
+        # skip getting data if parent period is already represented
+        # (heads will be reused)
+        parent_periods = {}
+        for inset_per, parent_per in self.inset_parent_period_mapping.items():
+            if parent_per not in parent_periods.values():
+                parent_periods[inset_per] = parent_per
 
         # get heads from parent model
-        # TODO: generalize head extraction from parent model using 3D interpolation
-
+        # (for the parent model cells in the interpolation window)
+        # for pfl_nwt model layers that are a weighted average
+        # of consecutive parent model layers
+        bheads = {}
+        source_k0, source_k1, weight0 = None, None, None
+        unique_parent_periods = list(parent_periods.values())
+        for b0 in range(0, len(unique_parent_periods), batch_size):
+            batch = unique_parent_periods[b0:b0 + batch_size]
+            values = []
+            for parent_per in batch:
+                parent_kstpkper = last_steps[parent_per], parent_per
+                hds = hdsobj.get_data(kstpkper=parent_kstpkper)
+                if source_k0 is None:
+                    source_k0, source_k1, weight0 = self.get_layer_weights(hds.shape[0])
+                hds = hds[:, self._source_grid_mask]
+                values.append(weight0[:, np.newaxis] * hds[source_k0] +
+                              (1 - weight0[:, np.newaxis]) * hds[source_k1])
+            values = np.reshape(values, (len(batch) * self.inset.nlay, -1))
+            # exclude invalid values in interpolation from parent model
+            valid = (values > vmin) & (values < vmax)
+            regridded = interpolator.interpolate_stack(values, valid=valid)
+            regridded = np.reshape(regridded, (len(batch), self.inset.nlay, -1))
+            for parent_per, regridded_per in zip(batch, regridded):
+                bheads[parent_per] = regridded_per[k, column_idx] * self.length_unit_conversion
+
+        # drop heads in dry cells, but only in mf6
+        # too much trouble with interpolated heads in mf2005
+        if self.inset.version == 'mf6':
+            botm = self.inset.dis.botm.array[k, i, j]
         dfs = []
-        parent_periods = []
-        for inset_per, parent_per in self.inset_parent_period_mapping.items():
-            # skip getting data if parent period is already represented
-            # (heads will be reused)
-            if parent_per in parent_periods:
-                continue
-            else:
-                parent_periods.append(parent_per)
-            parent_kstpkper = last_steps[parent_per], parent_per
-            hds = hdsobj.get_data(kstpkper=parent_kstpkper)
-
-            regridded = np.zeros((self.inset.nlay, self.inset.nrow, self.inset.ncol))
-            for dest_k, source_k in self.inset_parent_layer_mapping.items():
-
-                # destination model layers copied from source model layers
-                if source_k <= 0:
-                    arr = hds[0]
-                elif np.round(source_k, 4) in range(hds.shape[0]):
-                    source_k = int(np.round(source_k, 4))
-                    arr = hds[source_k]
-                # destination model layers that are a weighted average
-                # of consecutive source model layers
-                else:
-                    weight0 = source_k - np.floor(source_k)
-                    source_k0 = int(np.floor(source_k))
-                    # first layer in the average can't be negative
-                    source_k0 = 0 if source_k0 < 0 else source_k0
-                    source_k1 = int(np.ceil(source_k))
-                    arr = weighted_average_between_layers(hds[source_k0],
-                                                          hds[source_k1],
-                                                          weight0=weight0)
-                # interpolate from source model using source model grid
-                # exclude invalid values in interpolation from parent model
-                mask = self._source_grid_mask & (arr > vmin) & (arr < vmax)
-
-                regriddedk = self.regrid_from_parent(arr, mask=mask, method='linear')
-
-                assert regriddedk.shape == self.inset.modelgrid.shape[1:]
-                regridded[dest_k] = regriddedk * self.length_unit_conversion
-
-            # drop heads in dry cells, but only in mf6
-            # too much trouble with interpolated heads in mf2005
-            bhead = regridded[k, i, j]
+        for inset_per, parent_per in parent_periods.items():
+            bhead = bheads[parent_per]
             if self.inset.version == 'mf6':
-                wet = bhead > self.inset.dis.botm.array[k, i, j]
+                wet = bhead > botm
             else:
                 wet = np.ones(len(bhead)).astype(bool)
 
@@ -637,6 +767,10 @@ def distribute_parent_fluxes_to_inset(Q_parent, botm_parent, top_parent,
     pfl_nwt model, based on pfl_nwt model layer transmissivities, accounting for the
     position of the water table in the parent model.
 
+    Multiple locations can be processed at once, by supplying 2D arrays
+    with a leading dimension of n locations (and 1D arrays of length n
+    locations for top_parent and water_table_parent).
+
     Parameters
     ----------
     Q_parent : 1D array,
@@ -668,68 +802,61 @@ def distribute_parent_fluxes_to_inset(Q_parent, botm_parent, top_parent,
         model, for the group of pfl_nwt model cells corresponding to parent
         location i, j (represents the sum of horizontal flux through the
         boundary face of the pfl_nwt model cells in each layer).
-        (Length is n pfl_nwt layers).
+        (Length is n pfl_nwt layers; 2D array of shape n locations x n pfl_nwt
+        layers if multiple locations were supplied).
 
     """
+    single_location = np.ndim(Q_parent) == 1
+    # rename variables
+    Q1 = np.array(Q_parent, dtype=float, ndmin=2)
+    botm1 = np.array(botm_parent, dtype=float, ndmin=2)
+    top1 = np.atleast_1d(np.array(top_parent, dtype=float))
+    botm2 = np.array(botm_inset, dtype=float, ndmin=2)
+    kh2 = np.array(kh_inset, dtype=float, ndmin=2)
+    water_table = np.atleast_1d(np.array(water_table_parent, dtype=float))
 
     # check dimensions
     txt = "Length of {0} {1} is {2}; " \
           "length of {0} botm elevation is {3}"
-    assert len(Q_parent) == len(botm_parent), \
-        txt.format('parent', 'fluxes', len(Q_parent), len(botm_parent))
-    assert len(botm_inset) == len(kh_inset), \
-        txt.format('pfl_nwt', 'kh_inset', len(kh_inset), len(botm_inset))
-
-    # rename variables
-    Q1 = Q_parent
-    botm1 = botm_parent
-    botm2 = botm_inset
-    kh2 = kh_inset
-    aqtop = water_table_parent if water_table_parent < top_parent \
-        else top_parent  # top of the aquifer
+    assert Q1.shape[1] == botm1.shape[1], \
+        txt.format('parent', 'fluxes', Q1.shape[1], botm1.shape[1])
+    assert botm2.shape[1] == kh2.shape[1], \
+        txt.format('pfl_nwt', 'kh_inset', kh2.shape[1], botm2.shape[1])
+    nlocations, nlay1 = Q1.shape
+    nlay2 = botm2.shape[1]
+    # top of the aquifer
+    aqtop = np.where(water_table < top1, water_table, top1)
 
     # Replace nans with 0s bc these are where cells are dry
     Q1[np.isnan(Q1)] = 0
     # In parent model cells with sat thickness fraction less than phiramp,
     # Distribute flux to next layer with sat thickness frac > phiramp
-    b_parent = -np.diff(np.array([top_parent] + list(botm_parent)))
-    sthick = aqtop - botm_parent
+    b_parent = -np.diff(np.column_stack([top1, botm1]), axis=1)
+    sthick = aqtop[:, np.newaxis] - botm1
     confined = (sthick - b_parent) > 0
     sthick[confined] = b_parent[confined]
     stfrac = sthick/b_parent
-    q_excess = 0.
-    for k, stfk in enumerate(stfrac):
-        if stfk < phiramp:
-            q_excess += Q1[k]
-            Q1[k] = 0.
-            continue
-        Q1[k] = Q1[k] + q_excess
-        q_excess = 0.
-
-    kh2 = np.append(kh2, [0])  # for any layers below bottom
-
-    nlay1 = len(botm1)
-    nlay2 = len(botm2)
+    q_excess = np.zeros(nlocations)
+    for k in range(nlay1):
+        below_phiramp = stfrac[:, k] < phiramp
+        q_excess[below_phiramp] += Q1[below_phiramp, k]
+        Q1[below_phiramp, k] = 0.
+        Q1[~below_phiramp, k] += q_excess[~below_phiramp]
+        q_excess[~below_phiramp] = 0.
 
     # all botms in both models, in reverse order (layer-positive)
-    allbotms = np.sort(np.unique(np.hstack([botm1, botm2])))[::-1]
-
-    # list layer numbers in parent and child model;
+    # (a botm at the same elevation in both models
+    # results in an additional connection of zero thickness)
+    allbotms = np.hstack([botm1, botm2])
+    in_parent = np.array([True] * nlay1 + [False] * nlay2)
+    order = np.argsort(-allbotms, axis=1, kind='stable')
+    allbotms = np.take_along_axis(allbotms, order, axis=1)
+    in_parent = in_parent[order]
+
+    # layer numbers in parent and child model;
     # for each flux connection between them
-    k1 = 0
-    k2 = 0
-    l1 = []  # layer in parent model
-    l2 = []  # layer in child model
-    for botm in allbotms:
-        l1.append(k1)
-        l2.append(k2)
-        if botm in botm1:
-            k1 += 1
-        if botm in botm2:
-            k2 += 1
-
-    l1 = np.array(l1) # parent cell connections for pfl_nwt cells
-    l2 = np.array(l2) # pfl_nwt cell connections for parent cells
+    l1 = np.cumsum(in_parent, axis=1) - in_parent  # parent cell connections for pfl_nwt cells
+    l2 = np.cumsum(~in_parent, axis=1) - ~in_parent  # pfl_nwt cell connections for parent cells
 
     # if bottom of pfl_nwt hangs below bottom of parent;
     # last layer will >= nlay. Assign T=0 to these intervals.
@@ -741,40 +868,41 @@ def distribute_parent_fluxes_to_inset(Q_parent, botm_parent, top_parent,
     # thickness of all layer connections between
     # parent and child models
     # (assign 0 for connections above the water table)
-    b = np.diff(sorted([aqtop] + allbotms.tolist()), axis=0)[::-1]
-    b[allbotms > aqtop] = 0
+    tops = np.column_stack([np.full(nlocations, np.inf), allbotms[:, :-1]])
+    b = np.minimum(tops, aqtop[:, np.newaxis]) - allbotms
+    b[allbotms > aqtop[:, np.newaxis]] = 0
 
     # get transmissivities
-    T2 = kh2[l2] * b
-    T1 = []
-    for k in range(nlay1):
-        T1.append(np.sum(T2[l1 == k]))
+    kh2 = np.column_stack([kh2, np.zeros(nlocations)])  # for any layers below bottom
+    T2 = np.take_along_axis(kh2, l2, axis=1) * b
+    location = np.arange(nlocations)[:, np.newaxis]
+    T1 = np.bincount((location * nlay1 + l1).ravel(), weights=T2.ravel(),
+                     minlength=nlocations * nlay1).reshape(nlocations, nlay1)
 
     # get transmissivity fractions (weights)
-    tfrac = []
     # for each parent/pfl_nwt connection
-    for i2, i1 in enumerate(l1):
-        # compute transmissivity fraction  (of parent cell)
-        itfrac = T2[i2] / T1[i1] if T2[i2] > 0 else 0
-        tfrac.append(itfrac)
-    tfrac = np.array(tfrac)
+    # compute transmissivity fraction  (of parent cell)
+    tfrac = np.zeros_like(T2)
+    has_t = T2 > 0
+    tfrac[has_t] = T2[has_t] / np.take_along_axis(T1, l1, axis=1)[has_t]
 
     # assign incoming flux to each pfl_nwt/parent connection
     # multiply by weight
-    Qs = Q1[l1] * tfrac
+    Qs = np.take_along_axis(Q1, l1, axis=1) * tfrac
 
     # Where nan, make 0
     Qs[np.isnan(Qs)] = 0
-    np.savetxt('../qs.dat', Qs)
     # sum fluxes by pfl_nwt model layer
-    Q_inset = []
-    for k in range(nlay2):
-        Q_inset.append(Qs[l2 == k].sum())
+    Q_inset = np.bincount((location * (nlay2 + 1) + l2).ravel(), weights=Qs.ravel(),
+                          minlength=nlocations * (nlay2 + 1)).reshape(nlocations, nlay2 + 1)
+    Q_inset = Q_inset[:, :nlay2]
 
     # check that total flux through column of cells
     # matches for pfl_nwt layers and parent layers
-    assert np.abs(np.abs(np.sum(Q_parent)) - np.abs(np.sum(Q_inset))) < 1e-3
-    return np.array(Q_inset)
+    assert np.all(np.abs(np.abs(np.sum(Q1, axis=1)) - np.abs(np.sum(Q_inset, axis=1))) < 1e-3)
+    if single_location:
+        return Q_inset[0]
+    return Q_inset
 
 
 if __name__ == '__main__':
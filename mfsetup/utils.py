@@ -1,5 +1,6 @@
 import collections
 import inspect
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import pprint
 import numpy as np
 
@@ -39,6 +40,40 @@ def update(d, u):
     return d
 
 
+def get_packages_to_rebuild(package_list, dependencies, changed):
+    """Get the packages that need to be set up again, given
+    the packages with changed input, and the packages
+    that each package depends on.
+
+    Parameters
+    ----------
+    package_list : list of str
+        Packages in the model, in setup order.
+    dependencies : dict
+        Lists of packages that each package depends on, keyed by package.
+        Dependencies can be circular (for example, the DIS package idomain
+        array depends on the SFR package, which depends on the DIS package).
+    changed : set of str
+        Packages with changed input.
+
+    Returns
+    -------
+    rebuild : list of str
+        Packages in changed, and any packages that depend on them
+        (directly or indirectly), in setup order.
+    """
+    rebuild = {p for p in package_list if p in changed}
+    added = True
+    while added:
+        added = False
+        for package in package_list:
+            if package not in rebuild and \
+                    any(p in rebuild for p in dependencies.get(package, [])):
+                rebuild.add(package)
+                added = True
+    return [p for p in package_list if p in rebuild]
+
+
 def get_input_arguments(kwargs, function, warn=True, exclude=[]):
     """Return subset of keyword arguments in kwargs dict
     that are valid parameters to a function or method.
@@ -95,3 +130,35 @@ def get_packages(namefile):
                 packages.append(line.lower().split()[0])
     return packages
 
+
+
+def parallel_map(func, *iterables, n_workers=1, processes=False):
+    """Apply a function to every item of one or more iterables
+    (like the builtin map), using a pool of workers.
+
+    Parameters
+    ----------
+    func : callable
+        For a pool of processes, func and its arguments must be
+        picklable (e.g. a module-level function).
+    *iterables : one or more iterables of arguments to func
+    n_workers : int
+        Number of workers. By default (1), items are processed
+        serially, without creating a pool.
+    processes : bool
+        Option to use a pool of processes instead of threads,
+        for functions that don't release the GIL (for example,
+        writing text with np.savetxt). (default False)
+
+    Returns
+    -------
+    results : list
+        Results of func, in the same order as the input items,
+        regardless of which worker finishes first.
+    """
+    args = list(zip(*iterables))
+    if n_workers is None or n_workers <= 1 or len(args) <= 1:
+        return [func(*a) for a in args]
+    Executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with Executor(max_workers=min(n_workers, len(args))) as executor:
+        return list(executor.map(func, *zip(*args)))
@@ -6,7 +6,7 @@ import pandas as pd
 from shapely.geometry import Polygon, MultiPolygon
 from gisutils import shp2df
 from .discretization import get_layer, get_layer_thicknesses
-from .grid import get_ij
+from .grid import get_ij, get_points_within
 from mfsetup.units import convert_volume_units, get_length_units
 import mfsetup.wells as wells
 
@@ -81,7 +81,8 @@ def read_wdnr_monthly_water_use(wu_file, wu_points, model,
     elif isinstance(active_area, Polygon):
         features = active_area
 
-    within = [g.within(features) for g in locs.geometry]
+    x, y = np.array([g.coords[0] for g in locs.geometry]).reshape(-1, 2).transpose()
+    within = get_points_within(x, y, features)
     assert len(within) > 0, txt
     locs = locs.loc[within].copy()
     if len(locs) == 0:
@@ -172,8 +173,9 @@ def read_wdnr_monthly_water_use(wu_file, wu_points, model,
     # reset the index to move multi-index levels back out to columns
     stacked = monthly_data.set_index(['site_no', 'year']).stack().reset_index()
     stacked.columns = ['site_no', 'year', 'month', 'gallons']
-    stacked['datetime'] = pd.to_datetime(['{}-{:02d}'.format(y, m)
-                                          for y, m in zip(stacked.year, stacked.month)])
+    stacked['datetime'] = pd.to_datetime({'year': stacked.year,
+                                          'month': stacked.month,
+                                          'day': 1})
     monthly_data = stacked
     return well_info, monthly_data
 
@@ -338,47 +340,40 @@ def resample_pumping_rates(wu_file, wu_points, model,
         perioddata = model.perioddata.copy()
 
     t0 = time.time()
-    # reindex the record at each site to the model stress periods
-    dfs = []
-    for site, sitedata in monthly_data.groupby('site_no'):
-        if site not in well_info.index:
-            continue
-        sitedata.index = sitedata.datetime
-        assert not sitedata.index.duplicated().any()
-
-        if dropna:
-            site_period_data = sitedata.reindex(perioddata.start_datetime).dropna(axis=1)
-        else:
-            site_period_data = sitedata.reindex(perioddata.start_datetime, fill_value=na_fill_value)
-            isna = site_period_data['site_no'] == 0.
-            if np.any(isna):
-                if verbose:
-                    years = set(site_period_data.loc[isna, 'year'])
-                    years = ', '.join(list(years))
-                    print('Site {} has {} times with nans (in years {})- filling with {}s'.format(site,
-                                                                                    np.sum(isna),
-                                                                                    years,
-                                                                                    na_fill_value))
-            site_period_data['site_no'] = site
-            site_period_data['year'] = site_period_data.index.year
-            site_period_data['month'] = site_period_data.index.month
-            site_period_data['datetime'] = site_period_data.index
-        assert not site_period_data.isna().any().any()
-        site_period_data.index = perioddata.index
-
-        # copy stress periods and lengths from master stress period table
-        for col in ['perlen', 'per']:
-            site_period_data[col] = perioddata[col]
-
-        # convert units from monthly gallon totals to daily model length units
-        site_period_data['gal_d'] = site_period_data['gallons'] / site_period_data['perlen']
-        gal_to_model_units = convert_volume_units('gal', get_length_units(model))#model.dis.lenuni]
-        site_period_data['flux'] = site_period_data.gal_d * gal_to_model_units
-        for col in ['i', 'j', 'k']:
-            site_period_data[col] = well_info.loc[site, col]
-        site_period_data.index = [site] * len(site_period_data)
-        dfs.append(site_period_data[['k', 'i', 'j', 'flux', 'per']])
-    wel_data = pd.concat(dfs)
+    # pivot the records for all sites to a (site x stress period) array
+    # of monthly gallon totals; missing times are nans
+    monthly_data = monthly_data.loc[monthly_data.site_no.isin(well_info.index)]
+    assert not monthly_data.duplicated(subset=['site_no', 'datetime']).any()
+    gallons = monthly_data.pivot(index='site_no', columns='datetime', values='gallons')
+    gallons = gallons.reindex(columns=pd.DatetimeIndex(perioddata.start_datetime))
+    sites = gallons.index.values
+    gallons = gallons.values.astype(float)
+    isna = np.isnan(gallons)
+    if dropna:
+        keep = ~isna.ravel()
+    else:
+        keep = np.ones(gallons.size, dtype=bool)
+        gallons[isna] = na_fill_value
+        if verbose:
+            years = perioddata.start_datetime.dt.year.values
+            for site, site_isna in zip(sites[isna.any(axis=1)], isna[isna.any(axis=1)]):
+                print('Site {} has {} times with nans (in years {})- filling with {}s'.format(
+                    site, np.sum(site_isna),
+                    ', '.join(map(str, np.unique(years[site_isna]))),
+                    na_fill_value))
+
+    # convert units from monthly gallon totals to daily model length units
+    gal_to_model_units = convert_volume_units('gal', get_length_units(model))#model.dis.lenuni]
+    flux = gallons / perioddata['perlen'].values[np.newaxis, :] * gal_to_model_units
+
+    # one row per site and stress period, sorted by site, then period
+    nper = len(perioddata)
+    site_no = np.repeat(sites, nper)
+    wel_data = well_info.loc[site_no, ['k', 'i', 'j']].copy()
+    wel_data['flux'] = flux.ravel()
+    wel_data['per'] = np.tile(perioddata['per'].values, len(sites))
+    wel_data.index.name = None
+    wel_data = wel_data.loc[keep]
     # water use fluxes should be negative
     if not wel_data.flux.max() <= 0:
         wel_data.loc[wel_data.flux.abs() != 0., 'flux'] *= -1
@@ -5,7 +5,7 @@ import flopy
 from shapely.geometry import Point
 from gisutils import project
 from .fileio import check_source_files, append_csv
-from .grid import get_ij
+from .grid import get_ij, get_points_within
 from .sourcedata import TransientTabularSourceData
 from .tmr import Tmr
 from mfsetup.wateruse import get_mean_pumping_rates, resample_pumping_rates
@@ -63,9 +63,7 @@ def setup_wel_data(model):
         coords = project((parent_well_x, parent_well_y),
                           model.modelgrid.proj_str,
                           parent.modelgrid.proj_str)
-        geoms = [Point(x, y) for x, y in zip(*coords)]
-        bounds = model.modelgrid.bbox
-        within = [g.within(bounds) for g in geoms]
+        within = get_points_within(*coords, model.modelgrid.bbox)
         i, j = get_ij(model.modelgrid,
                       parent_well_x[within],
                       parent_well_y[within])
@@ -159,6 +157,7 @@ def setup_wel_data(model):
         # parent periods to copy over
         kstpkper = [(0, per) for per in model.cfg['model']['parent_stress_periods']]
         bfluxes = tmr.get_inset_boundary_fluxes(kstpkper=kstpkper)
+        tmr.close()
         bfluxes['comments'] = 'boundary_flux'
         df = df.append(bfluxes)
 
@@ -185,8 +184,7 @@ def setup_wel_data(model):
         append_csv(dropped_wells_file, dropped, index=False)  # append to existing file if it exists
     df = df.loc[~inactive].copy()
 
-    copy_fluxes_to_subsequent_periods = False
-    if copy_fluxes_to_subsequent_periods and len(df) > 0:
+    if model.cfg['wel'].get('copy_fluxes_to_subsequent_periods', False) and len(df) > 0:
         df = copy_fluxes_to_subsequent_periods(df)
 
     wel_lookup_file = model.cfg['wel']['output_files']['lookup_file'].format(model.name)
@@ -435,30 +433,59 @@ def copy_fluxes_to_subsequent_periods(df):
     fluxes to period 1. This goes against the paradigm of
     MODFLOW 6, where wells not specified in a subsequent stress period
     are shut off.
+
+    Wells are identified by their comments and k, i, j location.
+    The last specified (non-zero) fluxes for each well are carried forward
+    to the periods (up to the last specified period in df) where the well
+    isn't specified. If a well has more than one row in a period,
+    all of the rows are copied.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Well package data, with per, k, i, j, flux and comments columns.
+
+    Returns
+    -------
+    df : DataFrame
+        Input data, with the copied fluxes appended.
     """
     last_specified_per = int(df.per.max())
-    copied_fluxes = [df]
-    for i in range(last_specified_per):
-        # only copied fluxes of a given stress period once
-        # then evaluate copied fluxes (with new stress periods) and copy those once
-        # after specified per-1, all non-zero fluxes should be propegated
-        # to last stress period
-        # copy non-zero fluxes that are not already in subsequent stress periods
-        if i < len(copied_fluxes):
-            in_subsequent_periods = copied_fluxes[i].comments.duplicated(keep=False)
-            # (copied_fluxes[i].per < last_specified_per) & \
-            tocopy = (copied_fluxes[i].flux != 0) & \
-                     ~in_subsequent_periods
-            if np.any(tocopy):
-                copied = copied_fluxes[i].loc[tocopy].copy()
-
-                # make sure that wells to be copied aren't in subsequent stress periods
-                duplicated = np.array([r.comments in df.loc[df.per > i, 'comments']
-                                       for idx, r in copied.iterrows()])
-                copied = copied.loc[~duplicated]
-                copied['per'] += 1
-                copied_fluxes.append(copied)
-    df = pd.concat(copied_fluxes, axis=0)
+    nper = last_specified_per + 1
+    well_cols = [c for c in ['comments', 'k', 'i', 'j'] if c in df.columns]
+    well_ids = df.groupby(well_cols, sort=False).ngroup().values
+    nwells = well_ids.max() + 1
+
+    # group the rows in df by well and period
+    key = well_ids * nper + df.per.values.astype(int)
+    order = np.argsort(key, kind='stable')
+    group_keys, starts, counts = np.unique(key[order], return_index=True,
+                                           return_counts=True)
+    group_well, group_per = np.divmod(group_keys, nper)
+
+    # (well x period) array of row groups; -1 where a well isn't specified
+    groups = np.full((nwells, nper), -1, dtype=int)
+    groups[group_well, group_per] = np.arange(len(group_keys))
+    specified = groups >= 0
+
+    # propagate the last specified row group for each well forward in time
+    periods = np.arange(nper)
+    last_specified = np.maximum.accumulate(np.where(specified, periods, -1), axis=1)
+    source_groups = np.take_along_axis(groups, np.maximum(last_specified, 0), axis=1)
+    tocopy = ~specified & (last_specified >= 0)
+
+    # order copied fluxes by period, then well
+    per, well = np.nonzero(tocopy.T)
+    source = source_groups[well, per]
+    # expand to all of the rows in each source group
+    n = counts[source]
+    position = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    source_rows = order[np.repeat(starts[source], n) + position]
+    per = np.repeat(per, n)
+    nonzero = df.flux.values[source_rows] != 0
+    copied = df.iloc[source_rows[nonzero]].copy()
+    copied['per'] = per[nonzero]
+    df = pd.concat([df, copied], axis=0)
     return df
 
 